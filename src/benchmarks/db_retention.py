@@ -0,0 +1,109 @@
+"""
+Seeds a local Postgres with a year of synthetic weekly flyers and times the
+retention and lookup queries the scraper runs every week.
+
+Everything happens in a throwaway schema (default "bench") so the real tables
+are untouched. Connection settings come from the same DATABASE_* variables
+as the scraper.
+
+Usage (from the repository root):
+    python -m src.benchmarks.db_retention --weeks 52 --flyers-per-week 50 --products-per-flyer 300
+    python -m src.benchmarks.db_retention --without-indexes   # baseline without migration 004
+"""
+from sqlalchemy import event, text
+import argparse
+import time
+
+from src.scrapper.database import (
+    get_sql_engine_from_env,
+    delete_old_flyers_and_products,
+    get_unretrieved_flyers,
+    get_existing_flyer_ids,
+)
+from src.scrapper.migrations import apply_migrations
+
+INDEXES = ["product_flyer_id_idx", "flyer_valid_until_idx", "flyer_unretrieved_idx"]
+
+
+def seed(connection, weeks, flyers_per_week, products_per_flyer):
+    # Flyer n is valid until (weeks - n / flyers_per_week) weeks ago, the newest week is still current
+    connection.execute(text("""
+        INSERT INTO flyer (flyer_id, flyer_url, valid_until, store_chain, retrieved)
+        SELECT n,
+               'https://flipp.com/flyer/' || n,
+               NOW() + INTERVAL '3 days' - (n / :flyers_per_week) * INTERVAL '1 week',
+               'Chain ' || (n % 20),
+               n >= :flyers_per_week
+        FROM generate_series(0, :flyers - 1) AS n
+    """), {"flyers_per_week": flyers_per_week, "flyers": weeks * flyers_per_week})
+    connection.execute(text("""
+        INSERT INTO product (product_id, product_name, price, url, unit, flyer_id, image_url)
+        SELECT n,
+               'Product ' || (n % 5000),
+               ((n % 2000) / 100.0 + 0.99),
+               'https://flipp.com/item/' || n,
+               'each',
+               n / :products_per_flyer,
+               NULL
+        FROM generate_series(0, :products - 1) AS n
+    """), {"products_per_flyer": products_per_flyer, "products": weeks * flyers_per_week * products_per_flyer})
+    connection.execute(text("ANALYZE flyer"))
+    connection.execute(text("ANALYZE product"))
+
+
+def timed(label, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label:<40} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--schema", default="bench")
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--flyers-per-week", type=int, default=50)
+    parser.add_argument("--products-per-flyer", type=int, default=300)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+
+    admin_engine = get_sql_engine_from_env()
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {args.schema}"))
+    admin_engine.dispose()
+
+    engine = get_sql_engine_from_env(statement_timeout_ms=600000)
+
+    @event.listens_for(engine, "connect")
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET search_path TO {args.schema}")
+        cursor.close()
+
+    apply_migrations(engine)
+    if args.without_indexes:
+        with engine.begin() as connection:
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    products = args.weeks * args.flyers_per_week * args.products_per_flyer
+    print(f"Seeding {args.weeks * args.flyers_per_week} flyers and {products} products...")
+    with engine.begin() as connection:
+        timed("seed", seed, connection, args.weeks, args.flyers_per_week, args.products_per_flyer)
+
+    listed_ids = list(range(0, args.flyers_per_week * 2))
+    timed("get_existing_flyer_ids (100 ids)", get_existing_flyer_ids, listed_ids, table="flyer", engine=engine)
+    timed("get_unretrieved_flyers", get_unretrieved_flyers, table="flyer", engine=engine)
+    timed("delete_old_flyers_and_products", delete_old_flyers_and_products, flyer_table="flyer", engine=engine)
+
+    with engine.connect() as connection:
+        remaining = connection.execute(text("SELECT COUNT(*) FROM product")).scalar()
+    print(f"{remaining} products left after cleanup")
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
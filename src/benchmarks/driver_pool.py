@@ -0,0 +1,76 @@
+"""
+Compare item throughput of one Chrome session per item against the pooled drivers.
+
+Usage (from the repository root):
+    python -m src.benchmarks.driver_pool --flyer-url <flipp flyer url> --items 40 --workers 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import time
+
+from src.scrapper.driver_pool import DriverPool
+from src.scrapper.flyer_pages import parse_flyer_page
+from src.scrapper.flyer_scrapper import (
+    setup_chrome_driver,
+    extract_item_details,
+    get_item_url,
+)
+
+
+def scrape(driver, product_id):
+    extract_item_details(driver, get_item_url(product_id))
+
+
+def per_item_driver(product_id):
+    driver = setup_chrome_driver()
+    try:
+        scrape(driver, product_id)
+    finally:
+        driver.quit()
+
+
+def run(product_ids, workers, fn):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fn, product_ids))
+    elapsed = time.perf_counter() - start
+    return len(product_ids) / elapsed, elapsed
+
+
+def list_item_ids(flyer_url, limit):
+    driver = setup_chrome_driver()
+    try:
+        driver.get(flyer_url)
+        time.sleep(5)
+        items = parse_flyer_page(None, driver.page_source).items
+    finally:
+        driver.quit()
+    return [item.get("itemid") for item in items if item.get("itemid")][:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flyer-url", required=True)
+    parser.add_argument("--items", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    product_ids = list_item_ids(args.flyer_url, args.items)
+    print(f"Benchmarking {len(product_ids)} items with {args.workers} workers")
+
+    baseline_rate, baseline_time = run(product_ids, args.workers, per_item_driver)
+    print(f"per-item driver: {baseline_rate:.2f} items/sec ({baseline_time:.1f}s)")
+
+    with DriverPool(setup_chrome_driver, size=args.workers) as pool:
+        def pooled(product_id):
+            with pool.driver() as driver:
+                scrape(driver, product_id)
+
+        pooled_rate, pooled_time = run(product_ids, args.workers, pooled)
+        print(f"driver pool:     {pooled_rate:.2f} items/sec ({pooled_time:.1f}s), stats: {pool.stats}")
+
+    print(f"speedup: {pooled_rate / baseline_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Times parsing of saved flyer page sources. It compares the whole-page
+html.parser soup the scraper used to build with lxml selecting only the tags
+the scraper reads. It also times the round trip through the parse process pool.
+
+Pages come from the page dumps in src/notes.txt, plus any --pages files and
+any --corpus (recorded with src/scrapper/replay.py). The notes dumps were
+taken before the items rendered, so --items adds that many item tiles to
+every page.
+
+Usage (from the repository root):
+    python -m src.benchmarks.page_parsing --items 150 --repeat 20
+    python -m src.benchmarks.page_parsing --corpus fixtures/flipp --items 0 --workers 2
+"""
+from bs4 import BeautifulSoup
+import importlib.util
+import statistics
+import argparse
+import random
+import time
+import re
+
+from src.scrapper import flyer_pages
+from src.scrapper.flyer_pages import FlyerPage, create_parse_executor, parse_end_date, parse_flyer_page
+from src.scrapper.replay import Corpus
+
+PAGE_DUMP = re.compile(r"<html.*?</html>", re.S)
+NAMES = ["Poitrine de poulet", "Pommes Gala", "Lait 2%", "Fromage cheddar", "Pain tranché", "Saumon atlantique"]
+
+
+def load_pages(paths, corpus_path=None):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        pages.extend(PAGE_DUMP.findall(text) or [text])
+    if corpus_path:
+        corpus = Corpus(corpus_path)
+        pages.extend(
+            corpus.read(entry).decode("utf-8") for key, entry in sorted(corpus.entries.items())
+            if entry["content_type"].startswith("text/html") and "/flyer/" in key
+        )
+    return pages
+
+
+def add_items(page, count, rng):
+    """The page with a rendered flyer's validity, store name and `count` item tiles before </body>."""
+    tiles = "".join(
+        f'<a class="item-container" itemid="{900000 + i}" aria-label="{rng.choice(NAMES)}" tabindex="0">'
+        f'<div class="item-image"><img src="https://f.wishabi.net/page_items/{900000 + i}/1.jpg" alt=""></div></a>'
+        for i in range(count)
+    )
+    flyer = ('<span class="validity">Valid Aug 29, 2024 – Sep 4, 2024</span>'
+             '<span class="subtitle">Maxi</span>' if count else "")
+    return page.replace("</body>", flyer + tiles + "</body>", 1)
+
+
+def parse_whole_page(flyer_id, page_source, parser="html.parser"):
+    """How the scraper parsed a flyer page before: a soup of the whole page."""
+    soup = BeautifulSoup(page_source, parser)
+
+    validity_element = soup.find("span", class_="validity")
+    end_date = parse_end_date(validity_element.get_text(strip=True)) if validity_element else None
+
+    subtitle_element = soup.find("span", class_="subtitle")
+    store_chain = subtitle_element.get_text(strip=True) if subtitle_element else "Unknown Store"
+
+    items = [
+        {"itemid": item.get("itemid"), "aria-label": item.get("aria-label")}
+        for item in soup.find_all("a", class_="item-container")
+    ]
+    return FlyerPage(flyer_id, end_date, store_chain, items)
+
+
+def parse_targets(parser):
+    def parse(flyer_id, page_source):
+        flyer_pages.HTML_PARSER = parser
+        return parse_flyer_page(flyer_id, page_source)
+    return parse
+
+
+def same_page(a, b):
+    return (a.end_date, a.store_chain, a.items) == (b.end_date, b.store_chain, b.items)
+
+
+def time_variant(parse, pages, repeat):
+    """Seconds per page parse, over `repeat` passes through the pages."""
+    timings = []
+    for _ in range(repeat):
+        for page in pages:
+            start = time.perf_counter()
+            parse(0, page)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", nargs="*", default=["src/notes.txt"], help="Files with saved page sources")
+    parser.add_argument("--corpus", default=None, help="Recorded corpus directory, its flyer pages are added")
+    parser.add_argument("--items", type=int, default=150, help="Item tiles added to every page")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2, help="Parse pool processes")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = [add_items(page, args.items, rng) for page in load_pages(args.pages, args.corpus)]
+    if not pages:
+        parser.error("no saved pages found")
+    size = sum(len(page) for page in pages) / len(pages)
+    print(f"{len(pages)} pages, {size / 1024:.0f} KB on average, {args.repeat} passes")
+
+    variants = {"html.parser, whole page (before)": parse_whole_page,
+                "html.parser, targets only": parse_targets("html.parser")}
+    if importlib.util.find_spec("lxml"):
+        variants["lxml, whole page"] = lambda flyer_id, page: parse_whole_page(flyer_id, page, "lxml")
+        variants["lxml, targets only (after)"] = parse_targets("lxml")
+    else:
+        print("lxml is not installed, only html.parser is timed")
+    default_parser = flyer_pages.HTML_PARSER
+
+    expected = [parse_whole_page(0, page) for page in pages]
+    baseline = None
+    for name, parse in variants.items():
+        mismatches = sum(1 for page, want in zip(pages, expected) if not same_page(parse(0, page), want))
+        timings = time_variant(parse, pages, args.repeat)
+        mean = statistics.mean(timings)
+        baseline = baseline or mean
+        print(f"  {name:<34} mean {mean * 1000:7.2f} ms  p50 {statistics.median(timings) * 1000:7.2f} ms"
+              f"  {size / mean / 1e6:6.1f} MB/s  {baseline / mean:5.1f}x"
+              + (f"  {mismatches} pages differ" if mismatches else ""))
+
+    flyer_pages.HTML_PARSER = default_parser
+    executor = create_parse_executor(args.workers)
+    if executor is None:
+        return
+    with executor:
+        # Warm the workers up, spawning them isn't part of a page's parse
+        list(executor.map(parse_flyer_page, range(args.workers), pages[:1] * args.workers))
+        flyer_pages.set_parse_executor(executor)
+        timings = time_variant(lambda flyer_id, page: flyer_pages.parse_page(parse_flyer_page, flyer_id, page),
+                               pages, args.repeat)
+        flyer_pages.set_parse_executor(None)
+        print(f"  {default_parser + ', targets only, parse pool':<34} mean {statistics.mean(timings) * 1000:7.2f} ms"
+              f"  p50 {statistics.median(timings) * 1000:7.2f} ms  (round trip to one of {args.workers} processes)")
+
+        start = time.perf_counter()
+        list(executor.map(parse_flyer_page, range(len(pages) * args.repeat), pages * args.repeat))
+        elapsed = time.perf_counter() - start
+        print(f"  parse pool throughput {len(pages) * args.repeat / elapsed:.1f} pages/s with {args.workers} processes")
+
+
+if __name__ == "__main__":
+    main()
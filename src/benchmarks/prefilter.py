@@ -0,0 +1,117 @@
+"""
+Scores labelled images with the vision prefilter and reports the share of
+vision calls it would skip, the banners it catches and the items it loses.
+
+The labelled set is the examples of src/scrapper/testing_script.py (three
+items, the walmart, Keurig and La Moisson banners) plus the item crops at the
+repository root. Examples that can't be downloaded are left out, unless
+--stand-ins is given: the banners are then replaced by renders of the same
+shape (a wide blue strip, a wide logo on white, a whole page of item tiles).
+Those renders only check the weights against the shapes they target.
+
+Usage (from the repository root):
+    python -m src.benchmarks.prefilter
+    python -m src.benchmarks.prefilter --stand-ins --threshold 0.8 --model .cache/prefilter_model.json
+"""
+from PIL import Image, ImageDraw, ImageFont
+import argparse
+import tempfile
+import os
+
+from src.scrapper.image_filter import DEFAULT_MODEL, PREFILTER_THRESHOLD, image_features, load_model, not_item_probability
+from src.scrapper.image_store import ImageFetchError, ImageStore
+
+ITEM_URLS = {
+    "rice": "https://f.wishabi.net/page_items/348585475/1724923926/extra_large.jpg",
+    "vermicelli": "https://f.wishabi.net/page_items/348585476/1724923927/extra_large.jpg",
+    "honey": "https://f.wishabi.net/page_items/348585477/1724923928/extra_large.jpg",
+}
+BANNER_URLS = {
+    "walmart banner": "https://f.wishabi.net/page_items/347689291/1724687488/extra_large.jpg",
+    "Keurig banner": "https://f.wishabi.net/page_pdf_images/19175647/80dc6dba-655b-11ef-bb3f-0edc53c25ee6/x_large",
+    "La Moisson banner": "https://f.wishabi.net/page_items/346370785/1723519477/extra_large.jpg",
+}
+ITEM_FILES = ["test_image.jpg", "test_image_2.jpg", "test_image_3.jpg"]
+
+
+def render_stand_ins(directory):
+    """{name: path} of renders shaped like the testing_script banners."""
+    font = ImageFont.load_default
+    items = [Image.open(path).convert("RGB") for path in ITEM_FILES if os.path.exists(path)]
+    renders = {}
+
+    strip = Image.new("RGB", (1200, 300), (0, 113, 206))
+    draw = ImageDraw.Draw(strip)
+    draw.text((60, 80), "Walmart", font=font(size=110), fill="white")
+    draw.text((620, 120), "Save money. Live better.", font=font(size=44), fill=(255, 194, 32))
+    renders["walmart banner"] = strip
+
+    logo = Image.new("RGB", (1000, 260), "white")
+    draw = ImageDraw.Draw(logo)
+    draw.text((80, 60), "La Moisson", font=font(size=120), fill=(0, 90, 40))
+    draw.text((80, 200), "Marché d'alimentation", font=font(size=36), fill=(120, 120, 120))
+    renders["La Moisson banner"] = logo
+
+    if items:
+        page = Image.new("RGB", (1600, 2200), "white")
+        for i in range(20):
+            page.paste(items[i % len(items)].resize((380, 400)), (20 + i % 4 * 395, 40 + i // 4 * 430))
+        renders["Keurig banner"] = page
+
+    paths = {}
+    for name, image in renders.items():
+        paths[name] = os.path.join(directory, name.replace(" ", "_") + ".jpg")
+        image.save(paths[name], quality=90)
+    return paths
+
+
+def labelled_images(store, stand_ins):
+    """[(name, is_item, path)] of every example that could be read."""
+    images = [(path, True, path) for path in ITEM_FILES if os.path.exists(path)]
+    missing_banners = []
+    for urls, is_item in ((ITEM_URLS, True), (BANNER_URLS, False)):
+        for name, url in urls.items():
+            try:
+                images.append((name, is_item, store.get(url).path))
+            except ImageFetchError as e:
+                print(f"Skipping {name}: {e}")
+                if not is_item:
+                    missing_banners.append(name)
+    if stand_ins and missing_banners:
+        renders = render_stand_ins(store.cache_dir)
+        images.extend((f"{name} (stand-in)", False, renders[name]) for name in missing_banners if name in renders)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threshold", type=float, default=PREFILTER_THRESHOLD)
+    parser.add_argument("--model", default=None, help="Fitted model file, the built-in weights by default")
+    parser.add_argument("--stand-ins", action="store_true", help="Render banners that can't be downloaded")
+    args = parser.parse_args()
+
+    model = load_model(args.model) if args.model else DEFAULT_MODEL
+    store = ImageStore(cache_dir=tempfile.mkdtemp(prefix="flipp_prefilter_"), retries=0, timeout=(5, 10))
+    images = labelled_images(store, args.stand_ins)
+    if not images:
+        parser.error("no labelled images could be read")
+
+    rejected_items = rejected_banners = 0
+    for name, is_item, path in images:
+        probability = not_item_probability(image_features(path), model)
+        reject = probability >= args.threshold
+        rejected_items += reject and is_item
+        rejected_banners += reject and not is_item
+        print(f"  {name:<28} {'item' if is_item else 'not item':<9} p(not item) {probability:5.3f}"
+              f"  {'rejected' if reject else 'sent to the model'}")
+
+    items = sum(1 for _, is_item, _ in images if is_item)
+    banners = len(images) - items
+    print(f"{len(images)} images at threshold {args.threshold}: {rejected_banners}/{banners} non-items rejected, "
+          f"{rejected_items}/{items} items lost, "
+          f"{(rejected_items + rejected_banners) / len(images):.0%} of vision calls skipped")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Builds the product matching index over synthetic flyer product names and
+times ranked lookups of shopping list terms, some of them misspelled.
+
+Usage (from the repository root):
+    python -m src.benchmarks.product_index --products 100000 --queries 2000
+"""
+import argparse
+import random
+import time
+
+from src.route.product_index import ProductIndex
+
+FOODS = [
+    "chicken", "beef", "pork", "salmon", "tuna", "shrimp", "turkey", "ham", "bacon", "sausage",
+    "apple", "banana", "orange", "grape", "strawberry", "blueberry", "mango", "pineapple", "lemon", "lime",
+    "potato", "tomato", "onion", "carrot", "broccoli", "lettuce", "spinach", "pepper", "cucumber", "mushroom",
+    "milk", "cheese", "yogurt", "butter", "cream", "egg", "bread", "bagel", "muffin", "croissant",
+    "rice", "pasta", "cereal", "oatmeal", "flour", "sugar", "coffee", "tea", "juice", "water",
+    "chip", "cracker", "cookie", "chocolate", "candy", "soup", "sauce", "ketchup", "mustard", "mayonnaise",
+]
+CUTS = [
+    "breast", "thigh", "wing", "drumstick", "ground", "steak", "roast", "fillet", "loin", "rib",
+    "sliced", "shredded", "whole", "half", "mini", "large", "small", "family", "value", "bulk",
+]
+DESCRIPTORS = [
+    "boneless", "skinless", "organic", "fresh", "frozen", "smoked", "spicy", "sweet", "salted", "unsalted",
+    "lean", "extra", "light", "classic", "original", "natural", "free", "range", "grass", "fed",
+    "red", "green", "yellow", "white", "whole", "wheat", "gluten", "low", "fat", "sodium",
+]
+BRANDS = [f"brand{i}" for i in range(300)]
+UNITS = ["/lb", "each", "2 units", "1 kg", "500 g", "/100 g", "1 l", "2 lbs", "each", "each"]
+
+
+def make_name(rng):
+    words = [rng.choice(FOODS)]
+    words += rng.sample(CUTS, rng.randint(0, 2))
+    words += rng.sample(DESCRIPTORS, rng.randint(0, 3))
+    if rng.random() < 0.6:
+        words.append(rng.choice(BRANDS))
+    rng.shuffle(words)
+    return " ".join(word.capitalize() for word in words)
+
+
+def make_products(count, rng, flyer_size=1000):
+    return [
+        {
+            "product_id": i,
+            "product_name": make_name(rng),
+            "price": round(rng.uniform(0.5, 30.0), 2),
+            "unit": rng.choice(UNITS),
+            "flyer_id": i // flyer_size,
+            "store_chain": f"Chain {i // flyer_size % 40}",
+        }
+        for i in range(count)
+    ]
+
+
+def misspell(word, rng):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def make_query(rng, typo_rate):
+    words = [rng.choice(FOODS)] + rng.sample(CUTS + DESCRIPTORS, rng.randint(0, 2))
+    return " ".join(misspell(word, rng) if rng.random() < typo_rate else word for word in words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--typo-rate", type=float, default=0.2)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    products = make_products(args.products, rng)
+
+    index = ProductIndex()
+    start = time.perf_counter()
+    index.add(products)
+    build = time.perf_counter() - start
+    print(f"Built index of {index.summary()} in {build:.2f}s")
+
+    # A newly scraped flyer replacing an old one, as refresh() does
+    start = time.perf_counter()
+    index.remove_flyer(0)
+    index.add(products[:1000])
+    print(f"Replaced one 1000 product flyer in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    queries = [make_query(rng, args.typo_rate) for _ in range(args.queries)]
+    timings = []
+    matched = 0
+    for query in queries:
+        unit = rng.choice([None, None, "kg", "each"])
+        start = time.perf_counter()
+        matches = index.lookup(query, limit=args.limit, unit=unit)
+        timings.append(time.perf_counter() - start)
+        matched += bool(matches)
+
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(int(p * len(timings)), len(timings) - 1)] * 1000
+
+    print(f"{len(queries)} lookups, {matched / len(queries):.0%} with matches")
+    print(f"  p50 {percentile(0.5):.2f} ms, p95 {percentile(0.95):.2f} ms, "
+          f"p99 {percentile(0.99):.2f} ms, max {timings[-1] * 1000:.2f} ms")
+
+    for query in queries[:3]:
+        print(f"  {query!r}: {[m.product.name for m in index.lookup(query, limit=3)]}")
+
+
+if __name__ == "__main__":
+    main()
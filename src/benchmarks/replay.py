@@ -0,0 +1,236 @@
+"""
+Runs the whole scraper offline against a replayed corpus (see
+src/scrapper/replay.py) for each fetcher backend, and reports items/sec,
+per-stage latency and database write throughput. Every run is appended to
+--results and compared with the previous run of the same backend and corpus.
+
+Vision, storage and translation use the in-memory fakes and the offline
+translator. Products go to a throwaway schema (default "bench_replay") of the
+database in the DATABASE_* variables. The selenium backend needs Chrome.
+
+Usage (from the repository root):
+    python -m src.benchmarks.replay --synthetic --flyers 4 --items 100 --backends http selenium
+    python -m src.benchmarks.replay --corpus fixtures/flipp --backends http --latency 0.05
+"""
+from sqlalchemy import text
+import argparse
+import datetime
+import random
+import tempfile
+import json
+import time
+import os
+
+from src.scrapper import flyer_scrapper, locations, vertexai
+from src.scrapper.database import get_sql_engine_from_env
+from src.scrapper.driver_pool import DriverPool
+from src.scrapper.fakes import FakeStorageClient, MockVisionModel
+from src.scrapper.fetchers import get_fetcher
+from src.scrapper.image_store import ImageStore, set_image_store
+from src.scrapper.locations import site_path
+from src.scrapper.migrations import apply_migrations
+from src.scrapper.rate_limiter import RegionScheduler
+from src.scrapper.replay import API_PREFIX, IMAGE_PREFIX, REPLAY_BASE, Corpus, ReplayServer, request_key, vision_responses
+from src.scrapper.translation import create_translation_service, set_translation_service
+
+NAMES = ["Poitrine de poulet", "Pommes Gala", "Lait 2%", "Fromage cheddar", "Pain tranché", "Saumon atlantique",
+         "Bananes", "Yogourt grec", "Café moulu", "Tomates en grappe", "Beurre salé", "Oeufs gros"]
+UNITS = ["/lb", "ea.", "", "/100 g", "/kg"]
+# product.product_id is an INT, synthetic item ids stay below 2^31
+ITEM_ID_BASE = 900000000
+
+
+def build_synthetic_corpus(path, location, flyers, items_per_flyer, image_only_rate, seed=0):
+    """A corpus shaped like a recording: API responses, rendered pages and images for the selenium backend too."""
+    rng = random.Random(seed)
+    corpus = Corpus(path)
+    params = {"locale": location.locale, "postal_code": location.postal_code}
+    site = site_path(location)
+    today = datetime.date.today()
+    valid_to = today + datetime.timedelta(days=5)
+    # Same text as a flyer page's span.validity
+    valid_text = f"Valid {today:%b} {today.day}, {today.year} – {valid_to:%b} {valid_to.day}, {valid_to.year}"
+
+    flyer_ids = [9000000 + i for i in range(flyers)]
+    corpus.put(request_key(API_PREFIX + "/data", params), json.dumps({"flyers": [
+        {"id": flyer_id, "merchant": f"Chain {i}", "valid_to": valid_to.isoformat(), "categories": ["Groceries"]}
+        for i, flyer_id in enumerate(flyer_ids)
+    ]}), "application/json")
+    corpus.put(request_key(f"{site}/flyers/groceries", {"postal_code": location.postal_code}), "<html><body>" + "".join(
+        f'<flipp-flyer-listing-item flyer-id="{flyer_id}"></flipp-flyer-listing-item>' for flyer_id in flyer_ids
+    ) + "</body></html>", "text/html")
+
+    for i, flyer_id in enumerate(flyer_ids):
+        items = [(str(ITEM_ID_BASE + i * items_per_flyer + j), rng.choice(NAMES)) for j in range(items_per_flyer)]
+        corpus.put(request_key(f"{API_PREFIX}/flyers/{flyer_id}", params), json.dumps({
+            "items": [{"id": item_id, "name": name} for item_id, name in items]
+        }), "application/json")
+        corpus.put(request_key(f"{site}/flyer/{flyer_id}", {"postal_code": location.postal_code}), (
+            f'<html><body><span class="validity">{valid_text}</span><span class="subtitle">Chain {i}</span>'
+            + "".join(f'<a class="item-container" itemid="{item_id}" aria-label="{name}"></a>' for item_id, name in items)
+            + "</body></html>"
+        ), "text/html")
+
+        for item_id, name in items:
+            image_path = f"{IMAGE_PREFIX}{item_id}.jpg"
+            corpus.put(image_path, rng.randbytes(2048), "image/jpeg")
+            image_url = REPLAY_BASE + image_path
+            image_only = rng.random() < image_only_rate
+            price = None if image_only else round(rng.uniform(0.99, 19.99), 2)
+            unit = rng.choice(UNITS)
+            if image_only:
+                corpus.meta["vision"][image_path] = {
+                    "is_item": True, "name": name, "price": round(rng.uniform(0.99, 19.99), 2), "unit": "each"
+                }
+            corpus.put(request_key(f"{API_PREFIX}/items/{item_id}", params), json.dumps({"item": {
+                "id": item_id, "name": name, "current_price": price, "cutout_image_url": image_url,
+                "post_price_text": unit, "pre_price_text": "",
+            }}), "application/json")
+            corpus.put(request_key(f"{site}/item/{item_id}", {"postal_code": location.postal_code}), (
+                f'<html><head><meta property="og:title" content="{name}"></head><body>'
+                f'<div class="item-info-image"><img src="{image_url}"></div>'
+                + (f'<flipp-price value="{price}"></flipp-price><span class="price-text">{unit or "ea."}</span>'
+                   if price is not None else "")
+                + "</body></html>"
+            ), "text/html")
+
+    corpus.meta["locations"].append(f"{location.postal_code}:{location.city_slug}:{location.locale}")
+    corpus.save()
+    return corpus
+
+
+def reset_schema(schema):
+    admin_engine = get_sql_engine_from_env()
+    with admin_engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    admin_engine.dispose()
+
+
+def run_backend(backend, server, corpus, schema, args):
+    reset_schema(schema)
+    flyer_scrapper.configure_database(pool_size=args.max_workers + 4)
+    apply_migrations(flyer_scrapper.get_engine())
+
+    model = MockVisionModel(vision_responses(corpus, server.base_url), latency=args.vision_latency)
+    vertexai.use_storage_client(FakeStorageClient())
+    vertexai.use_mock_model(model)
+    vertexai.scheduler = RegionScheduler(vertexai.regions, calls_per_minute=6000)
+    set_image_store(ImageStore(cache_dir=tempfile.mkdtemp(prefix="flipp_images_")))
+
+    fetcher = get_fetcher(backend, api_base=server.api_base, pool_size=args.max_workers)
+    pool = DriverPool(flyer_scrapper.setup_chrome_driver, size=args.max_workers)
+    # The http backend gets everything from the API, only selenium needs the main driver
+    driver = flyer_scrapper.setup_chrome_driver() if backend == "selenium" else None
+    location_list = [locations.parse_location(value) for value in corpus.meta["locations"]]
+
+    start = time.perf_counter()
+    try:
+        with pool, vertexai.create_vision_executor(args.vision_workers) as vision_executor:
+            stages = flyer_scrapper.run_pipeline(
+                driver, location_list, pool, max_workers=args.max_workers, fetcher=fetcher,
+                vision_executor=vision_executor, report_interval=0
+            )
+    finally:
+        if driver is not None:
+            driver.quit()
+        if fetcher:
+            fetcher.close()
+    elapsed = time.perf_counter() - start
+
+    writer = flyer_scrapper.get_product_writer().summary()
+    flush_seconds = writer["avg_flush_seconds"] * writer["flushes"]
+    return {
+        "backend": backend,
+        "items": writer["rows_written"],
+        "elapsed_seconds": elapsed,
+        "items_per_second": writer["rows_written"] / elapsed,
+        "db_rows_per_second": writer["rows_written"] / flush_seconds if flush_seconds else 0.0,
+        "stages": {
+            name: {key: stage[key] for key in ("per_second", "p50_seconds", "p95_seconds", "failed")}
+            for name, stage in stages.items()
+        },
+        "vision_calls": len(model.calls),
+        "replay": dict(server.stats),
+    }
+
+
+def previous_result(results_path, backend, corpus_path):
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["backend"] == backend and result["corpus"] == corpus_path:
+                previous = result
+    return previous
+
+
+def print_result(result, previous):
+    def change(key):
+        if not previous or not previous[key]:
+            return ""
+        return f" ({(result[key] / previous[key] - 1) * 100:+.1f}% vs {previous['timestamp']})"
+
+    print(f"\n{result['backend']}: {result['items']} items in {result['elapsed_seconds']:.2f}s")
+    print(f"  items/sec      {result['items_per_second']:10.1f}{change('items_per_second')}")
+    print(f"  db rows/sec    {result['db_rows_per_second']:10.1f}{change('db_rows_per_second')}")
+    for name, stage in result["stages"].items():
+        print(f"  {name:<10} p50 {stage['p50_seconds'] * 1000:8.1f} ms  p95 {stage['p95_seconds'] * 1000:8.1f} ms"
+              f"  {stage['per_second']:8.1f}/s" + (f"  {stage['failed']} failed" if stage["failed"] else ""))
+    print(f"  replay {result['replay']}, vision calls {result['vision_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=None, help="Recorded corpus directory")
+    parser.add_argument("--synthetic", action="store_true", help="Generate a corpus instead of a recorded one")
+    parser.add_argument("--flyers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=100, help="Items per synthetic flyer")
+    parser.add_argument("--image-only-rate", type=float, default=0.1)
+    parser.add_argument("--backends", nargs="+", choices=["http", "selenium"], default=["http"])
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--vision-workers", type=int, default=16)
+    parser.add_argument("--vision-latency", type=float, default=0.2, help="Simulated model latency in seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the replay server adds to every response")
+    parser.add_argument("--schema", default="bench_replay")
+    parser.add_argument("--results", default=os.path.join(".cache", "replay_benchmark.jsonl"))
+    args = parser.parse_args()
+
+    if args.synthetic:
+        corpus_path = args.corpus or tempfile.mkdtemp(prefix="flipp_corpus_")
+        corpus = build_synthetic_corpus(corpus_path, locations.DEFAULT_LOCATION, args.flyers, args.items,
+                                        args.image_only_rate)
+        corpus_label = f"synthetic:{args.flyers}x{args.items}"
+    elif args.corpus:
+        corpus = Corpus(args.corpus)
+        corpus_label = args.corpus
+    else:
+        parser.error("--corpus or --synthetic is required")
+
+    if args.schema.lower() in ("public", ""):
+        parser.error("--schema must be a throwaway schema, it is dropped after the run")
+    # Every engine the scraper builds from here on opens its connections in the benchmark schema
+    os.environ["DATABASE_SEARCH_PATH"] = args.schema
+
+    translation_cache = os.path.join(tempfile.mkdtemp(), "translations.sqlite3")
+    set_translation_service(create_translation_service("offline", cache_path=translation_cache))
+    os.makedirs(os.path.dirname(args.results) or ".", exist_ok=True)
+
+    with ReplayServer(corpus, latency=args.latency) as server:
+        locations.FLIPP_SITE = server.site_url
+        for backend in args.backends:
+            server.stats.update(hits=0, misses=0, bytes=0)
+            result = run_backend(backend, server, corpus, args.schema, args)
+            result.update(timestamp=datetime.datetime.now().isoformat(timespec="seconds"), corpus=corpus_label)
+            print_result(result, previous_result(args.results, backend, corpus_label))
+            with open(args.results, "a") as f:
+                f.write(json.dumps(result) + "\n")
+
+    with get_sql_engine_from_env().begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Times the shopping-list optimizer on synthetic city layouts.
+
+Usage (from the repository root):
+    python -m src.benchmarks.route --stores 30 --items 50 --runs 20 --layout clustered
+"""
+import argparse
+import random
+import statistics
+import time
+
+from src.route.distance import DistanceMatrix
+from src.route.optimizer import optimize_route
+
+LAYOUTS = ["grid", "clustered", "random"]
+
+
+def make_layout(layout, stores, rng, size_km=20.0):
+    """Returns {location: (x, y)} in km for "home" and each store."""
+    points = {"home": (size_km / 2, size_km / 2)}
+    if layout == "grid":
+        side = int(stores ** 0.5) + 1
+        step = size_km / side
+        for i in range(stores):
+            points[f"s{i}"] = ((i % side + 0.5) * step, (i // side + 0.5) * step)
+    elif layout == "clustered":
+        centres = [(rng.uniform(0, size_km), rng.uniform(0, size_km)) for _ in range(4)]
+        for i in range(stores):
+            cx, cy = rng.choice(centres)
+            points[f"s{i}"] = (rng.gauss(cx, 1.0), rng.gauss(cy, 1.0))
+    else:
+        for i in range(stores):
+            points[f"s{i}"] = (rng.uniform(0, size_km), rng.uniform(0, size_km))
+    return points
+
+
+def make_matrix(points, detour_factor=1.3):
+    locations = list(points)
+    distances = [
+        [((points[a][0] - points[b][0]) ** 2 + (points[a][1] - points[b][1]) ** 2) ** 0.5 * detour_factor
+         for b in locations]
+        for a in locations
+    ]
+    return DistanceMatrix(locations, distances)
+
+
+def make_prices(stores, items, rng, coverage=0.7):
+    """Each store carries most items around a base price, with a per-store price level."""
+    base = {item: rng.uniform(1.0, 15.0) for item in items}
+    prices = {}
+    for i in range(stores):
+        level = rng.uniform(0.85, 1.15)
+        prices[f"s{i}"] = {
+            item: round(base[item] * level * rng.uniform(0.8, 1.2), 2)
+            for item in items if rng.random() < coverage
+        }
+    return prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stores", type=int, default=30)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--layout", choices=LAYOUTS + ["all"], default="all")
+    parser.add_argument("--cost-per-km", type=float, default=0.5)
+    parser.add_argument("--max-stores", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    items = [f"item {i}" for i in range(args.items)]
+    layouts = LAYOUTS if args.layout == "all" else [args.layout]
+
+    for layout in layouts:
+        timings = []
+        plans = []
+        for _ in range(args.runs):
+            matrix = make_matrix(make_layout(layout, args.stores, rng))
+            store_prices = make_prices(args.stores, items, rng)
+            start = time.perf_counter()
+            plan = optimize_route(items, store_prices, matrix, "home",
+                                  cost_per_km=args.cost_per_km, max_stores=args.max_stores)
+            timings.append(time.perf_counter() - start)
+            plans.append(plan)
+
+        timings.sort()
+        print(f"{layout}: {args.stores} stores, {args.items} items, {args.runs} runs")
+        print(f"  time p50 {statistics.median(timings) * 1000:.1f} ms, "
+              f"max {timings[-1] * 1000:.1f} ms")
+        print(f"  stores visited avg {statistics.mean(len(p.stores) for p in plans):.1f}, "
+              f"total cost avg {statistics.mean(p.total_cost for p in plans):.2f}")
+
+
+if __name__ == "__main__":
+    main()
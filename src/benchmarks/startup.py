@@ -0,0 +1,117 @@
+"""
+Measures what a scraper run pays before doing any work. Each measurement
+runs in a fresh interpreter, so nothing is already imported or cached:
+- the import time of the scraper modules (and of the Vertex SDK they now defer)
+- the latency of the first and the second call to the lazily created clients
+- the wall time of a --dry-run against a local replay server
+
+Clients that need credentials (storage, the model) report their error
+instead of a time when there are none.
+
+Usage (from the repository root):
+    python -m src.benchmarks.startup --repeat 5
+"""
+import subprocess
+import statistics
+import argparse
+import tempfile
+import json
+import sys
+import os
+
+from src.scrapper import locations
+from src.scrapper.replay import ReplayServer
+
+MODULES = ["src.scrapper.flyer_scrapper", "src.scrapper.vertexai", "src.scrapper.database",
+           "vertexai.generative_models", "google.cloud.storage"]
+
+# name: (setup, call) run in the fresh interpreter, only the call is timed
+FIRST_CALLS = {
+    "engine": ("from src.scrapper.flyer_scrapper import get_engine", "get_engine()"),
+    "storage client": ("from src.scrapper.vertexai import get_storage_client", "get_storage_client()"),
+    "model (one region)": ("from src.scrapper.vertexai import get_model, regions", "get_model(regions[0])"),
+    "generation config": ("from src.scrapper.vertexai import get_item_generation_config",
+                          "get_item_generation_config()"),
+}
+
+TIMER = """
+import json, time
+{setup}
+timings = []
+try:
+    for _ in range(2):
+        start = time.perf_counter()
+        {call}
+        timings.append(time.perf_counter() - start)
+except Exception as e:
+    print(json.dumps({{"error": f"{{type(e).__name__}}: {{str(e).splitlines()[0]}}"[:100]}}))
+else:
+    print(json.dumps({{"timings": timings}}))
+"""
+
+
+def run_python(code, env=None):
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_seconds(module):
+    return run_python(TIMER.format(setup="", call=f"import {module}"))
+
+
+def process_seconds(args, env=None):
+    """Wall time of a Python process from start to exit."""
+    return run_python(f"""
+import json, subprocess, sys, time
+start = time.perf_counter()
+subprocess.run([sys.executable, *{args!r}], check=True, stdout=subprocess.DEVNULL)
+print(json.dumps({{"timings": [time.perf_counter() - start]}}))
+""", env=env)
+
+
+def median_of(results, index=0):
+    timings = [result["timings"][index] for result in results if "timings" in result]
+    if not timings:
+        return None
+    return f"{statistics.median(timings) * 1000:8.1f} ms"
+
+
+def error_of(results):
+    return next(result["error"] for result in results if "error" in result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--flyers", type=int, default=20, help="Flyers listed by the replayed homepage")
+    args = parser.parse_args()
+
+    print("Import time (fresh interpreter):")
+    for module in MODULES:
+        results = [import_seconds(module) for _ in range(args.repeat)]
+        print(f"  {module:<30} {median_of(results) or error_of(results)}")
+
+    print("First and cached call (after importing its module):")
+    for name, (setup, call) in FIRST_CALLS.items():
+        results = [run_python(TIMER.format(setup=setup, call=call)) for _ in range(args.repeat)]
+        if median_of(results) is None:
+            print(f"  {name:<30} unavailable, {error_of(results)}")
+        else:
+            print(f"  {name:<30} first {median_of(results, 0)}  cached {median_of(results, 1)}")
+
+    # Imported here, only the dry run needs a corpus
+    from src.benchmarks.replay import build_synthetic_corpus
+
+    corpus = build_synthetic_corpus(tempfile.mkdtemp(prefix="flipp_corpus_"), locations.DEFAULT_LOCATION,
+                                    args.flyers, 1, 0.0)
+    print("Process start to exit:")
+    results = [process_seconds(["-c", "pass"]) for _ in range(args.repeat)]
+    print(f"  {'empty interpreter':<30} {median_of(results)}")
+    with ReplayServer(corpus) as server:
+        env = {**os.environ, "FLIPP_SITE": server.site_url}
+        command = ["-m", "src.scrapper.flyer_scrapper", "--dry-run", "--api-base", server.api_base]
+        results = [process_seconds(command, env) for _ in range(args.repeat)]
+    print(f"  {'--dry-run, ' + str(args.flyers) + ' flyers':<30} {median_of(results)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Runs image only items through the vision worker pool against the in-memory
+storage and model fakes, and checks that concurrent calls never share a GCS
+object.
+
+Usage (from the repository root):
+    python -m src.benchmarks.vision_concurrency --images 200 --latency 0.2 --transport gcs
+"""
+import argparse
+import time
+
+from src.scrapper import vertexai
+from src.scrapper.fakes import FakeStorageClient, MockVisionModel
+from src.scrapper.rate_limiter import RegionScheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated model latency in seconds")
+    parser.add_argument("--transport", choices=["inline", "gcs"], default="gcs")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--calls-per-minute", type=int, default=6000,
+                        help="Per-region budget for the run, raise it to measure the pool rather than the quota")
+    args = parser.parse_args()
+
+    image_urls = [f"https://f.wishabi.net/page_items/{i}/extra_large.jpg" for i in range(args.images)]
+    responses = {
+        url: {"is_item": True, "name": f"Item {i}", "price": 1.99, "unit": "each"}
+        for i, url in enumerate(image_urls)
+    }
+
+    storage = FakeStorageClient()
+    model = MockVisionModel(responses, latency=args.latency)
+    vertexai.use_storage_client(storage)
+    vertexai.use_mock_model(model)
+    vertexai.IMAGE_TRANSPORT = args.transport
+    vertexai.scheduler = RegionScheduler(vertexai.regions, calls_per_minute=args.calls_per_minute)
+
+    start = time.perf_counter()
+    with vertexai.create_vision_executor(args.workers) as executor:
+        results = list(executor.map(vertexai.get_flyer_image_infos, image_urls))
+    vertexai.blob_janitor.flush()
+    elapsed = time.perf_counter() - start
+
+    wrong = sum(1 for i, result in enumerate(results) if result[0] != f"Item {i}")
+    print(f"{len(image_urls)} images in {elapsed:.2f}s ({len(image_urls) / elapsed:.1f} images/sec)")
+    print(f"model max in flight: {model.max_in_flight}, wrong answers: {wrong}")
+    print(f"storage uploads: {storage.uploads}, overwrites: {storage.overwrites}, "
+          f"max live objects: {storage.max_live_objects}, left behind: {len(storage.objects)}")
+    print(f"scheduler: {vertexai.scheduler.metrics()['queue_wait_p95']:.3f}s p95 queue wait")
+
+    assert wrong == 0 and storage.overwrites == 0 and not storage.objects
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+-- Schema as first deployed (queries/create_tables before migrations existed)
+CREATE TABLE IF NOT EXISTS store_chain (
+    chain_id SERIAL PRIMARY KEY,
+    chain_name VARCHAR UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS store (
+    store_id SERIAL PRIMARY KEY,
+    address VARCHAR,
+    chain_id INT,
+    FOREIGN KEY (chain_id) REFERENCES store_chain(chain_id)
+);
+
+CREATE TABLE IF NOT EXISTS flyer (
+    flyer_id INT PRIMARY KEY,
+    chain_id INT,
+    valid_until TIMESTAMP,
+    flyer_url VARCHAR UNIQUE,
+    FOREIGN KEY (chain_id) REFERENCES store_chain(chain_id)
+);
+
+CREATE TABLE IF NOT EXISTS product (
+    product_id INT PRIMARY KEY,
+    product_name VARCHAR,
+    price DECIMAL(10,2),
+    url VARCHAR,
+    unit VARCHAR,
+    flyer_id INT,
+    FOREIGN KEY (flyer_id) REFERENCES flyer(flyer_id)
+);
@@ -0,0 +1,4 @@
+-- Columns database.py has been writing without the schema declaring them
+ALTER TABLE flyer ADD COLUMN IF NOT EXISTS store_chain VARCHAR;
+ALTER TABLE flyer ADD COLUMN IF NOT EXISTS retrieved BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE product ADD COLUMN IF NOT EXISTS image_url VARCHAR;
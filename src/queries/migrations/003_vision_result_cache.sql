@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS vision_result_cache (
+    image_hash CHAR(64),
+    prompt_version VARCHAR,
+    model VARCHAR,
+    image_url VARCHAR,
+    result JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (image_hash, prompt_version, model)
+);
+CREATE INDEX IF NOT EXISTS vision_result_cache_image_url_idx ON vision_result_cache (image_url);
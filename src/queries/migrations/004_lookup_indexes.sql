@@ -0,0 +1,8 @@
+-- product.flyer_id: cascade deletes and per-flyer product lookups
+CREATE INDEX IF NOT EXISTS product_flyer_id_idx ON product (flyer_id);
+-- flyer.valid_until: expiry in delete_old_flyers_and_products
+CREATE INDEX IF NOT EXISTS flyer_valid_until_idx ON flyer (valid_until);
+-- get_unretrieved_flyers only ever looks at the few flyers not scraped yet
+CREATE INDEX IF NOT EXISTS flyer_unretrieved_idx ON flyer (flyer_id) WHERE NOT retrieved;
+-- vision cache expiry
+CREATE INDEX IF NOT EXISTS vision_result_cache_created_at_idx ON vision_result_cache (created_at);
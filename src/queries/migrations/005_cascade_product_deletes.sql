@@ -0,0 +1,5 @@
+-- Expiring a flyer removes its products in the same statement
+ALTER TABLE product DROP CONSTRAINT IF EXISTS product_flyer_id_fkey;
+ALTER TABLE product
+    ADD CONSTRAINT product_flyer_id_fkey
+    FOREIGN KEY (flyer_id) REFERENCES flyer(flyer_id) ON DELETE CASCADE;
@@ -0,0 +1,32 @@
+-- Append-only price history: a row per (product, chain) only when price or unit changes.
+-- No foreign key to flyer, history outlives expired flyers.
+CREATE TABLE IF NOT EXISTS price_observation (
+    observation_id BIGSERIAL PRIMARY KEY,
+    product_key VARCHAR NOT NULL,
+    product_name VARCHAR NOT NULL,
+    store_chain VARCHAR NOT NULL,
+    flyer_week DATE NOT NULL,
+    price DECIMAL(10,2) NOT NULL,
+    unit VARCHAR NOT NULL,
+    flyer_id INT,
+    product_id INT,
+    observed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    UNIQUE (product_key, store_chain, flyer_week)
+);
+-- "price trend for X": the unique index above serves per-chain trends, this one all chains by week
+CREATE INDEX IF NOT EXISTS price_observation_trend_idx ON price_observation (product_key, flyer_week);
+
+-- Latest known price per (product, chain), maintained alongside the history
+CREATE TABLE IF NOT EXISTS price_current (
+    product_key VARCHAR NOT NULL,
+    store_chain VARCHAR NOT NULL,
+    product_name VARCHAR NOT NULL,
+    price DECIMAL(10,2) NOT NULL,
+    unit VARCHAR NOT NULL,
+    since_week DATE NOT NULL,
+    last_seen_week DATE NOT NULL,
+    product_id INT,
+    PRIMARY KEY (product_key, store_chain)
+);
+-- "cheapest current price for X"
+CREATE INDEX IF NOT EXISTS price_current_cheapest_idx ON price_current (product_key, price);
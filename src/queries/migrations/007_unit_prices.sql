@@ -0,0 +1,11 @@
+-- Comparable prices per kg, litre or item, filled by the scraper (src/scrapper/unit_prices.py).
+-- Products scraped before this migration: python -m src.scrapper.unit_prices
+ALTER TABLE product ADD COLUMN IF NOT EXISTS unit_price NUMERIC(12,4);
+ALTER TABLE product ADD COLUMN IF NOT EXISTS base_unit VARCHAR(8);
+-- "cheapest per kg" over current products
+CREATE INDEX IF NOT EXISTS product_unit_price_idx ON product (base_unit, unit_price) WHERE unit_price IS NOT NULL;
+
+ALTER TABLE price_current ADD COLUMN IF NOT EXISTS unit_price NUMERIC(12,4);
+ALTER TABLE price_current ADD COLUMN IF NOT EXISTS base_unit VARCHAR(8);
+-- "cheapest per kg for X" across chains
+CREATE INDEX IF NOT EXISTS price_current_unit_price_idx ON price_current (product_key, base_unit, unit_price);
@@ -0,0 +1,10 @@
+-- Postal codes each flyer is listed at, a flyer shared by several locations is stored and scraped once
+CREATE TABLE IF NOT EXISTS flyer_location (
+    flyer_id INT NOT NULL REFERENCES flyer(flyer_id) ON DELETE CASCADE,
+    postal_code VARCHAR(6) NOT NULL,
+    first_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (flyer_id, postal_code)
+);
+-- "flyers at this postal code"
+CREATE INDEX IF NOT EXISTS flyer_location_postal_code_idx ON flyer_location (postal_code);
@@ -0,0 +1,63 @@
+from sqlalchemy import text
+from collections import defaultdict
+
+from .product_index import ProductIndex
+
+
+def load_chain_stores(engine):
+    """Returns {chain_name: [store_id, ...]} from the store table."""
+    query = text("""
+                 SELECT sc.chain_name, s.store_id
+                 FROM store s
+                 JOIN store_chain sc ON sc.chain_id = s.chain_id
+                 """)
+    chain_stores = defaultdict(list)
+    try:
+        with engine.connect() as connection:
+            for chain_name, store_id in connection.execute(query).fetchall():
+                chain_stores[chain_name].append(str(store_id))
+    except Exception as e:
+        print(f"Error loading stores: {e}")
+    return dict(chain_stores)
+
+
+def load_store_prices(shopping_list, engine, index=None, matches_per_term=50):
+    """
+    Returns {store_id: {term: price}} for each shopping list term, from the
+    products the matching index ranks for it in the current flyers of each
+    store's chain. A store's offers are compared per kg, litre or item in the
+    base unit of the best match, so "/lb" and "1 kg" offers of the same
+    product line up, and the shelf price of the best offer is what goes in
+    the basket. When the best match has no comparable unit, offers are
+    compared on their shelf price.
+    """
+    if index is None:
+        index = ProductIndex()
+    index.refresh(engine)
+    chain_stores = load_chain_stores(engine)
+
+    # {store_id: {term: (comparison key, price)}}
+    best_offers = defaultdict(dict)
+    for term in shopping_list:
+        matches = index.lookup(term, limit=matches_per_term)
+        if not matches:
+            continue
+        base_unit = matches[0].product.base_unit
+        for match in matches:
+            product = match.product
+            if product.price is None:
+                continue
+            if base_unit is None:
+                key = product.price
+            elif product.base_unit == base_unit and product.unit_price is not None:
+                key = product.unit_price
+            else:
+                continue
+            for store_id in chain_stores.get(product.store_chain, ()):
+                offers = best_offers[store_id]
+                if term not in offers or key < offers[term][0]:
+                    offers[term] = (key, product.price)
+    return {
+        store_id: {term: price for term, (_, price) in offers.items()}
+        for store_id, offers in best_offers.items()
+    }
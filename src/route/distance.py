@@ -0,0 +1,52 @@
+import json
+import math
+
+
+class DistanceMatrix:
+    """
+    Precomputed travel distances (km) between named locations: the shopping
+    start points and the store ids. Built offline and loaded from a JSON file
+    {"locations": [...], "distances": [[...], ...]} so routing never calls a
+    live service.
+    """
+
+    def __init__(self, locations, distances):
+        self.locations = [str(location) for location in locations]
+        self.index = {location: i for i, location in enumerate(self.locations)}
+        self.distances = distances
+
+    def __contains__(self, location):
+        return str(location) in self.index
+
+    def distance(self, a, b):
+        return self.distances[self.index[str(a)]][self.index[str(b)]]
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["locations"], data["distances"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"locations": self.locations, "distances": self.distances}, f)
+
+    @classmethod
+    def from_coordinates(cls, coordinates, detour_factor=1.3):
+        """
+        Builds the matrix from {location: (lat, lon)} with great-circle
+        distances scaled by a road detour factor.
+        """
+        locations = list(coordinates)
+        distances = [
+            [haversine_km(coordinates[a], coordinates[b]) * detour_factor for b in locations]
+            for a in locations
+        ]
+        return cls(locations, distances)
+
+
+def haversine_km(a, b):
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
@@ -0,0 +1,230 @@
+"""
+Picks which stores to visit for a shopping list and in what order, minimizing
+basket cost plus travel cost.
+
+Usage (from the repository root):
+    python -m src.route.optimizer --start home --matrix distances.json --cost-per-km 0.6 milk eggs "chicken breast"
+"""
+import argparse
+
+from .tsp import TourSolver
+
+INF = float("inf")
+
+
+class RoutePlan:
+    def __init__(self, stores, basket_cost, travel_km, travel_cost, assignments, missing):
+        self.stores = stores
+        self.basket_cost = basket_cost
+        self.travel_km = travel_km
+        self.travel_cost = travel_cost
+        self.total_cost = basket_cost + travel_cost
+        # {item: (store, price)}
+        self.assignments = assignments
+        self.missing = missing
+
+    def __repr__(self):
+        return (f"RoutePlan(stores={self.stores}, basket={self.basket_cost:.2f}, "
+                f"travel={self.travel_km:.1f} km / {self.travel_cost:.2f}, total={self.total_cost:.2f}, "
+                f"missing={self.missing})")
+
+
+def optimize_route(shopping_list, store_prices, matrix, start, cost_per_km=0.5, max_stores=5, exact_limit=8):
+    """
+    store_prices is {store: {item: price}} for the items of the shopping list.
+
+    The store set comes from a depth-first branch and bound seeded with a
+    greedy plan improved by local search, over stores sorted by value with
+    dominated ones dropped. Round trips are memoized per store set, exact up
+    to exact_limit stops. Items no store sells, and items the best set of at
+    most max_stores stores can't cover, are reported as missing.
+    """
+    stores = [store for store in store_prices if store in matrix and store_prices[store]]
+    items = [item for item in dict.fromkeys(shopping_list) if any(item in store_prices[s] for s in stores)]
+    missing = [item for item in dict.fromkeys(shopping_list) if item not in items]
+    if not items:
+        return RoutePlan([], 0.0, 0.0, 0.0, {}, missing)
+
+    # Highest price of each item anywhere, what an uncovered item costs at most once covered
+    ceiling = tuple(max(store_prices[s][item] for s in stores if item in store_prices[s]) for item in items)
+    # An item no chosen store sells costs more than any basket and round trip of max_stores stores,
+    # so the search covers as many items as it can first. Finite, the bounds below stay plain sums
+    longest = max((matrix.distance(a, b) for a in [start, *stores] for b in [start, *stores]), default=0.0)
+    uncovered = sum(ceiling) + (max_stores + 1) * longest * cost_per_km + 1.0
+
+    vectors = {store: tuple(store_prices[store].get(item, uncovered) for item in items) for store in stores}
+    stores = [store for store in stores if not is_dominated(store, stores, vectors, matrix, start)]
+
+    def standalone_value(store):
+        saved = sum(c - p for c, p in zip(ceiling, vectors[store]) if p < c)
+        return saved - 2 * matrix.distance(start, store) * cost_per_km
+
+    # Most valuable stores first: good plans are found early and the later,
+    # weaker stores are cut by the bounds
+    stores.sort(key=standalone_value, reverse=True)
+
+    # Plain dict lookups, the tour solver calls this millions of times
+    table = {a: {b: matrix.distance(a, b) for b in [start, *stores]} for a in [start, *stores]}
+    tours = TourSolver(lambda a, b: table[a][b], start, exact_limit=exact_limit)
+
+    def plan_cost(chosen, penalize_uncovered):
+        if not chosen:
+            return INF
+        vector = tuple(map(min, *(vectors[store] for store in chosen))) if len(chosen) > 1 else vectors[chosen[0]]
+        if penalize_uncovered:
+            vector = tuple(2 * c if v == uncovered else v for v, c in zip(vector, ceiling))
+        return sum(vector) + tours.solve(chosen)[0] * cost_per_km
+
+    # suffix_best[i] is the cheapest price of each item among stores[i:]
+    suffix_best = [tuple([uncovered] * len(items))] * (len(stores) + 1)
+    for i in range(len(stores) - 1, -1, -1):
+        suffix_best[i] = tuple(map(min, vectors[stores[i]], suffix_best[i + 1]))
+
+    best_cost, best_set = greedy_plan(stores, plan_cost, max_stores)
+
+    def search(index, chosen, vector, travel):
+        """
+        Extends `chosen` with stores[index:]. A branch is cut when its basket
+        with every item at the cheapest price a later store has, or lowered by
+        the most the stores that still fit can save, plus the round trip it
+        already needs can't beat the best plan.
+        """
+        nonlocal best_cost, best_set
+        # `travel` is a lower bound until the basket is cheap enough to need the exact round trip
+        basket = sum(vector)
+        if chosen and basket + travel < best_cost:
+            travel = tours.solve(chosen)[0] * cost_per_km
+            if basket + travel < best_cost:
+                best_cost, best_set = basket + travel, chosen
+        slots = max_stores - len(chosen)
+        if not slots or index == len(stores):
+            return
+
+        if sum(map(min, vector, suffix_best[index])) + travel >= best_cost:
+            return
+        capped = tuple(map(min, vector, ceiling))
+        most_saved = max_savings(capped, [vectors[store] for store in stores[index:]], slots)
+        if sum(capped) - most_saved + travel >= best_cost:
+            return
+
+        for j in range(index, len(stores)):
+            store = stores[j]
+            improved = tuple(map(min, vector, vectors[store]))
+            if improved == vector:
+                continue
+            # Any tour through this store is at least the trip there and back
+            trip = max(travel, 2 * table[start][store] * cost_per_km)
+            if sum(map(min, improved, suffix_best[j + 1])) + trip >= best_cost:
+                continue
+            search(j + 1, chosen + (store,), improved, trip)
+
+    search(0, (), tuple([uncovered] * len(items)), 0.0)
+
+    travel_km, order = tours.solve(best_set)
+    assignments = {}
+    for k, item in enumerate(items):
+        store = min(best_set, key=lambda s: vectors[s][k])
+        if vectors[store][k] != uncovered:
+            assignments[item] = (store, vectors[store][k])
+    missing = [item for item in dict.fromkeys(shopping_list) if item not in assignments]
+    basket = sum(price for _, price in assignments.values())
+    return RoutePlan(order, basket, travel_km, travel_km * cost_per_km, assignments, missing)
+
+
+def max_savings(vector, candidates, slots):
+    """
+    Upper bound on how much any `slots` of the candidate price vectors can
+    lower `vector`. Savings are submodular, so for any set A the best set
+    saves at most what A saves plus the best `slots` gains on top of A; A
+    runs through the greedy picks and the tightest bound wins.
+    """
+    saved = 0.0
+    bound = INF
+    for _ in range(slots + 1):
+        gains = [sum(v - p for v, p in zip(vector, prices) if p < v) for prices in candidates]
+        bound = min(bound, saved + sum(sorted(gains, reverse=True)[:slots]))
+        best = max(range(len(gains)), key=gains.__getitem__)
+        if gains[best] <= 0:
+            break
+        saved += gains[best]
+        vector = tuple(map(min, vector, candidates[best]))
+    return bound
+
+
+def is_dominated(store, stores, vectors, matrix, start):
+    """
+    A store is useless if another one is never more expensive and no farther
+    from start or any other store, swapping it in can only shorten a tour.
+    """
+    vector = vectors[store]
+    places = [start, *stores]
+    for other in stores:
+        if other == store:
+            continue
+        other_vector = vectors[other]
+        if not all(o <= v for o, v in zip(other_vector, vector)):
+            continue
+        if all(matrix.distance(other, place) <= matrix.distance(store, place) for place in places if place != other):
+            if other_vector != vector or stores.index(other) < stores.index(store):
+                return True
+    return False
+
+
+def greedy_plan(stores, cost, max_stores):
+    """
+    Adds the store that lowers the cost most until nothing helps, then swaps
+    or drops single stores while that lowers it. `cost(chosen, penalty)`
+    prices uncovered items at a penalty so the first stores chase coverage.
+    """
+    chosen = ()
+    while len(chosen) < max_stores:
+        candidates = [store for store in stores if store not in chosen]
+        if not candidates:
+            break
+        store = min(candidates, key=lambda candidate: cost(chosen + (candidate,), True))
+        if chosen and cost(chosen + (store,), True) >= cost(chosen, True):
+            break
+        chosen += (store,)
+
+    best_cost = cost(chosen, False)
+    improved = True
+    while improved:
+        improved = False
+        neighbours = [chosen[:i] + chosen[i + 1:] for i in range(len(chosen))]
+        neighbours += [
+            chosen[:i] + (store,) + chosen[i + 1:]
+            for i in range(len(chosen)) for store in stores if store not in chosen
+        ]
+        for neighbour in neighbours:
+            neighbour_cost = cost(neighbour, False)
+            if neighbour_cost < best_cost:
+                best_cost, chosen, improved = neighbour_cost, neighbour, True
+                break
+    return best_cost, chosen
+
+
+def main():
+    from .distance import DistanceMatrix
+    from .data import load_store_prices
+    from ..scrapper.database import get_sql_engine_from_env
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("items", nargs="+", help="Shopping list terms")
+    parser.add_argument("--start", required=True, help="Start location id in the distance matrix")
+    parser.add_argument("--matrix", required=True, help="Precomputed distance matrix JSON")
+    parser.add_argument("--cost-per-km", type=float, default=0.5)
+    parser.add_argument("--max-stores", type=int, default=5)
+    args = parser.parse_args()
+
+    matrix = DistanceMatrix.load(args.matrix)
+    store_prices = load_store_prices(args.items, engine=get_sql_engine_from_env())
+    plan = optimize_route(args.items, store_prices, matrix, args.start,
+                          cost_per_km=args.cost_per_km, max_stores=args.max_stores)
+
+    print(plan)
+    for item, (store, price) in plan.assignments.items():
+        print(f"  {item}: {price:.2f} at store {store}")
+
+
+if __name__ == "__main__":
+    main()
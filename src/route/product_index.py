@@ -0,0 +1,206 @@
+from collections import defaultdict, namedtuple
+import heapq
+import itertools
+import math
+import threading
+
+from ..scrapper.normalize import product_tokens
+from ..scrapper.unit_prices import normalize_price, parse_unit
+from ..scrapper.database import get_current_flyer_ids, get_flyer_products
+
+IndexedProduct = namedtuple(
+    "IndexedProduct",
+    ["product_id", "name", "price", "unit", "flyer_id", "store_chain", "tokens", "unit_price", "base_unit"]
+)
+Match = namedtuple("Match", ["score", "product"])
+
+# Score lost for each product word the query didn't ask for, so "Chicken Breast"
+# ranks above "Chicken Breast Stuffed With Spinach And Cheese" for "chicken breast"
+EXTRA_TOKEN_PENALTY = 0.02
+
+
+def trigrams(token):
+    padded = f"#{token}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """
+    In-memory inverted index from normalized name tokens to flyer products,
+    with a trigram index over the token vocabulary for misspelled or
+    differently inflected query words.
+
+    Products are added and removed a flyer at a time, so `refresh` only loads
+    the flyers ingested since the last call and drops the expired ones.
+    """
+
+    def __init__(self, fuzzy_threshold=0.5, max_expansions=3):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_expansions = max_expansions
+
+        self.products = {}
+        self.postings = defaultdict(set)
+        self.vocabulary_trigrams = defaultdict(set)
+        self.flyers = defaultdict(set)
+        self.unit_postings = defaultdict(set)
+        # Order among products matching the same words: fewer words, then lower unit price
+        self._rank_keys = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.products)
+
+    def add(self, products):
+        """Indexes product rows or dicts with product_id, product_name, price, unit, flyer_id and store_chain."""
+        with self._lock:
+            for row in products:
+                row = row._mapping if hasattr(row, "_mapping") else row
+                product_id = row["product_id"]
+                if product_id in self.products:
+                    self._remove(product_id)
+
+                tokens = frozenset(product_tokens(row["product_name"]))
+                if not tokens:
+                    continue
+                price = float(row["price"]) if row["price"] is not None else None
+                if row.get("base_unit") is not None:
+                    per_unit, base_unit = float(row["unit_price"]), row["base_unit"]
+                else:
+                    per_unit, base_unit = normalize_price(price, row["unit"])
+                self.products[product_id] = IndexedProduct(
+                    product_id, row["product_name"], price, row["unit"], row["flyer_id"],
+                    row["store_chain"], tokens, per_unit, base_unit
+                )
+                self.flyers[row["flyer_id"]].add(product_id)
+                self.unit_postings[base_unit].add(product_id)
+                self._rank_keys[product_id] = (len(tokens), per_unit if per_unit is not None else math.inf)
+                for token in tokens:
+                    if token not in self.postings:
+                        for trigram in trigrams(token):
+                            self.vocabulary_trigrams[trigram].add(token)
+                    self.postings[token].add(product_id)
+
+    def _remove(self, product_id):
+        product = self.products.pop(product_id)
+        self.flyers.get(product.flyer_id, set()).discard(product_id)
+        self.unit_postings[product.base_unit].discard(product_id)
+        del self._rank_keys[product_id]
+        for token in product.tokens:
+            posting = self.postings[token]
+            posting.discard(product_id)
+            if not posting:
+                del self.postings[token]
+                for trigram in trigrams(token):
+                    self.vocabulary_trigrams[trigram].discard(token)
+
+    def remove_flyer(self, flyer_id):
+        with self._lock:
+            for product_id in list(self.flyers.pop(flyer_id, ())):
+                self._remove(product_id)
+
+    def refresh(self, engine, product_table="product", flyer_table="flyer"):
+        """
+        Brings the index in line with the current flyers: drops the expired or
+        deleted ones and loads the products of the new ones. Returns the
+        number of flyers added and removed, or None when the database can't be read.
+        """
+        current = get_current_flyer_ids(flyer_table, engine)
+        if current is None:
+            return None
+
+        with self._lock:
+            indexed = set(self.flyers)
+        removed = indexed - current
+        for flyer_id in removed:
+            self.remove_flyer(flyer_id)
+
+        added = current - indexed
+        if added:
+            products = get_flyer_products(added, product_table, flyer_table, engine)
+            if products is None:
+                return None
+            self.add(products)
+            with self._lock:
+                # Flyers without products still count as indexed
+                for flyer_id in added:
+                    self.flyers.setdefault(flyer_id, set())
+        return {"added": len(added), "removed": len(removed)}
+
+    def _expand(self, token):
+        """The token itself if indexed, otherwise the closest vocabulary tokens by trigram (Dice) similarity."""
+        if token in self.postings:
+            return [(token, 1.0)]
+        query_trigrams = trigrams(token)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for candidate in self.vocabulary_trigrams.get(trigram, ()):
+                shared[candidate] += 1
+
+        expansions = []
+        for candidate, count in shared.items():
+            similarity = 2 * count / (len(query_trigrams) + len(trigrams(candidate)))
+            if similarity >= self.fuzzy_threshold:
+                expansions.append((candidate, similarity))
+        return heapq.nlargest(self.max_expansions, expansions, key=lambda expansion: expansion[1])
+
+    def lookup(self, term, limit=10, unit=None, min_score=0.5):
+        """
+        Ranked products for a shopping list term. Query words are weighted by
+        rarity and a product scores the share of that weight it matches, less
+        a small penalty per extra word; ties go to the lowest unit price.
+        `unit` ("kg", "lb", "each", "l", ...) keeps only products sold in a
+        comparable unit.
+
+        Products are gathered by set intersections, one per combination of
+        matched query words from the best one down, and the search stops once
+        no later combination can outscore the results already found.
+        """
+        query = sorted(set(product_tokens(term)))
+        if not query:
+            return []
+        base_unit = parse_unit(unit)[0] if unit else None
+
+        with self._lock:
+            total = len(self.products) or 1
+            choices = []
+            total_weight = 0.0
+            for token in query:
+                options = self._expand(token)
+                weight = max((math.log(1 + total / len(self.postings[t])) for t, _ in options), default=1.0)
+                total_weight += weight
+                choices.append([(t, weight * similarity) for t, similarity in options] + [(None, 0.0)])
+
+            patterns = []
+            for pattern in itertools.product(*choices):
+                value = sum(v for _, v in pattern) / total_weight
+                if value >= min_score:
+                    patterns.append((value, [t for t, _ in pattern if t is not None]))
+            patterns.sort(key=lambda pattern: pattern[0], reverse=True)
+
+            unit_filter = self.unit_postings.get(base_unit, set()) if base_unit else None
+            seen = set()
+            ranked = []
+            for value, tokens in patterns:
+                if len(ranked) >= limit and value < ranked[limit - 1].score:
+                    break
+                postings = sorted((self.postings[t] for t in tokens), key=len)
+                if unit_filter is not None:
+                    postings.insert(0, unit_filter)
+                candidates = set.intersection(*postings) - seen
+                if not candidates:
+                    continue
+                seen |= candidates
+
+                # Within one combination the score only depends on the number of extra words
+                for product_id in heapq.nsmallest(limit, candidates, key=self._rank_keys.__getitem__):
+                    product = self.products[product_id]
+                    score = value - EXTRA_TOKEN_PENALTY * (len(product.tokens) - len(tokens))
+                    if score >= min_score:
+                        ranked.append(Match(score, product))
+                ranked.sort(key=lambda match: (-match.score, self._rank_keys[match.product.product_id]))
+                del ranked[limit:]
+        return ranked
+
+    def summary(self):
+        with self._lock:
+            return {"products": len(self.products), "tokens": len(self.postings), "flyers": len(self.flyers)}
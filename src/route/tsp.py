@@ -0,0 +1,84 @@
+import itertools
+
+
+def held_karp(distance, start, stops):
+    """Exact shortest round trip from start through every stop, O(n^2 2^n)."""
+    n = len(stops)
+    if n == 0:
+        return 0.0, []
+
+    # best[(mask, last)] = (cost, previous) for paths from start visiting mask and ending at last
+    best = {(1 << i, i): (distance(start, stops[i]), None) for i in range(n)}
+    for size in range(2, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            mask = sum(1 << i for i in subset)
+            for last in subset:
+                previous_mask = mask & ~(1 << last)
+                best[(mask, last)] = min(
+                    (best[(previous_mask, k)][0] + distance(stops[k], stops[last]), k)
+                    for k in subset if k != last
+                )
+
+    full = (1 << n) - 1
+    cost, last = min((best[(full, i)][0] + distance(stops[i], start), i) for i in range(n))
+
+    order = []
+    mask = full
+    while last is not None:
+        order.append(stops[last])
+        _, previous = best[(mask, last)]
+        mask &= ~(1 << last)
+        last = previous
+    return cost, order[::-1]
+
+
+def tour_cost(distance, start, order):
+    if not order:
+        return 0.0
+    path = [start, *order, start]
+    return sum(distance(a, b) for a, b in zip(path, path[1:]))
+
+
+def nearest_neighbor_two_opt(distance, start, stops):
+    """Nearest neighbour tour improved with 2-opt moves until none helps."""
+    remaining = list(stops)
+    order = []
+    current = start
+    while remaining:
+        current = min(remaining, key=lambda stop: distance(current, stop))
+        remaining.remove(current)
+        order.append(current)
+
+    improved = True
+    while improved:
+        improved = False
+        path = [start, *order, start]
+        for i in range(1, len(path) - 2):
+            for j in range(i + 1, len(path) - 1):
+                delta = (distance(path[i - 1], path[j]) + distance(path[i], path[j + 1])
+                         - distance(path[i - 1], path[i]) - distance(path[j], path[j + 1]))
+                if delta < -1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+        order = path[1:-1]
+    return tour_cost(distance, start, order), order
+
+
+class TourSolver:
+    """Memoized round trips: exact up to exact_limit stops, heuristic above."""
+
+    def __init__(self, distance, start, exact_limit=8):
+        self.distance = distance
+        self.start = start
+        self.exact_limit = exact_limit
+        self._cache = {}
+
+    def solve(self, stops):
+        key = frozenset(stops)
+        if key not in self._cache:
+            stops = sorted(key)
+            if len(stops) <= self.exact_limit:
+                self._cache[key] = held_karp(self.distance, self.start, stops)
+            else:
+                self._cache[key] = nearest_neighbor_two_opt(self.distance, self.start, stops)
+        return self._cache[key]
@@ -4,13 +4,24 @@ import os
 from dotenv import load_dotenv
 from datetime import datetime
 import pytz
+import json
+
+from .instrumentation import log, timed
 
 load_dotenv()
 
-def get_sql_engine_from_env() -> Engine:
+def get_sql_engine_from_env(pool_size=None, max_overflow=None, pool_timeout=None, statement_timeout_ms=None,
+                            search_path=None) -> Engine:
     """
     Create a SQLAlchemy engine using environment variables.
 
+    The connection pool is sized for the scraper's worker count: pass pool_size
+    (or set DATABASE_POOL_SIZE) to roughly the number of threads that talk to
+    the database at once. Connections are pre-pinged so a restarted server
+    doesn't fail the next query, and every statement runs under
+    statement_timeout so a stuck query can't hang a worker. search_path (or
+    DATABASE_SEARCH_PATH) sets the schemas of every connection when it opens.
+
     Returns:
         Engine: SQLAlchemy engine connected to the database.
     """
@@ -20,9 +31,29 @@ def get_sql_engine_from_env() -> Engine:
     db = os.getenv("DATABASE_NAME")
     port = os.getenv("DATABASE_PORT", "5432")
 
-    return create_engine(f"postgresql://{username}:{password}@{host}:{port}/{db}")
+    pool_size = pool_size or int(os.getenv("DATABASE_POOL_SIZE", "5"))
+    max_overflow = max_overflow if max_overflow is not None else int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+    pool_timeout = pool_timeout or int(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+    statement_timeout_ms = statement_timeout_ms or int(os.getenv("DATABASE_STATEMENT_TIMEOUT_MS", "30000"))
+    search_path = search_path or os.getenv("DATABASE_SEARCH_PATH")
+
+    # Set as startup options, not a SET that the pool's rollback on checkin would undo
+    options = f"-c statement_timeout={statement_timeout_ms}"
+    if search_path:
+        options += f" -c search_path={search_path}"
 
+    return create_engine(
+        f"postgresql://{username}:{password}@{host}:{port}/{db}",
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={"options": options}
+    )
 
+
+@timed("db")
 def insert_store_chain_record(chain_name, table, engine):
     query = text(f"""
                  INSERT INTO {table} 
@@ -35,116 +66,199 @@ def insert_store_chain_record(chain_name, table, engine):
             connection.execute(query, {"chain_name": chain_name})
             connection.commit()
     except Exception as e:
-        print(f"Error adding chain_name record to database: {e}")
+        log("db", f"Error adding chain_name record to database: {e}", error=True, call="insert_store_chain_record")
         
 
-def insert_flyer_record(flyer_id, flyer_url, valid_until, store_chain, table, engine):
+PRODUCT_COLUMNS = ["product_id", "product_name", "price", "url", "unit", "flyer_id", "image_url",
+                   "unit_price", "base_unit"]
+
+
+@timed("db")
+def upsert_product_records(products, table, connection):
+    """
+    Multi-row INSERT ... ON CONFLICT (product_id) DO UPDATE of product rows,
+    run inside the caller's transaction so a whole flyer commits once.
+    """
+    values = []
+    params = {}
+    for i, product in enumerate(products):
+        values.append("(" + ", ".join(f":{column}_{i}" for column in PRODUCT_COLUMNS) + ")")
+        params.update({f"{column}_{i}": product[column] for column in PRODUCT_COLUMNS})
+
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in PRODUCT_COLUMNS if column != "product_id")
     query = text(f"""
-                 INSERT INTO {table} 
-                 (flyer_id, flyer_url, valid_until, store_chain)
-                 VALUES (:flyer_id, :flyer_url, :valid_until, :store_chain)
-                 """) 
+                 INSERT INTO {table}
+                 ({", ".join(PRODUCT_COLUMNS)})
+                 VALUES {", ".join(values)}
+                 ON CONFLICT (product_id) DO UPDATE SET {updates}
+                 """)
+    connection.execute(query, params)
 
+
+@timed("db")
+def get_existing_flyer_ids(flyer_ids, table, engine):
+    """Returns the subset of flyer_ids already in the table, in one query."""
+    query = text(f"""
+                 SELECT flyer_id
+                 FROM {table}
+                 WHERE flyer_id = ANY(:flyer_ids)
+                 """)
     try:
         with engine.connect() as connection:
-            connection.execute(query, 
-                               {
-                                "flyer_id": flyer_id,
-                                "flyer_url": flyer_url,
-                                "valid_until": valid_until,
-                                "store_chain": store_chain
-                                })
-            connection.commit()
+            result = connection.execute(query, {"flyer_ids": list(flyer_ids)})
+            return {row[0] for row in result.fetchall()}
     except Exception as e:
-        print(f"Error adding flyer record to database: {e}")
-        
+        log("db", f"Error checking which flyers exist: {e}", error=True, call="get_existing_flyer_ids")
+        return None
 
-def insert_product_record(product_infos, table, engine):
-    query = text(f"""
-                 INSERT INTO {table} 
-                 (product_id, product_name, price, url, unit, flyer_id, image_url)
-                 VALUES (:product_id, :product_name, :price, :url, :unit, :flyer_id, :image_url)
-                 """) 
 
+@timed("db")
+def upsert_flyer_records(flyers, table, engine):
+    """
+    Inserts flyers ({"flyer_id", "flyer_url", "valid_until", "store_chain"})
+    with one multi-row statement and commit. Flyers already present keep their
+    retrieved flag and get their url, end date and store chain refreshed.
+    """
+    if not flyers:
+        return True
+
+    values = []
+    params = {}
+    for i, flyer in enumerate(flyers):
+        values.append(f"(:flyer_id_{i}, :flyer_url_{i}, :valid_until_{i}, :store_chain_{i})")
+        params.update({f"{key}_{i}": flyer[key] for key in ("flyer_id", "flyer_url", "valid_until", "store_chain")})
+
+    query = text(f"""
+                 INSERT INTO {table}
+                 (flyer_id, flyer_url, valid_until, store_chain)
+                 VALUES {", ".join(values)}
+                 ON CONFLICT (flyer_id) DO UPDATE SET
+                    flyer_url = EXCLUDED.flyer_url,
+                    valid_until = EXCLUDED.valid_until,
+                    store_chain = EXCLUDED.store_chain
+                 """)
     try:
         with engine.connect() as connection:
-            connection.execute(query, 
-                               {
-                                "product_id": product_infos["product_id"],
-                                "product_name": product_infos["product_name"],
-                                "price": product_infos["price"],
-                                "url": product_infos["url"],
-                                "unit": product_infos["unit"],
-                                "flyer_id": product_infos["flyer_id"],
-                                "image_url": product_infos["product_image_url"]
-                                })
+            connection.execute(query, params)
             connection.commit()
+            return True
     except Exception as e:
-        print(f"Error adding flyer record to database: {e}")
+        log("db", f"Error adding flyer records to database: {e}", error=True, call="upsert_flyer_records")
+        return False
+
+
+@timed("db")
+def upsert_flyer_locations(flyer_locations, table, engine):
+    """Records the (flyer_id, postal_code) pairs seen on homepages in one statement, refreshing last_seen."""
+    if not flyer_locations:
+        return True
 
+    values = []
+    params = {}
+    for i, (flyer_id, postal_code) in enumerate(flyer_locations):
+        values.append(f"(:flyer_id_{i}, :postal_code_{i})")
+        params.update({f"flyer_id_{i}": flyer_id, f"postal_code_{i}": postal_code})
 
-def flyer_exists(flyer_id, table, engine):
     query = text(f"""
-                 SELECT flyer_id 
-                 FROM {table}
-                 WHERE flyer_id = :flyer_id
-                 """) 
+                 INSERT INTO {table}
+                 (flyer_id, postal_code)
+                 VALUES {", ".join(values)}
+                 ON CONFLICT (flyer_id, postal_code) DO UPDATE SET
+                    last_seen = NOW()
+                 """)
     try:
-        with engine.connect() as connection:
-            result = connection.execute(query, {"flyer_id": flyer_id})
-            flyer = result.fetchone()
-            return flyer is not None
+        with engine.begin() as connection:
+            connection.execute(query, params)
+            return True
     except Exception as e:
-        print(f"Error checking if flyer exists: {e}")
+        log("db", f"Error recording flyer locations: {e}", error=True, call="upsert_flyer_locations")
         return False
 
 
-def delete_old_flyers_and_products(product_table, flyer_table, engine):
+@timed("db")
+def delete_old_flyers_and_products(flyer_table, engine):
+    """
+    Deletes expired flyers in one set-based statement; their products go with
+    them through the ON DELETE CASCADE foreign key (migration 005).
+    """
     eastern_timezone = pytz.timezone('America/Toronto')
     today = datetime.now(eastern_timezone).date()
     
-    # Step 1: Retrieve all flyer_ids that have a valid_until date in the past
-    select_query = text(f"""
-        SELECT flyer_id 
-        FROM {flyer_table} 
+    delete_query = text(f"""
+        DELETE FROM {flyer_table}
         WHERE valid_until < :today
     """)
     
     try:
         with engine.connect() as connection:
-            old_flyers = connection.execute(select_query, {"today": today}).fetchall()
-            old_flyer_ids = [row[0] for row in old_flyers]
+            result = connection.execute(delete_query, {"today": today})
+            connection.commit()
 
-            if not old_flyer_ids:
-                print("No old flyers found.")
+            if result.rowcount == 0:
+                log("db", "No old flyers found.", call="delete_old_flyers_and_products")
                 return
+            log("db", f"Deleted {result.rowcount} old flyers and associated products.",
+                call="delete_old_flyers_and_products")
 
-            # Step 2: Delete products associated with old flyers
-            delete_products_query = text(f"""
-                DELETE FROM {product_table}
-                WHERE flyer_id = ANY(:old_flyer_ids)
-            """)
-            connection.execute(delete_products_query, {"old_flyer_ids": old_flyer_ids})
+    except Exception as e:
+        log("db", f"Error deleting old flyers and products: {e}", error=True, call="delete_old_flyers_and_products")
 
-            # Step 3: Delete old flyers
-            delete_flyers_query = text(f"""
-                DELETE FROM {flyer_table}
-                WHERE flyer_id = ANY(:old_flyer_ids)
-            """)
-            connection.execute(delete_flyers_query, {"old_flyer_ids": old_flyer_ids})
 
-            connection.commit()
-            print(f"Deleted {len(old_flyer_ids)} old flyers and associated products.")
+@timed("db")
+def get_existing_product_ids(flyer_id, table, engine):
+    """Returns the ids (as strings, like the item ids) of the products already stored for a flyer."""
+    query = text(f"""
+                 SELECT product_id
+                 FROM {table}
+                 WHERE flyer_id = :flyer_id
+                 """)
+    try:
+        with engine.connect() as connection:
+            return {str(row[0]) for row in connection.execute(query, {"flyer_id": flyer_id}).fetchall()}
+    except Exception as e:
+        log("db", f"Error getting stored products of flyer {flyer_id}: {e}", error=True, call="get_existing_product_ids")
+        return None
+
 
+@timed("db")
+def get_current_flyer_ids(table, engine):
+    """Returns the ids of the flyers that haven't expired yet."""
+    query = text(f"""
+                 SELECT flyer_id
+                 FROM {table}
+                 WHERE valid_until >= CURRENT_DATE
+                 """)
+    try:
+        with engine.connect() as connection:
+            return {row[0] for row in connection.execute(query).fetchall()}
     except Exception as e:
-        print(f"Error deleting old flyers and products: {e}")
+        log("db", f"Error getting current flyers: {e}", error=True, call="get_current_flyer_ids")
+        return None
+
+
+@timed("db")
+def get_flyer_products(flyer_ids, product_table, flyer_table, engine):
+    """Products of the given flyers with their flyer's store chain, in one query."""
+    query = text(f"""
+                 SELECT p.product_id, p.product_name, p.price, p.unit, p.unit_price, p.base_unit, p.flyer_id, f.store_chain
+                 FROM {product_table} p
+                 JOIN {flyer_table} f ON f.flyer_id = p.flyer_id
+                 WHERE p.flyer_id = ANY(:flyer_ids)
+                 """)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(query, {"flyer_ids": list(flyer_ids)}).fetchall()
+    except Exception as e:
+        log("db", f"Error getting flyer products: {e}", error=True, call="get_flyer_products")
+        return None
 
 
+@timed("db")
 def get_unretrieved_flyers(table, engine):
     query = text(f"""
                  SELECT flyer_id, flyer_url 
                  FROM {table}
-                 WHERE retrieved = 'false'
+                 WHERE NOT retrieved
                  """) 
     try:
         with engine.connect() as connection:
@@ -152,10 +266,11 @@ def get_unretrieved_flyers(table, engine):
             flyers = result.fetchall()
             return flyers
     except Exception as e:
-        print(f"Error getting unretrieved flyers: {e}")
+        log("db", f"Error getting unretrieved flyers: {e}", error=True, call="get_unretrieved_flyers")
         return None
 
 
+@timed("db")
 def set_flyer_retrieved_to_true(flyer_id, table, engine):
     query = text(f"""
                  UPDATE {table} 
@@ -163,10 +278,266 @@ def set_flyer_retrieved_to_true(flyer_id, table, engine):
                  WHERE flyer_id = :flyer_id
                  """)
     try:
-        with engine.connect() as connection:
+        with engine.begin() as connection:
             result = connection.execute(query, {"flyer_id": flyer_id})
             if result.rowcount == 0:
-                print(f"No rows updated for flyer_id: {flyer_id}")
+                log("db", f"No rows updated for flyer_id: {flyer_id}", call="set_flyer_retrieved_to_true")
     except Exception as e:
-        print(f"Error setting flyer retrieved value to true: {e}")
-        
\ No newline at end of file
+        log("db", f"Error setting flyer retrieved value to true: {e}", error=True, call="set_flyer_retrieved_to_true")
+        
+
+@timed("db")
+def get_vision_result(prompt_version, model, max_age_days, table, engine, image_hash=None, image_url=None):
+    """Looks a cached vision result up by image content hash, or by image URL when the hash isn't known yet."""
+    key_column, key = ("image_hash", image_hash) if image_hash is not None else ("image_url", image_url)
+    query = text(f"""
+                 SELECT result
+                 FROM {table}
+                 WHERE {key_column} = :key
+                   AND prompt_version = :prompt_version
+                   AND model = :model
+                   AND created_at >= NOW() - make_interval(days => :max_age_days)
+                 ORDER BY created_at DESC
+                 LIMIT 1
+                 """)
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(query, {
+                "key": key,
+                "prompt_version": prompt_version,
+                "model": model,
+                "max_age_days": max_age_days
+            }).fetchone()
+            if row is None:
+                return None
+            return row[0] if isinstance(row[0], dict) else json.loads(row[0])
+    except Exception as e:
+        log("db", f"Error reading vision result cache: {e}", error=True, call="get_vision_result")
+        return None
+
+
+@timed("db")
+def insert_vision_result(image_hash, image_url, prompt_version, model, result, table, engine):
+    query = text(f"""
+                 INSERT INTO {table}
+                 (image_hash, prompt_version, model, image_url, result, created_at)
+                 VALUES (:image_hash, :prompt_version, :model, :image_url, CAST(:result AS JSONB), NOW())
+                 ON CONFLICT (image_hash, prompt_version, model)
+                 DO UPDATE SET image_url = EXCLUDED.image_url, result = EXCLUDED.result, created_at = EXCLUDED.created_at
+                 """)
+    try:
+        with engine.connect() as connection:
+            connection.execute(query, {
+                "image_hash": image_hash,
+                "prompt_version": prompt_version,
+                "model": model,
+                "image_url": image_url,
+                "result": json.dumps(result)
+            })
+            connection.commit()
+    except Exception as e:
+        log("db", f"Error adding vision result to cache: {e}", error=True, call="insert_vision_result")
+
+
+@timed("db")
+def delete_expired_vision_results(max_age_days, table, engine):
+    query = text(f"""
+                 DELETE FROM {table}
+                 WHERE created_at < NOW() - make_interval(days => :max_age_days)
+                 """)
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(query, {"max_age_days": max_age_days})
+            connection.commit()
+            log("db", f"Deleted {result.rowcount} expired vision results.", call="delete_expired_vision_results")
+    except Exception as e:
+        log("db", f"Error deleting expired vision results: {e}", error=True, call="delete_expired_vision_results")
+
+
+@timed("db")
+def get_vision_cache_stats(table, engine):
+    query = text(f"""
+                 SELECT prompt_version, model, COUNT(*), MIN(created_at), MAX(created_at)
+                 FROM {table}
+                 GROUP BY prompt_version, model
+                 """)
+    try:
+        with engine.connect() as connection:
+            return [
+                {"prompt_version": row[0], "model": row[1], "entries": row[2], "oldest": row[3], "newest": row[4]}
+                for row in connection.execute(query).fetchall()
+            ]
+    except Exception as e:
+        log("db", f"Error getting vision cache stats: {e}", error=True, call="get_vision_cache_stats")
+        return None
+
+
+@timed("db")
+def record_price_observations(products, observation_table, current_table, flyer_table, connection):
+    """
+    Change capture for price history, inside the caller's transaction.
+    products are {"product_key", "product_name", "price", "unit", "unit_price",
+    "base_unit", "flyer_id", "product_id"}; store chain and flyer week come from the flyer row. A
+    history row is only appended when the price or unit differs from the
+    current one for that (product, chain); price_current is always refreshed.
+    """
+    if not products:
+        return
+
+    values = []
+    params = {}
+    for i, product in enumerate(products):
+        values.append(f"(:product_key_{i}, :product_name_{i}, CAST(:price_{i} AS DECIMAL(10,2)), :unit_{i}, "
+                      f"CAST(:unit_price_{i} AS NUMERIC(12,4)), CAST(:base_unit_{i} AS VARCHAR), "
+                      f"CAST(:flyer_id_{i} AS INT), CAST(:product_id_{i} AS INT))")
+        params.update({
+            f"{key}_{i}": product.get(key)
+            for key in ("product_key", "product_name", "price", "unit", "unit_price", "base_unit", "flyer_id", "product_id")
+        })
+
+    query = text(f"""
+        WITH raw (product_key, product_name, price, unit, unit_price, base_unit, flyer_id, product_id) AS (
+            VALUES {", ".join(values)}
+        ),
+        incoming AS (
+            -- One row per (product, chain): the cheapest when a flyer lists a product twice
+            SELECT DISTINCT ON (r.product_key, COALESCE(f.store_chain, 'Unknown Store'))
+                   r.product_key, r.product_name, r.price, r.unit, r.unit_price, r.base_unit, r.flyer_id, r.product_id,
+                   COALESCE(f.store_chain, 'Unknown Store') AS store_chain,
+                   CAST(date_trunc('week', COALESCE(f.valid_until, NOW())) AS DATE) AS flyer_week
+            FROM raw r
+            LEFT JOIN {flyer_table} f ON f.flyer_id = r.flyer_id
+            ORDER BY r.product_key, COALESCE(f.store_chain, 'Unknown Store'), r.price
+        ),
+        changed AS (
+            INSERT INTO {observation_table}
+            (product_key, product_name, store_chain, flyer_week, price, unit, flyer_id, product_id)
+            SELECT i.product_key, i.product_name, i.store_chain, i.flyer_week, i.price, i.unit, i.flyer_id, i.product_id
+            FROM incoming i
+            LEFT JOIN {current_table} c
+              ON c.product_key = i.product_key AND c.store_chain = i.store_chain
+            WHERE c.product_key IS NULL OR c.price <> i.price OR c.unit <> i.unit
+            ON CONFLICT (product_key, store_chain, flyer_week)
+            DO UPDATE SET price = EXCLUDED.price, unit = EXCLUDED.unit, observed_at = NOW()
+            RETURNING 1
+        )
+        INSERT INTO {current_table}
+        (product_key, store_chain, product_name, price, unit, unit_price, base_unit, since_week, last_seen_week, product_id)
+        SELECT product_key, store_chain, product_name, price, unit, unit_price, base_unit, flyer_week, flyer_week, product_id
+        FROM incoming
+        ON CONFLICT (product_key, store_chain) DO UPDATE SET
+            since_week = CASE
+                WHEN {current_table}.price <> EXCLUDED.price OR {current_table}.unit <> EXCLUDED.unit
+                THEN EXCLUDED.since_week ELSE {current_table}.since_week END,
+            last_seen_week = GREATEST({current_table}.last_seen_week, EXCLUDED.last_seen_week),
+            product_name = EXCLUDED.product_name,
+            price = EXCLUDED.price,
+            unit = EXCLUDED.unit,
+            unit_price = EXCLUDED.unit_price,
+            base_unit = EXCLUDED.base_unit,
+            product_id = EXCLUDED.product_id
+    """)
+    connection.execute(query, params)
+
+
+@timed("db")
+def get_cheapest_current_prices(product_key, table, engine, limit=5):
+    """Cheapest prices per chain for a normalized product key, among chains that listed it this week."""
+    query = text(f"""
+                 SELECT store_chain, product_name, price, unit, since_week
+                 FROM {table}
+                 WHERE product_key = :product_key
+                   AND last_seen_week >= CAST(date_trunc('week', NOW()) AS DATE)
+                 ORDER BY price
+                 LIMIT :limit
+                 """)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(query, {"product_key": product_key, "limit": limit}).fetchall()
+    except Exception as e:
+        log("db", f"Error getting cheapest prices: {e}", error=True, call="get_cheapest_current_prices")
+        return None
+
+
+@timed("db")
+def get_cheapest_per_unit(product_key, base_unit, table, engine, limit=5):
+    """
+    Cheapest current prices per kg, litre or item for a normalized product
+    key across chains, an index scan on (product_key, base_unit, unit_price).
+    """
+    query = text(f"""
+                 SELECT store_chain, product_name, price, unit, unit_price, base_unit
+                 FROM {table}
+                 WHERE product_key = :product_key
+                   AND base_unit = :base_unit
+                   AND unit_price IS NOT NULL
+                   AND last_seen_week >= CAST(date_trunc('week', NOW()) AS DATE)
+                 ORDER BY unit_price
+                 LIMIT :limit
+                 """)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                query, {"product_key": product_key, "base_unit": base_unit, "limit": limit}
+            ).fetchall()
+    except Exception as e:
+        log("db", f"Error getting cheapest unit prices: {e}", error=True, call="get_cheapest_per_unit")
+        return None
+
+
+@timed("db")
+def get_products_without_unit_price(table, engine, after_id=None, limit=1000):
+    query = text(f"""
+                 SELECT product_id, price, unit
+                 FROM {table}
+                 WHERE unit_price IS NULL AND (CAST(:after_id AS INT) IS NULL OR product_id > :after_id)
+                 ORDER BY product_id
+                 LIMIT :limit
+                 """)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(query, {"after_id": after_id, "limit": limit}).fetchall()
+    except Exception as e:
+        log("db", f"Error getting products without unit price: {e}", error=True, call="get_products_without_unit_price")
+        return None
+
+
+@timed("db")
+def update_unit_prices(products, table, engine):
+    """Sets unit_price and base_unit of many products in one UPDATE ... FROM (VALUES ...)."""
+    if not products:
+        return
+    values = []
+    params = {}
+    for i, product in enumerate(products):
+        values.append(f"(CAST(:product_id_{i} AS INT), CAST(:unit_price_{i} AS NUMERIC(12,4)), :base_unit_{i})")
+        params.update({f"{key}_{i}": product[key] for key in ("product_id", "unit_price", "base_unit")})
+    query = text(f"""
+                 UPDATE {table} p
+                 SET unit_price = v.unit_price, base_unit = v.base_unit
+                 FROM (VALUES {", ".join(values)}) AS v (product_id, unit_price, base_unit)
+                 WHERE p.product_id = v.product_id
+                 """)
+    try:
+        with engine.begin() as connection:
+            connection.execute(query, params)
+    except Exception as e:
+        log("db", f"Error updating unit prices: {e}", error=True, call="update_unit_prices")
+
+
+@timed("db")
+def get_price_trend(product_key, table, engine, store_chain=None):
+    """Price change points for a normalized product key, oldest first."""
+    chain_filter = "AND store_chain = :store_chain" if store_chain else ""
+    query = text(f"""
+                 SELECT flyer_week, store_chain, price, unit
+                 FROM {table}
+                 WHERE product_key = :product_key {chain_filter}
+                 ORDER BY flyer_week
+                 """)
+    try:
+        with engine.connect() as connection:
+            return connection.execute(query, {"product_key": product_key, "store_chain": store_chain}).fetchall()
+    except Exception as e:
+        log("db", f"Error getting price trend: {e}", error=True, call="get_price_trend")
+        return None
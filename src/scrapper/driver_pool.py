@@ -0,0 +1,178 @@
+from queue import Queue, Empty
+from contextlib import contextmanager
+import threading
+
+from .instrumentation import log
+
+
+class DriverPoolExhausted(RuntimeError):
+    """No driver came back to the pool within its checkout timeout."""
+
+
+class DriverPool:
+    """
+    Bounded pool of long-lived WebDriver sessions shared by item workers.
+
+    Workers check a driver out with `with pool.driver() as driver:` and it goes
+    back to the pool when the block exits. A driver is recycled (quit and
+    replaced on next demand) once it has served `max_pages` checkouts, when it
+    fails the health check, or when the block raises a WebDriver error.
+    """
+
+    def __init__(self, driver_factory, size=4, max_pages=200, checkout_timeout=120):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._pages = {}
+        self._closed = False
+
+        self.stats = {"created": 0, "recycled": 0, "crashed": 0, "checkouts": 0, "exhausted": 0}
+
+    def _create(self):
+        driver = self.driver_factory()
+        with self._lock:
+            self._pages[id(driver)] = 0
+            self.stats["created"] += 1
+        return driver
+
+    def _discard(self, driver, reason):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+            self._live -= 1
+            self.stats[reason] += 1
+        try:
+            driver.quit()
+        except Exception as e:
+            log("driver_pool", f"Error quitting recycled driver: {e}", error=True)
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _checkout(self):
+        if self._closed:
+            raise RuntimeError("Driver pool is closed")
+
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except Empty:
+                with self._lock:
+                    can_create = self._live < self.size
+                    if can_create:
+                        self._live += 1
+
+                if can_create:
+                    try:
+                        return self._create()
+                    except Exception:
+                        with self._lock:
+                            self._live -= 1
+                        raise
+
+                try:
+                    driver = self._idle.get(timeout=self.checkout_timeout)
+                except Empty:
+                    with self._lock:
+                        self.stats["exhausted"] += 1
+                    raise DriverPoolExhausted(
+                        f"No driver free after {self.checkout_timeout}s, all {self.size} are checked out"
+                    ) from None
+
+            if self._is_healthy(driver):
+                return driver
+            log("driver_pool", "Pooled driver failed health check, replacing it")
+            self._discard(driver, "crashed")
+
+    def _checkin(self, driver, crashed=False):
+        with self._lock:
+            self.stats["checkouts"] += 1
+            pages = self._pages.get(id(driver), 0) + 1
+            self._pages[id(driver)] = pages
+
+        if crashed:
+            self._discard(driver, "crashed")
+        elif pages >= self.max_pages or self._closed:
+            self._discard(driver, "recycled")
+        else:
+            self._idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        driver = self._checkout()
+        crashed = False
+        try:
+            yield driver
+        except Exception as e:
+            crashed = _is_webdriver_error(e)
+            raise
+        finally:
+            self._checkin(driver, crashed=crashed)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(driver, "recycled")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class LazyDriver:
+    """
+    Stands in for a WebDriver that is only started on first use, for backends
+    that reach Selenium only when their API falls back. quit() does nothing
+    when the driver was never started.
+    """
+
+    def __init__(self, driver_factory):
+        self.driver_factory = driver_factory
+        self._driver = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._driver is not None
+
+    def __getattr__(self, name):
+        with self._lock:
+            if self._driver is None:
+                log("driver_pool", "Starting the main driver for a Selenium fallback")
+                self._driver = self.driver_factory()
+        return getattr(self._driver, name)
+
+    def quit(self):
+        with self._lock:
+            driver, self._driver = self._driver, None
+        if driver is not None:
+            driver.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.quit()
+
+
+def _is_webdriver_error(error):
+    try:
+        from selenium.common.exceptions import WebDriverException, TimeoutException
+    except ImportError:
+        return False
+    # A TimeoutException only means the page was slow; the session is still fine
+    return isinstance(error, WebDriverException) and not isinstance(error, TimeoutException)
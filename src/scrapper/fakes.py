@@ -0,0 +1,113 @@
+"""
+In-process stand-ins for Google Cloud Storage and the Gemini model, so the
+vision path can run (and be exercised concurrently) without any GCP access.
+"""
+import threading
+import hashlib
+import json
+import time
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_file(self, file_obj, content_type=None):
+        self.bucket._store(self.name, file_obj.read())
+
+    def delete(self):
+        self.bucket._remove(self.name)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, blob_name):
+        return FakeBlob(self, blob_name)
+
+    def delete_blobs(self, blobs, on_error=None):
+        for blob in blobs:
+            self._remove(blob.name, on_error)
+
+    def _store(self, blob_name, data):
+        with self.client._lock:
+            if (self.name, blob_name) in self.client.objects:
+                self.client.overwrites += 1
+            self.client.objects[(self.name, blob_name)] = data
+            self.client.uploads += 1
+            self.client.max_live_objects = max(self.client.max_live_objects, len(self.client.objects))
+
+    def _remove(self, blob_name, on_error=None):
+        with self.client._lock:
+            if self.client.objects.pop((self.name, blob_name), None) is None:
+                if on_error is None:
+                    raise KeyError(blob_name)
+                on_error(blob_name)
+            else:
+                self.client.deletes += 1
+
+
+class FakeStorageClient:
+    """Keeps uploaded objects in memory and counts overwrites, which concurrent callers must never cause."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.objects = {}
+        self.uploads = 0
+        self.deletes = 0
+        self.overwrites = 0
+        self.max_live_objects = 0
+
+    def bucket(self, bucket_name):
+        return FakeBucket(self, bucket_name)
+
+
+class FakePart:
+    """What the mock model gets instead of a vertexai Part."""
+
+    def __init__(self, image_url, data=None, uri=None):
+        self.image_url = image_url
+        self.data = data
+        self.uri = uri
+
+
+class MockResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class MockVisionModel:
+    """
+    Offline stand-in for GenerativeModel. Answers with the canned response for
+    the image URL (or sha256 of the image bytes), or with a "not an item"
+    answer for unknown images. `latency` simulates the model round trip.
+    """
+
+    def __init__(self, responses=None, latency=0.0):
+        self.responses = responses or {}
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def generate_content(self, contents, generation_config=None):
+        image_part, prompt = contents
+        with self._lock:
+            self.calls.append(image_part.image_url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            image_hash = hashlib.sha256(image_part.data).hexdigest() if image_part.data else None
+            response = self.responses.get(image_part.image_url, self.responses.get(image_hash))
+            if response is None:
+                response = {"is_item": False, "name": None, "price": None, "unit": None}
+            return MockResponse(response if isinstance(response, str) else json.dumps(response))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,162 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import datetime
+import threading
+import os
+import re
+
+from .locations import DEFAULT_LOCATION
+from .instrumentation import log
+
+# JSON API the flipp.com web app calls to render flyer and item pages.
+# Point FLIPP_API_BASE at a local stand-in to replay recorded responses.
+FLIPP_API_BASE = os.getenv("FLIPP_API_BASE", "https://backflipp.wishabi.com/flipp")
+FLYERS_PATH = "/data"
+FLYER_PATH = "/flyers/{flyer_id}"
+ITEM_PATH = "/items/{item_id}"
+
+FETCHER_BACKENDS = ["selenium", "http"]
+
+
+class HttpFetcher:
+    """
+    Reads flyer listings, flyer items and item details from the flipp JSON API
+    over a pooled keep-alive session.
+
+    Every method returns None when the data can't be resolved so callers can
+    fall back to rendering the page with Selenium.
+    """
+    name = "http"
+
+    def __init__(self, api_base=FLIPP_API_BASE, postal_code=DEFAULT_LOCATION.postal_code, locale="en-ca",
+                 pool_size=8, timeout=10, retries=2):
+        self.api_base = api_base.rstrip("/")
+        self.postal_code = postal_code
+        self.locale = locale
+        self.timeout = timeout
+
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "resolved": 0, "unresolved": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _get_json(self, path, **params):
+        params = {"locale": self.locale, "postal_code": self.postal_code, **params}
+        self._count("requests")
+        try:
+            response = self.session.get(f"{self.api_base}{path}", params=params, timeout=self.timeout)
+            if response.status_code != 200:
+                log("fetcher", f"Fetcher got status {response.status_code} for {path}", error=True)
+                return None
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            log("fetcher", f"Fetcher error for {path}: {e}", error=True)
+            return None
+
+    def _resolved(self, value):
+        self._count("resolved" if value else "unresolved")
+        return value
+
+    def get_flyer_listings(self, category="Groceries", postal_code=None, locale=None):
+        """Returns [{"flyer_id", "store_chain", "valid_until"}] for the grocery flyers at a postal code (the fetcher's by default)."""
+        data = self._get_json(FLYERS_PATH, postal_code=postal_code or self.postal_code, locale=locale or self.locale)
+        if not data or "flyers" not in data:
+            return self._resolved(None)
+
+        listings = []
+        for flyer in data["flyers"]:
+            if category and category not in (flyer.get("categories") or []):
+                continue
+            listings.append({
+                "flyer_id": int(flyer["id"]),
+                "store_chain": flyer.get("merchant"),
+                "valid_until": parse_api_date(flyer.get("valid_to")),
+            })
+        return self._resolved(listings)
+
+    def get_flyer_items(self, flyer_id):
+        """
+        Returns the flyer items as dicts keyed like the item-container tags
+        ("itemid", "aria-label") so they can go through process_item unchanged.
+        """
+        data = self._get_json(FLYER_PATH.format(flyer_id=flyer_id))
+        if not data:
+            return self._resolved(None)
+
+        items = data.get("items") if isinstance(data, dict) else data
+        if not items:
+            return self._resolved(None)
+
+        return self._resolved([
+            {"itemid": str(item["id"]), "aria-label": item.get("name")}
+            for item in items
+            if item.get("id") is not None
+        ])
+
+    def get_item(self, product_id):
+        """
+        Returns {"product_image_url", "price", "unit", "product_name"} for an item.
+        Price is None for image only items, which still go to vision with the image URL.
+        """
+        data = self._get_json(ITEM_PATH.format(item_id=product_id))
+        item = data.get("item") if data else None
+        if not item:
+            return self._resolved(None)
+
+        image_url = item.get("cutout_image_url") or item.get("large_image_url") or item.get("image_url")
+        price = item.get("current_price")
+        if price is None and image_url is None:
+            return self._resolved(None)
+
+        return self._resolved({
+            "product_image_url": image_url,
+            "price": str(price) if price is not None else None,
+            "unit": parse_api_unit(item.get("post_price_text"), item.get("pre_price_text")),
+            "product_name": item.get("name"),
+        })
+
+    def close(self):
+        self.session.close()
+
+
+def parse_api_unit(post_price_text, pre_price_text=None):
+    """
+    Turns the API price suffix ("/lb", "ea.", "") into the unit stored in the
+    product table. A multi-buy prefix ("2/", "2 for") on a per item price is
+    stored as "2 units", the same form the vision prompt gives.
+    """
+    unit = (post_price_text or "").strip().lstrip("/").strip()
+    if unit == "" or unit.lower() in ("ea", "ea.", "each"):
+        unit = "each"
+    multi_buy = re.match(r"^\s*(\d+)\s*(?:/|for\b)", pre_price_text or "", re.IGNORECASE)
+    if multi_buy and int(multi_buy.group(1)) > 1 and unit == "each":
+        return f"{multi_buy.group(1)} units"
+    return unit
+
+
+def parse_api_date(date_str):
+    if not date_str:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(date_str).date()
+    except ValueError:
+        return None
+
+
+def get_fetcher(backend, **kwargs):
+    """Returns the fast-path fetcher for a backend name, None means Selenium only."""
+    if backend == "selenium":
+        return None
+    if backend == "http":
+        return HttpFetcher(**kwargs)
+    raise ValueError(f"Unknown fetcher backend: {backend}")
@@ -0,0 +1,187 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from bs4 import BeautifulSoup, SoupStrainer
+import importlib.util
+import multiprocessing
+import datetime
+import threading
+import os
+import re
+
+from .instrumentation import log, timer
+from .retry import DEFAULT_RETRY_POLICY
+
+# lxml builds its tree in C, html.parser is the pure Python fallback
+HTML_PARSER = os.getenv("HTML_PARSER") or ("lxml" if importlib.util.find_spec("lxml") else "html.parser")
+
+
+class FlyerPage:
+    """What the scraper needs from a flyer page, parsed once."""
+
+    def __init__(self, flyer_id, end_date, store_chain, items):
+        self.flyer_id = flyer_id
+        self.end_date = end_date
+        self.store_chain = store_chain
+        # Plain dicts keyed like the item-container attributes, so the soup can be freed
+        self.items = items
+
+
+def parse_end_date(date_str):
+    """Parse the end date from a validity string."""
+    # Example date string: "Valid Aug 29, 2024 – Sep 4, 2024"
+    match = re.search(r'Valid \w+ \d{1,2}, \d{4} – (\w+ \d{1,2}, \d{4})', date_str)
+    if match:
+        end_date_str = match.group(1)
+        try:
+            end_date = datetime.datetime.strptime(end_date_str, "%b %d, %Y").date()
+            return end_date
+        except ValueError as e:
+            log("page_parse", f"Date parsing error: {e}", error=True, parser="parse_end_date")
+            return None
+    return None
+
+
+def select(page_source, targets):
+    """
+    The elements of a page source matching each (tag, class name or None)
+    target, one list per target. Flipp pages are mostly inline CSS and JS:
+    with lxml only the matches become Python objects, with html.parser the
+    soup is restricted to the target tags. Elements answer .get(attribute).
+    """
+    if HTML_PARSER == "lxml":
+        import lxml.html
+
+        root = lxml.html.fromstring(page_source)
+        return [
+            root.xpath(f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+                       if class_name else f"//{tag}")
+            for tag, class_name in targets
+        ]
+    class_names = [class_name for _, class_name in targets]
+    strainer = SoupStrainer(class_=class_names) if all(class_names) else SoupStrainer([tag for tag, _ in targets])
+    soup = BeautifulSoup(page_source, HTML_PARSER, parse_only=strainer)
+    return [soup.find_all(tag, class_=class_name) if class_name else soup.find_all(tag) for tag, class_name in targets]
+
+
+def element_text(element):
+    """An element's text with every string stripped, as BeautifulSoup's get_text(strip=True) gives it."""
+    if hasattr(element, "get_text"):
+        return element.get_text(strip=True)
+    return "".join(string.strip() for string in element.itertext())
+
+
+def parse_flyer_page(flyer_id, page_source):
+    validity_elements, subtitle_elements, item_elements = select(
+        page_source, [("span", "validity"), ("span", "subtitle"), ("a", "item-container")]
+    )
+    end_date = parse_end_date(element_text(validity_elements[0])) if validity_elements else None
+    store_chain = element_text(subtitle_elements[0]) if subtitle_elements else "Unknown Store"
+
+    items = [{"itemid": item.get("itemid"), "aria-label": item.get("aria-label")} for item in item_elements]
+    return FlyerPage(flyer_id, end_date, store_chain, items)
+
+
+def parse_homepage_listings(page_source):
+    """The flyers listed on a homepage, as [{"flyer_id", "store_chain", "valid_until"}] with the last two None."""
+    listing_elements, = select(page_source, [("flipp-flyer-listing-item", None)])
+    return [
+        {"flyer_id": int(item.get("flyer-id")), "store_chain": None, "valid_until": None}
+        for item in listing_elements
+        if item.get("flyer-id") is not None
+    ]
+
+
+_parse_executor = None
+
+
+def create_parse_executor(max_workers=2):
+    """
+    Process pool that parses page sources, so parsing doesn't hold the GIL
+    the item and vision threads need. None (parse in the calling thread) for 0 workers.
+    """
+    if not max_workers:
+        return None
+    # Spawned, not forked: the scraper process runs Chrome sessions and many threads
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def set_parse_executor(executor):
+    global _parse_executor
+    _parse_executor = executor
+
+
+def parse_page(parse, *args):
+    """Runs one of the parse functions above on the parse executor, or in this thread when there is none."""
+    executor = _parse_executor
+    with timer("page_parse", parser=parse.__name__):
+        if executor is not None:
+            try:
+                return executor.submit(parse, *args).result()
+            except BrokenProcessPool as e:
+                log("page_parse", f"Parse pool broke ({e}), parsing in the calling thread", error=True,
+                    parser=parse.__name__)
+                set_parse_executor(None)
+        return parse(*args)
+
+
+def load_flyer_page(driver, flyer_id, flyer_url, timeout=10):
+    # Selenium is imported here, the parse workers only need the parse functions
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
+    with timer("driver_get", page="flyer"):
+        driver.get(flyer_url)
+    with timer("driver_wait", page="flyer"):
+        # The validity span can render after the items, the parsed page is cached for the whole run
+        WebDriverWait(driver, timeout).until(EC.all_of(
+            EC.presence_of_element_located((By.CLASS_NAME, "item-container")),
+            EC.presence_of_element_located((By.CSS_SELECTOR, "span.validity"))
+        ))
+    return parse_page(parse_flyer_page, flyer_id, driver.page_source)
+
+
+class FlyerPageCache:
+    """
+    Per-run cache of parsed flyer pages so discovery (end date, store chain)
+    and item listing share one page load. Entries are evicted once the
+    flyer's items are queued.
+    """
+
+    def __init__(self, retry_policy=DEFAULT_RETRY_POLICY):
+        self.retry_policy = retry_policy
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "failures": 0}
+
+    def get(self, driver, flyer_id, flyer_url):
+        """Returns the FlyerPage, or None when the page could not be loaded within the retry policy."""
+        with self._lock:
+            page = self._pages.get(flyer_id)
+            if page is not None:
+                self.stats["hits"] += 1
+                return page
+
+        try:
+            page = self.retry_policy.call(
+                load_flyer_page, driver, flyer_id, flyer_url,
+                description=f"loading flyer page {flyer_url}"
+            )
+        except Exception as e:
+            log("flyer_page", f"Giving up on flyer page {flyer_url}: {e}", error=True)
+            with self._lock:
+                self.stats["failures"] += 1
+            return None
+
+        with self._lock:
+            self.stats["loads"] += 1
+            self._pages[flyer_id] = page
+        return page
+
+    def evict(self, flyer_id):
+        with self._lock:
+            self._pages.pop(flyer_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -1,41 +1,81 @@
-from selenium import webdriver
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException
-from bs4 import BeautifulSoup
-from googletrans import Translator
-import re
-from .vertexai import get_flyer_image_infos
+from .vertexai import get_flyer_image_infos, create_vision_executor, blob_janitor, scheduler as vision_scheduler
 from .database import *
-import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from .driver_pool import DriverPool, DriverPoolExhausted, LazyDriver
+from .fetchers import FETCHER_BACKENDS, get_fetcher
+from .flyer_pages import FlyerPageCache, create_parse_executor, parse_homepage_listings, parse_page, set_parse_executor
+from .vision_cache import VisionResultCache
+from .product_writer import ProductWriter
+from .run_journal import RUN_JOURNAL_PATH, RESOLVED, IMAGE_QUEUED, RunJournal
+from .translation import TRANSLATOR_BACKENDS, create_translation_service, get_translation_service, set_translation_service
+from .pipeline import Pipeline
+from .instrumentation import (
+    METRICS_FILE, METRICS_LOG, METRICS_PORT, Instrumentation, get_instrumentation, log, set_instrumentation, timer
+)
+from .image_store import IMAGE_CACHE_MAX_BYTES, ImageStore, get_image_store, set_image_store
+from .image_filter import (
+    PREFILTER_MODE, PREFILTER_MODES, PREFILTER_THRESHOLD, ImagePrefilter, get_image_prefilter, set_image_prefilter
+)
+from .locations import (
+    DEFAULT_LOCATION, SINGLE_SHARD, Shard, flyer_url as build_flyer_url, homepage_url as build_homepage_url,
+    item_url, load_locations, location_from_flyer_url, merge_flyer_listings
+)
+import argparse
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
-engine = get_sql_engine_from_env()
+# Created on first use, so importing the scraper (or a dry run) doesn't build a connection pool
+engine = None
+vision_cache = None
+product_writer = None
+_database_lock = threading.Lock()
+
+
+def _build_database(pool_size=None, max_overflow=None):
+    global engine, vision_cache, product_writer
+    engine = get_sql_engine_from_env(pool_size=pool_size, max_overflow=max_overflow)
+    vision_cache = VisionResultCache(engine=engine)
+    product_writer = ProductWriter(engine=engine, table="product")
+
+
+def configure_database(pool_size, max_overflow=None):
+    """Rebuilds the engine (and what holds on to it) with a pool sized for this run's workers."""
+    with _database_lock:
+        if engine is not None:
+            engine.dispose()
+        _build_database(pool_size, max_overflow)
+
+
+def get_engine():
+    with _database_lock:
+        if engine is None:
+            _build_database()
+        return engine
+
+
+def get_vision_cache():
+    get_engine()
+    return vision_cache
+
+
+def get_product_writer():
+    get_engine()
+    return product_writer
 
 def get_english_name(name: str) -> str:    
     if "|" in name:
         return name.split("|")[1].strip().title()
     
-    translator = Translator()
-    max_retries = 3
-    
-    for i in range(max_retries):
-        try:
-            english_name = translator.translate(name, src="fr", dest="en").text
-            return " ".join(word.capitalize() for word in re.split(r"\s+", english_name.strip()))
-        except AttributeError:
-            print(f"Translation failed for '{name}'. Retrying...")
-        except Exception as e:
-            print(f"Unexpected error during translation: {e}")
-    
-    # If all retries fail, return the original name
-    print(f"Translation failed after {max_retries} attempts. Returning original name.")
-    return name
+    with timer("translate"):
+        return get_translation_service().translate(name)
 
 
 def setup_chrome_driver():
+    from selenium import webdriver
+
     chrome_options = webdriver.ChromeOptions()
     chrome_options.add_argument("--headless=new")
     chrome_options.add_argument("--disable-gpu")
@@ -44,110 +84,156 @@ def setup_chrome_driver():
     chrome_options.add_argument(
         "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.81 Safari/537.36"
     )
-    driver = webdriver.Chrome(options=chrome_options)
+    with timer("chrome_startup"):
+        driver = webdriver.Chrome(options=chrome_options)
     return driver
 
 
-def get_product_image_url(driver, product_url, retries=2):
-    for attempt in range(retries):
-        try:
-            driver.get(product_url)
-            WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div.item-info-image img'))
-            )
-            item_image_url = driver.find_element(By.CSS_SELECTOR, 'div.item-info-image img').get_attribute('src')
-            return item_image_url
-        except Exception as e:
-            print(f"Error retrieving image URL from {product_url}: {e}. Retrying ({attempt + 1}/{retries})...")
-    return None  
-
-
 def handle_image_only_item(product_image_url):
-    try:
-        print(f"{product_image_url} is an image only item")
-        item_name, price, unit = get_flyer_image_infos(product_image_url)
-        return item_name, price, unit
-    except Exception as e:
-        print(f"Could not process image: {e}")
-        return None, None, None
+    log("item", f"{product_image_url} is an image only item")
+    item_name, price, unit = get_flyer_image_infos(product_image_url, cache=get_vision_cache())
+    return item_name, price, unit
+
+
+def get_item_url(product_id, location=DEFAULT_LOCATION):
+    return item_url(location, product_id)
+
+
+# Reads everything the item page gives us in one round trip from the live DOM
+ITEM_SNAPSHOT_SCRIPT = """
+const image = document.querySelector('div.item-info-image img');
+const price = document.querySelector('flipp-price');
+const unit = document.querySelector('.price-text');
+const title = document.querySelector('meta[property="og:title"]');
+return {
+    product_image_url: image ? image.src : null,
+    price: price ? (price.getAttribute('value') || price.value || null) : null,
+    unit: unit ? unit.textContent.trim() : null,
+    product_name: title ? title.content : null
+};
+"""
+
+
+class item_page_ready:
+    """
+    Wait condition that returns the item snapshot once the item image has
+    rendered and either the price is there or `price_grace` seconds have passed
+    since the image showed up (image only items never get a price element).
+    """
+    def __init__(self, price_grace=1.0):
+        self.price_grace = price_grace
+        self.image_seen_at = None
+
+    def __call__(self, driver):
+        snapshot = driver.execute_script(ITEM_SNAPSHOT_SCRIPT)
+        if not snapshot or not snapshot["product_image_url"]:
+            return False
+        if snapshot["price"] is not None:
+            return snapshot
 
+        now = time.perf_counter()
+        if self.image_seen_at is None:
+            self.image_seen_at = now
+        return snapshot if now - self.image_seen_at >= self.price_grace else False
 
-def fetch_item_price_and_unit(driver, product_url):
-    driver.get(product_url)
-    price_class = "flipp-price"
-    unit_class = ".price-text"
 
-    wait = WebDriverWait(driver, 5)
-    element = wait.until(
-        EC.presence_of_element_located((By.CSS_SELECTOR, price_class))
-    )
+def extract_item_details(driver, product_url, timeout=10, retries=2):
+    """
+    Loads an item page once and returns {"product_image_url", "price", "unit",
+    "product_name", "timings"}, price is None for image only items.
+    """
+    from selenium.webdriver.support.ui import WebDriverWait
 
-    price = driver.find_element(By.CSS_SELECTOR, price_class).get_attribute("value")
+    for attempt in range(retries):
+        try:
+            start = time.perf_counter()
+            with timer("driver_get", page="item"):
+                driver.get(product_url)
+            loaded = time.perf_counter()
+            with timer("driver_wait", page="item"):
+                details = WebDriverWait(driver, timeout, poll_frequency=0.2).until(item_page_ready())
+            done = time.perf_counter()
+        except Exception as e:
+            log("item_page", f"Error loading item page {product_url}: {e}. Retrying ({attempt + 1}/{retries})...",
+                error=True)
+            continue
 
-    unit_element = wait.until(
-        EC.presence_of_element_located(
-            (By.CSS_SELECTOR, unit_class)
-        )  
-    )
-    unit = unit_element.text.strip()
-    
-    if unit is None or unit == "":
-        unit = "each"
+        if not details["unit"]:
+            details["unit"] = "each"
+        details["timings"] = {"load": loaded - start, "wait": done - loaded, "total": done - start}
+        return details
+    return None
 
-    return price, unit
 
+def get_store_chain_name(driver, flyer_id, flyer_url, flyer_pages):
+    flyer_page = flyer_pages.get(driver, flyer_id, flyer_url)
+    if flyer_page is None:
+        log("flyer_page", f"Error, can't find store chain name: {flyer_url}", error=True)
+        return "Unknown Store"
+    return flyer_page.store_chain
 
-def get_store_chain_name(driver, flyer_url):
-    driver.get(flyer_url)
-    try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "item-container"))
-        )
-    except Exception as e:
-        print(f"Error, can't find store chain name: {flyer_url}: {e}")
-        get_store_chain_name(driver, flyer_url)
-        return
-    
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    subtitle_element = soup.find("span", class_="subtitle")
-    store_chain_name = (
-        subtitle_element.get_text(strip=True) if subtitle_element else "Unknown Store"
-    )
-    return store_chain_name
+
+BULLSHIT_WORDS = ["Ajoutez", "Ecom", "economies", "Moi", "Format econo"]
 
 
 def get_item_name(item):
-    bullshit_words = ["Ajoutez", "Ecom", "economies", "Moi", "Format econo"]
     name_class = "aria-label"
     
     item_name = item.get(name_class)
-    if item_name not in bullshit_words and item_name:
+    if item_name not in BULLSHIT_WORDS and item_name:
         item_name = get_english_name(item_name)
         
     return item_name
 
 
-def process_item(item, flyer_id):
-    product_id = item.get("itemid")
-    if product_id is None:
-        return False  # Skip if no product_id
+def prefetch_item_names(items):
+    """Translates a flyer's item names in batches before the workers ask for them one by one."""
+    names = [item.get("aria-label") for item in items]
+    get_translation_service().prefetch(
+        name for name in names
+        if name and name not in BULLSHIT_WORDS and "|" not in name
+    )
 
-    driver = setup_chrome_driver()
-    product_url = f"https://flipp.com/en-ca/pierrefonds-qc/item/{product_id}?postal_code=H8Y3P2"
-    product_image_url = get_product_image_url(driver, product_url)
 
-    try:
-        price, unit = fetch_item_price_and_unit(driver, product_url)
-        product_name = get_item_name(item)
-    except Exception:
+def resolve_item(item, details):
+    """Turns item page details into (name, price, unit, image url), sending image only items to vision."""
+    product_image_url = details["product_image_url"]
+    if details["price"] is None:
         product_name, price, unit = handle_image_only_item(product_image_url)
-        if product_name is None or float(price) <= 0:
-            driver.quit()
-            return False  # Skip invalid items
-        
-    print(f"Processed item - ID: {product_id}, Name: {product_name}, Price: {price}, Unit: {unit}, URL: {product_url}")
-    product_infos = {
-        "product_id": product_id,
+    else:
+        price, unit = details["price"], details["unit"]
+        product_name = get_item_name(item) or details["product_name"]
+
+    return product_name, price, unit, product_image_url
+
+
+def scrape_item_with_driver(item, pool, product_url):
+    try:
+        with pool.driver() as driver:
+            details = extract_item_details(driver, product_url)
+    except DriverPoolExhausted as e:
+        # Like a page that didn't load, the item is failed and retried
+        log("item_page", f"Item {item.get('itemid')} not scraped: {e}", error=True)
+        return None
+    if details is None:
+        return None
+
+    timings = details["timings"]
+    log("item_page", f"Item {item.get('itemid')} page load {timings['load']:.2f}s, "
+                     f"wait {timings['wait']:.2f}s, total {timings['total']:.2f}s")
+    return details
+
+
+def build_product_row(item, flyer_id, product_url, details):
+    """The item's product row, None when it has no name or price. Raises when the item can't be resolved."""
+    product_name, price, unit, product_image_url = resolve_item(item, details)
+    if product_name is None or price is None or float(price) <= 0:
+        return None
+
+    log("item", f"Processed item - ID: {item.get('itemid')}, Name: {product_name}, Price: {price}, "
+                f"Unit: {unit}, URL: {product_url}")
+    return {
+        "product_id": item.get("itemid"),
         "product_name": product_name,
         "price": price,
         "unit": unit,
@@ -155,157 +241,677 @@ def process_item(item, flyer_id):
         "product_image_url": product_image_url,
         "flyer_id": flyer_id
     }
-    
-    insert_product_record(
-        product_infos=product_infos,
-        table="product",
-        engine=engine
-    )
-    
-    driver.quit()
-    return True
-    
 
-def extract_item_infos(driver, flyer_url, flyer_id, retries=2):
-    driver.get(flyer_url)
+
+def store_item(item, flyer_id, product_url, details, journal=None):
+    product_id = item.get("itemid")
     try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "item-container"))
-        )
+        product_infos = build_product_row(item, flyer_id, product_url, details)
     except Exception as e:
-        print(f"Error, can't find items in flyer: {flyer_url}: {e}")
-        if retries > 0:
-            retries -= 1
-            return extract_item_infos(driver, flyer_url, flyer_id, retries)
-        else:
-            return False
-        
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    items = soup.find_all("a", class_="item-container")
-    print(f"Found {len(items)} from flyer {flyer_url}")
-
-    num_items = 0
-
-    # Using ThreadPoolExecutor for multithreading
-    with ThreadPoolExecutor(max_workers = 1) as executor:  # Adjust max_workers based on your requirements
-        futures = {executor.submit(process_item, item, flyer_id): item for item in items}
-        
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Items"):
-            result = future.result()
-            if result:
-                num_items += 1
+        log("item", f"Could not resolve item {product_id}: {e}", error=True)
+        if journal:
+            journal.mark_failed(flyer_id, product_id, str(e))
+        return False
+
+    if product_infos is None:
+        if journal:
+            journal.mark_skipped(flyer_id, product_id, "no name or price")
+        return False  # Skip invalid items
     
-    print(f"Retrieved infos for all {num_items} items on flyer")
+    get_product_writer().add(product_infos)
+    if journal:
+        journal.mark_resolved(flyer_id, product_id, product_infos)
     return True
 
 
-def parse_end_date(date_str):
-    """Parse the end date from a validity string."""
-    # Example date string: "Valid Aug 29, 2024 – Sep 4, 2024"
-    match = re.search(r'Valid \w+ \d{1,2}, \d{4} – (\w+ \d{1,2}, \d{4})', date_str)
-    if match:
-        end_date_str = match.group(1)
-        try:
-            end_date = datetime.datetime.strptime(end_date_str, "%b %d, %Y").date()
-            return end_date
-        except ValueError as e:
-            print(f"Date parsing error: {e}")
-            return None
-    return None
+def process_item(item, flyer_id, pool, fetcher=None, vision_executor=None, journal=None, location=DEFAULT_LOCATION):
+    """
+    Returns True/False for items resolved from the page, or a Future of the
+    same when an image only item was handed to the vision executor.
+    """
+    product_id = item.get("itemid")
+    if product_id is None:
+        return False  # Skip if no product_id
 
+    product_url = get_item_url(product_id, location)
+
+    # The fast path resolves most items; Selenium only renders the ones it can't
+    details = fetcher.get_item(product_id) if fetcher else None
+    if details is None:
+        details = scrape_item_with_driver(item, pool, product_url)
+    if details is None:
+        if journal:
+            journal.mark_failed(flyer_id, product_id, "item page did not load")
+        return False
+
+    # Vision is slow and rate limited, so it never holds up a driver or an item worker
+    if details["price"] is None and vision_executor is not None:
+        if journal:
+            journal.mark_image_queued(flyer_id, product_id, details)
+        return vision_executor.submit(store_item, item, flyer_id, product_url, details, journal)
+    return store_item(item, flyer_id, product_url, details, journal)
+    
 
-def fetch_flyer_page(driver, flyer_url):
-    driver.get(flyer_url)
-    try:
-        WebDriverWait(driver, 5).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "validity"))
-        )
-    except Exception as e:
-        print(f"Error occured when fetching flyer page: {e}")
-        flyer_html = fetch_flyer_page(driver, flyer_url)
+def list_flyer_items(driver, flyer_url, flyer_id, flyer_pages, fetcher=None):
+    items = fetcher.get_flyer_items(flyer_id) if fetcher else None
+    if items is not None:
+        return items
+
+    flyer_page = flyer_pages.get(driver, flyer_id, flyer_url)
+    if flyer_page is None:
+        log("flyer_page", f"Error, can't find items in flyer: {flyer_url}", error=True)
+        return None
+    return flyer_page.items
+
+
+def process_items(items, flyer_id, pool, max_workers=1, fetcher=None, vision_executor=None, journal=None,
+                  queued_images=(), location=DEFAULT_LOCATION):
+    """
+    Runs items through process_item and waits for their image only items,
+    along with `queued_images` ((item, details) a previous run had handed to
+    vision). Returns the number of items resolved.
+    """
+    num_items = 0
+    vision_futures = []
+    for item, details in queued_images:
+        product_url = get_item_url(item.get("itemid"), location)
+        if vision_executor is not None:
+            vision_futures.append(vision_executor.submit(store_item, item, flyer_id, product_url, details, journal))
+        elif store_item(item, flyer_id, product_url, details, journal):
+            num_items += 1
+
+    # Workers share the driver pool, so max_workers should not exceed the pool size
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(process_item, item, flyer_id, pool, fetcher, vision_executor, journal, location): item
+            for item in items
+        }
         
-    flyer_html = BeautifulSoup(driver.page_source, "html.parser")
-    return flyer_html
-
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Items"):
+            try:
+                result = future.result()
+            except Exception as e:
+                item = futures[future]
+                log("item", f"Error processing item {item.get('itemid')}: {e}", error=True)
+                if journal:
+                    journal.mark_failed(flyer_id, item.get("itemid"), str(e))
+                continue
+            if isinstance(result, Future):
+                vision_futures.append(result)
+            elif result:
+                num_items += 1
 
-def extract_flyer_end_date(item, driver, flyer_url):
-    flyer_html = fetch_flyer_page(driver, flyer_url)
-    validity_element = flyer_html.find("span", class_="validity")
-    
-    if validity_element:
-        validity_text = validity_element.get_text(strip=True)
-        end_date = parse_end_date(validity_text)
+    if vision_futures:
+        log("flyer", f"Waiting on {len(vision_futures)} image only items")
+        for future in tqdm(as_completed(vision_futures), total=len(vision_futures), desc="Processing Images"):
+            if future.result():
+                num_items += 1
+    return num_items
+
+
+def resume_flyer(flyer_id, items, journal=None):
+    """
+    Splits a flyer's items into (items to scrape, (item, details) of images
+    queued for vision, rows resolved but not committed) from the product
+    table and, with a journal, the item states of an interrupted run.
+    """
+    stored_ids = get_existing_product_ids(flyer_id, table="product", engine=get_engine()) or set()
+    queued_images = []
+    resolved_rows = []
+    if journal:
+        journal.start_flyer(flyer_id, [item.get("itemid") for item in items], stored_ids)
+        # Rows resolved before an interruption only need writing
+        resolved_rows = list(journal.items_in_state(flyer_id, RESOLVED).values())
+        queued = journal.items_in_state(flyer_id, IMAGE_QUEUED)
+        queued_images = [(item, queued[str(item.get("itemid"))]) for item in items if str(item.get("itemid")) in queued]
+        todo = journal.items_to_process(flyer_id)
+        pending = [item for item in items if str(item.get("itemid")) in todo]
     else:
-        end_date = None
+        pending = [item for item in items if str(item.get("itemid")) not in stored_ids]
+    if len(pending) < len(items):
+        log("flyer", f"Resuming flyer {flyer_id}: {len(pending)} of {len(items)} items left, "
+                     f"{len(queued_images)} images queued")
+    return pending, queued_images, resolved_rows
+
+
+def extract_item_infos(driver, flyer_url, flyer_id, pool, flyer_pages, max_workers=1, fetcher=None,
+                       vision_executor=None, journal=None):
+    """
+    Scrapes a flyer's items and commits its products. Items already in the
+    product table are skipped; with a journal, a flyer interrupted by an
+    earlier run resumes from its item states and failed items get up to
+    journal.max_attempts passes. Returns True when the flyer is finished.
+    """
+    items = list_flyer_items(driver, flyer_url, flyer_id, flyer_pages, fetcher)
+    # The items are all we still needed from the flyer page
+    flyer_pages.evict(flyer_id)
+    location = location_from_flyer_url(flyer_url)
+    if items is None:
+        return False
+    items = [item for item in items if item.get("itemid") is not None]
+    log("flyer", f"Found {len(items)} from flyer {flyer_url}")
+
+    pending, queued_images, resolved_rows = resume_flyer(flyer_id, items, journal)
+    for row in resolved_rows:
+        get_product_writer().add(row)
+    prefetch_item_names(pending)
+
+    num_items = 0
+    start = time.perf_counter()
+    passes = journal.max_attempts if journal else 1
+    for attempt in range(passes):
+        if attempt > 0:
+            pending = [item for item in items if str(item.get("itemid")) in journal.items_to_process(flyer_id)]
+            if not pending:
+                break
+            log("flyer", f"Retrying {len(pending)} failed items of flyer {flyer_id} (pass {attempt + 1}/{passes})")
+        num_items += process_items(
+            pending, flyer_id, pool, max_workers, fetcher, vision_executor, journal, queued_images, location
+        )
+        queued_images = ()
     
-    return end_date
+    elapsed = time.perf_counter() - start
+    log("flyer", f"Retrieved infos for {num_items} items on flyer in {elapsed:.1f}s "
+                 f"({len(items) / max(elapsed, 1e-9):.2f} items/sec)")
+    return commit_flyer_products(flyer_id, journal)
+
+
+def commit_flyer_products(flyer_id, journal=None):
+    """
+    Writes the flyer's buffered products, returns True when the flyer is
+    finished. Without a journal to keep the rejected rows for a later run, a
+    flyer with any rejected row isn't finished.
+    """
+    result = get_product_writer().flush(flyer_id)
+    if not journal:
+        return result.committed and not result.failed
+    if result.committed:
+        journal.mark_flyer_committed(flyer_id, [(row["product_id"], error) for row, error in result.failed])
+    log("flyer", f"Flyer {flyer_id} items: {journal.flyer_summary(flyer_id)}")
+    return result.committed and journal.remaining(flyer_id) == 0
+
+
+def extract_flyer_end_date(driver, flyer_id, flyer_url, flyer_pages):
+    flyer_page = flyer_pages.get(driver, flyer_id, flyer_url)
+    return flyer_page.end_date if flyer_page else None
+
+
+def list_homepage_flyers(driver, location, fetcher=None):
+    """Returns [{"flyer_id", "store_chain", "valid_until"}] of a location, the last two are None when unknown."""
+    listings = fetcher.get_flyer_listings(postal_code=location.postal_code, locale=location.locale) if fetcher else None
+    if listings is not None:
+        return listings
+
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.common.by import By
+
+    with timer("driver_get", page="homepage"):
+        driver.get(build_homepage_url(location))
+    with timer("driver_wait", page="homepage"):
+        WebDriverWait(driver, 5).until(
+            EC.presence_of_element_located((By.TAG_NAME, "flipp-flyer-listing-item"))
+        )
+    return parse_page(parse_homepage_listings, driver.page_source)
 
 
-def extract_flyer_infos_from_homepage(driver, homepage_url):
-    driver.get(homepage_url)
-    WebDriverWait(driver, 5).until(
-        EC.presence_of_element_located((By.TAG_NAME, "flipp-flyer-listing-item"))
+def extract_flyer_infos_from_homepage(driver, locations, flyer_pages, fetcher=None):
+    """
+    Merges the homepage flyers of every location, stores the new ones once
+    and records which locations each flyer is listed at.
+    """
+    listings_by_location = {}
+    for location in locations:
+        try:
+            listings_by_location[location] = list_homepage_flyers(driver, location, fetcher)
+        except Exception as e:
+            log("discovery", f"Error listing flyers at {location.postal_code}: {e}", error=True)
+            continue
+        print(f"Found {len(listings_by_location[location])} flyers on the {location.postal_code} homepage.")
+    flyer_listings = merge_flyer_listings(listings_by_location)
+    if len(locations) > 1:
+        print(f"Found {len(flyer_listings)} distinct flyers across {len(locations)} locations.")
+
+    known_flyer_ids = get_existing_flyer_ids(
+        flyer_ids=[listing["flyer_id"] for listing in flyer_listings],
+        table="flyer",
+        engine=get_engine()
     )
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-
-    flyer_items = soup.find_all("flipp-flyer-listing-item")
-    print(f"Found {len(flyer_items)} flyers on the homepage.")
+    if known_flyer_ids is None:
+        return
     
-    for item in flyer_items:
-        if item.has_attr("flyer-id"):
-            flyer_id = int(item["flyer-id"])
-            if flyer_exists(flyer_id=flyer_id, table="flyer", engine=engine):
-                continue
-            
-            flyer_url = f"https://flipp.com/en-ca/pierrefonds-qc/flyer/{flyer_id}?postal_code=H8Y3P2"
-            end_date = extract_flyer_end_date(item, driver, flyer_url)
-            store_chain = get_store_chain_name(driver, flyer_url)      
-            print(f"Flyer id: {flyer_id}, flyer_url: {flyer_url}, end_date: {end_date}, store_chain: {store_chain}")
-            
-            insert_flyer_record(
-                flyer_id=flyer_id,
-                flyer_url=flyer_url,
-                valid_until=end_date,
-                store_chain=store_chain,
-                table="flyer",
-                engine=engine
-            )
+    new_flyers = []
+    for listing in flyer_listings:
+        flyer_id = listing["flyer_id"]
+        if flyer_id in known_flyer_ids:
+            continue
+        
+        flyer_url = build_flyer_url(listing["locations"][0], flyer_id)
+        end_date = listing["valid_until"] or extract_flyer_end_date(driver, flyer_id, flyer_url, flyer_pages)
+        store_chain = listing["store_chain"] or get_store_chain_name(driver, flyer_id, flyer_url, flyer_pages)
+        log("discovery", f"Flyer id: {flyer_id}, flyer_url: {flyer_url}, end_date: {end_date}, "
+                         f"store_chain: {store_chain}")
+        
+        new_flyers.append({
+            "flyer_id": flyer_id,
+            "flyer_url": flyer_url,
+            "valid_until": end_date,
+            "store_chain": store_chain
+        })
+
+    print(f"Adding {len(new_flyers)} new flyers.")
+    upsert_flyer_records(flyers=new_flyers, table="flyer", engine=get_engine())
+    upsert_flyer_locations(
+        flyer_locations=[
+            (listing["flyer_id"], location.postal_code)
+            for listing in flyer_listings for location in listing["locations"]
+        ],
+        table="flyer_location",
+        engine=get_engine()
+    )
             
             
-def get_flyer_infos(driver, homepage_url):
+def get_flyer_infos(driver, locations, flyer_pages, fetcher=None, shard=SINGLE_SHARD):
+    """Discovers the flyers of the shard's locations, then returns the unretrieved flyers the shard scrapes."""
     delete_old_flyers_and_products(
-        product_table="product",
         flyer_table="flyer",
-        engine=engine
+        engine=get_engine()
     )
+    get_vision_cache().purge_expired()
     
-    extract_flyer_infos_from_homepage(driver=driver, homepage_url=homepage_url)
-    flyer_infos = get_unretrieved_flyers(table="flyer", engine=engine)
-    return flyer_infos
+    extract_flyer_infos_from_homepage(
+        driver=driver, locations=shard.locations(locations), flyer_pages=flyer_pages, fetcher=fetcher
+    )
+    # Flyers discovered by the other shards are in the table once they all get here
+    shard.wait_for_discovery()
+    flyer_infos = get_unretrieved_flyers(table="flyer", engine=get_engine())
+    if flyer_infos is None:
+        return None
+    return [(flyer_id, flyer_url) for flyer_id, flyer_url in flyer_infos if shard.owns(flyer_id)]
     
 
-def get_all_items_infos(driver, homepage_url):
-    flyer_infos = get_flyer_infos(driver, homepage_url)
+def get_all_items_infos(driver, locations, pool, max_workers=1, fetcher=None, vision_executor=None, journal=None,
+                        shard=SINGLE_SHARD):
+    flyer_pages = FlyerPageCache()
+    get_instrumentation().add_stats("flyer_page_cache", lambda: flyer_pages.stats)
+    flyer_infos = get_flyer_infos(driver, locations, flyer_pages, fetcher, shard)
+    if flyer_infos is None:
+        return
+    if journal:
+        # Item states of retrieved or expired flyers are no longer needed
+        journal.forget_flyers(flyer_id for flyer_id, _ in flyer_infos)
 
+    flyer_summaries = {}
     for flyer_id, flyer_url in tqdm(flyer_infos, desc="Processing Flyers"):
         print()
-        print(f"Extracting items from flyer_url: {flyer_url}")
-        if extract_item_infos(driver, flyer_url, flyer_id) == False:
+        log("flyer", f"Extracting items from flyer_url: {flyer_url}")
+        finished = extract_item_infos(
+            driver, flyer_url, flyer_id, pool, flyer_pages, max_workers, fetcher, vision_executor, journal
+        )
+        if journal:
+            flyer_summaries[flyer_id] = journal.flyer_summary(flyer_id)
+        if finished == False:
             continue
         
-        print(f"Updating flyer retrieved status for flyer_id: {flyer_id}")
+        log("flyer", f"Updating flyer retrieved status for flyer_id: {flyer_id}")
         set_flyer_retrieved_to_true(
             flyer_id=flyer_id,
             table="flyer",
-            engine=engine
+            engine=get_engine()
         )
 
+    flyer_pages.clear()
+    if flyer_summaries:
+        print_run_summary(flyer_summaries)
+
+
+def dry_run(locations, fetcher):
+    """Prints the flyers listed at every location through the flipp API, without Chrome, vision or the database."""
+    listings_by_location = {}
+    for location in locations:
+        listings = fetcher.get_flyer_listings(postal_code=location.postal_code, locale=location.locale)
+        if listings is None:
+            print(f"Could not list the flyers at {location.postal_code}")
+            continue
+        listings_by_location[location] = listings
+
+    flyers = merge_flyer_listings(listings_by_location)
+    for flyer in flyers:
+        postal_codes = ", ".join(location.postal_code for location in flyer["locations"])
+        print(f"Flyer {flyer['flyer_id']}: {flyer['store_chain'] or 'Unknown Store'}, "
+              f"valid until {flyer['valid_until']}, listed at {postal_codes}")
+    print(f"{len(flyers)} flyers across {len(listings_by_location)} locations.")
+    return flyers
+
 
-def main():
-    print(f"Starting scrapper ...")
-    homepage_url = "https://flipp.com/en-ca/pierrefonds-qc/flyers/groceries?postal_code=H8Y3P2"
-    with setup_chrome_driver() as driver:
-        get_all_items_infos(driver, homepage_url)
+def print_run_summary(flyer_summaries):
+    print("Per flyer item summary:")
+    for flyer_id, summary in flyer_summaries.items():
+        print(f"  flyer {flyer_id}: {summary['done']} done, {summary['skipped']} skipped, "
+              f"{summary['failed']} failed, {summary['retries']} retries")
+        for error, count in summary["errors"]:
+            print(f"      {count}x {error}")
+
+
+def item_outcome(item, flyer_id, product_url, details, journal=None):
+    """Resolves an item into the ("resolved" | "skipped" | "failed", flyer_id, product_id, row or reason) the write stage counts."""
+    product_id = item.get("itemid")
+    try:
+        row = build_product_row(item, flyer_id, product_url, details)
+    except Exception as e:
+        log("item", f"Could not resolve item {product_id}: {e}", error=True)
+        if journal:
+            journal.mark_failed(flyer_id, product_id, str(e))
+        return ("failed", flyer_id, product_id, str(e))
+    if row is None:
+        return ("skipped", flyer_id, product_id, "no name or price")
+    return ("resolved", flyer_id, product_id, row)
+
+
+def build_pipeline(driver, pool, flyer_pages, flyer_summaries, max_workers=1, fetcher=None, vision_executor=None,
+                   journal=None, queue_size=200, translate_batch=50, write_batch=100, report_interval=5.0,
+                   shard=SINGLE_SHARD):
+    """
+    Staged scrape of every unretrieved flyer: discover -> list -> fetch ->
+    vision (image only items) or translate -> write -> commit. Items of all
+    flyers flow through at once; a flyer is committed as soon as its last
+    item is written. Seed it with ("discover", locations).
+    """
+    max_attempts = journal.max_attempts if journal else 1
+    # Items each flyer still waits on, only the write stage counts them down
+    outstanding = {}
+
+    def discover(locations):
+        flyer_infos = get_flyer_infos(driver, locations, flyer_pages, fetcher, shard)
+        if flyer_infos is None:
+            return []
+        if journal:
+            # Item states of retrieved or expired flyers are no longer needed
+            journal.forget_flyers(flyer_id for flyer_id, _ in flyer_infos)
+        return [("list", (flyer_id, flyer_url)) for flyer_id, flyer_url in flyer_infos]
+
+    def list_items(flyer):
+        flyer_id, flyer_url = flyer
+        items = list_flyer_items(driver, flyer_url, flyer_id, flyer_pages, fetcher)
+        flyer_pages.evict(flyer_id)
+        if items is None:
+            return []
+        items = [item for item in items if item.get("itemid") is not None]
+        log("flyer", f"Found {len(items)} from flyer {flyer_url}")
+        location = location_from_flyer_url(flyer_url)
+
+        pending, queued_images, resolved_rows = resume_flyer(flyer_id, items, journal)
+        outstanding[flyer_id] = len(pending) + len(queued_images) + len(resolved_rows)
+        if not outstanding[flyer_id]:
+            return [("commit", flyer_id)]
+        return (
+            [("write", ("resolved", flyer_id, row["product_id"], row)) for row in resolved_rows]
+            + [("vision", (flyer_id, item, get_item_url(item.get("itemid"), location), details))
+               for item, details in queued_images]
+            + [("fetch", (flyer_id, item, location, 0)) for item in pending]
+        )
+
+    def fetch(task):
+        flyer_id, item, location, attempt = task
+        product_id = item.get("itemid")
+        product_url = get_item_url(product_id, location)
+        details = fetcher.get_item(product_id) if fetcher else None
+        if details is None:
+            details = scrape_item_with_driver(item, pool, product_url)
+        if details is None:
+            if journal:
+                journal.mark_failed(flyer_id, product_id, "item page did not load")
+            if attempt + 1 < max_attempts:
+                return [("fetch", (flyer_id, item, location, attempt + 1))]
+            return [("write", ("failed", flyer_id, product_id, "item page did not load"))]
+
+        if details["price"] is None:
+            if journal:
+                journal.mark_image_queued(flyer_id, product_id, details)
+            return [("vision", (flyer_id, item, product_url, details))]
+        return [("translate", (flyer_id, item, product_url, details))]
+
+    def fetch_failed(task, error):
+        flyer_id, item, _, _ = task
+        if journal:
+            journal.mark_failed(flyer_id, item.get("itemid"), str(error))
+        return [("write", ("failed", flyer_id, item.get("itemid"), str(error)))]
+
+    def vision(task):
+        flyer_id, item, product_url, details = task
+        return [("write", item_outcome(item, flyer_id, product_url, details, journal))]
+
+    def translate(tasks):
+        # One batched call for the names, the rows are then built from the translation cache
+        prefetch_item_names([item for _, item, _, _ in tasks])
+        return [
+            ("write", item_outcome(item, flyer_id, product_url, details, journal))
+            for flyer_id, item, product_url, details in tasks
+        ]
+
+    def unresolved(task, error):
+        flyer_id, item, _, _ = task
+        if journal:
+            journal.mark_failed(flyer_id, item.get("itemid"), str(error))
+        return [("write", ("failed", flyer_id, item.get("itemid"), str(error)))]
+
+    def write(outcomes):
+        finished = []
+        for status, flyer_id, product_id, value in outcomes:
+            if status == "resolved":
+                get_product_writer().add(value)
+                if journal:
+                    journal.mark_resolved(flyer_id, product_id, value)
+            elif status == "skipped" and journal:
+                journal.mark_skipped(flyer_id, product_id, value)
+            outstanding[flyer_id] -= 1
+            if outstanding[flyer_id] == 0:
+                finished.append(("commit", flyer_id))
+        return finished
+
+    def commit(flyer_id):
+        finished = commit_flyer_products(flyer_id, journal)
+        if journal:
+            flyer_summaries[flyer_id] = journal.flyer_summary(flyer_id)
+        if finished:
+            log("flyer", f"Updating flyer retrieved status for flyer_id: {flyer_id}")
+            set_flyer_retrieved_to_true(flyer_id=flyer_id, table="flyer", engine=get_engine())
+        return []
+
+    pipeline = Pipeline(report_interval=report_interval)
+    # discover and list share the main driver, one call at a time
+    pipeline.add_stage("discover", discover, queue_size=1)
+    pipeline.add_stage("list", list_items, queue_size=queue_size)
+    pipeline.add_stage("fetch", fetch, concurrency=max_workers, queue_size=queue_size, on_error=fetch_failed)
+    # Vision is slow and rate limited, its own queue fills up without holding back translated items
+    pipeline.add_stage("vision", vision, concurrency=vision_executor._max_workers if vision_executor else 1,
+                       queue_size=queue_size, executor=vision_executor, on_error=unresolved)
+    pipeline.add_stage("translate", translate, queue_size=queue_size, batch_size=translate_batch, on_error=unresolved)
+    pipeline.add_stage("write", write, queue_size=queue_size, batch_size=write_batch)
+    pipeline.add_stage("commit", commit, queue_size=queue_size)
+    return pipeline
+
+
+def run_pipeline(driver, locations, pool, **options):
+    """Runs the staged scrape to completion and returns the per-stage summary."""
+    flyer_pages = FlyerPageCache()
+    flyer_summaries = {}
+    pipeline = build_pipeline(driver, pool, flyer_pages, flyer_summaries, **options)
+    metrics = get_instrumentation()
+    metrics.add_stats("flyer_page_cache", lambda: flyer_pages.stats)
+    metrics.add_stats("pipeline", pipeline.summary, label="stage")
+    asyncio.run(pipeline.run([("discover", locations)]))
+
+    flyer_pages.clear()
+    if flyer_summaries:
+        print_run_summary(flyer_summaries)
+    return pipeline.summary()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape grocery flyers from flipp.com")
+    parser.add_argument("--max-workers", type=int, default=4,
+                        help="Number of items processed concurrently")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="Number of pooled Chrome sessions (defaults to --max-workers)")
+    parser.add_argument("--max-pages-per-driver", type=int, default=200,
+                        help="Recycle a pooled Chrome session after this many items")
+    parser.add_argument("--fetcher", choices=FETCHER_BACKENDS, default="selenium",
+                        help="Backend for flyer and item data, Selenium stays the fallback for the http backend")
+    parser.add_argument("--api-base", default=None,
+                        help="Base URL of the flipp JSON API (e.g. a local replay server)")
+    parser.add_argument("--translator", choices=TRANSLATOR_BACKENDS, default=None,
+                        help="Translation backend, 'offline' needs no network (defaults to $TRANSLATOR or google)")
+    parser.add_argument("--vision-workers", type=int, default=None,
+                        help="Concurrent image only items (defaults to regions x calls per minute)")
+    parser.add_argument("--db-pool-size", type=int, default=None,
+                        help="Database connections kept open (defaults to --max-workers + 4)")
+    parser.add_argument("--journal", default=RUN_JOURNAL_PATH,
+                        help="Item state journal that lets an interrupted run resume")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Don't track item states, only skip items already in the product table")
+    parser.add_argument("--max-item-attempts", type=int, default=3,
+                        help="Passes over a failed item, within a run and across resumed runs")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Scrape one flyer at a time instead of running the staged pipeline")
+    parser.add_argument("--queue-size", type=int, default=200,
+                        help="Items each pipeline stage holds before it pushes back on the stage feeding it")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                        help="Seconds between pipeline progress lines (0 turns them off)")
+    parser.add_argument("--parse-workers", type=int, default=2,
+                        help="Processes parsing page sources off the driver threads (0 parses in place)")
+    parser.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Disk budget of the downloaded image cache")
+    parser.add_argument("--prefilter", choices=PREFILTER_MODES, default=PREFILTER_MODE,
+                        help="Local check of image only items before vision: 'shadow' only logs, 'enforce' skips "
+                             "rejected banners, flyer pages and blank crops (the default with Pillow and NumPy)")
+    parser.add_argument("--prefilter-threshold", type=float, default=PREFILTER_THRESHOLD,
+                        help="Not-an-item confidence at which the prefilter rejects an image")
+    parser.add_argument("--locations", nargs="+", default=[],
+                        help="Postal codes to scrape, as H8Y3P2, H8Y3P2:pierrefonds-qc or H8Y3P2:pierrefonds-qc:fr-ca "
+                             "(defaults to $POSTAL_CODE)")
+    parser.add_argument("--locations-file", default=None,
+                        help="File with one location per line, merged with --locations")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Scraper processes; locations are split for discovery, flyers by id for scraping")
+    parser.add_argument("--shard-index", type=int, default=None,
+                        help="Run only this shard of --shards (for shards started on separate machines)")
+    parser.add_argument("--metrics-log", default=METRICS_LOG,
+                        help="JSON-lines file getting one event per timed call (Chrome, pages, vision, database)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE,
+                        help="Prometheus text file of the run's timings, counters and stats, rewritten as it goes")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Serve the Prometheus metrics on this port (plus the shard index)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List the flyers of every location and exit, without Chrome, vision or the database")
+    return parser.parse_args(argv)
+
+
+def run_shards(argv, shards):
+    """Runs every shard in its own process; the shards wait for each other between discovery and scraping."""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(shards)
+    processes = [
+        context.Process(target=run_scrapper, args=(argv, Shard(index, shards, barrier)), name=f"shard-{index}")
+        for index in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            print(f"{process.name} exited with code {process.exitcode}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.shards > 1 and args.shard_index is None and not args.dry_run:
+        run_shards(argv, args.shards)
+    else:
+        run_scrapper(argv, Shard(args.shard_index or 0, args.shards))
+
+
+def run_scrapper(argv=None, shard=SINGLE_SHARD):
+    args = parse_args(argv)
+    print(f"Starting scrapper {shard} ..." if shard.count > 1 else "Starting scrapper ...")
+    locations = load_locations(args.locations, args.locations_file)
+    fetcher_options = {"pool_size": args.max_workers}
+    if args.api_base:
+        fetcher_options["api_base"] = args.api_base
+    if args.dry_run:
+        # Listing goes through the API whatever the backend, a dry run never starts Chrome
+        fetcher = get_fetcher("http", **fetcher_options)
+        dry_run(locations, fetcher)
+        fetcher.close()
+        return
+
+    # Item workers and vision lookups share the pool, overflow absorbs vision bursts
+    configure_database(pool_size=args.db_pool_size or args.max_workers + 4)
+    pool = DriverPool(
+        setup_chrome_driver,
+        size=args.pool_size or args.max_workers,
+        max_pages=args.max_pages_per_driver
+    )
+    fetcher = get_fetcher(args.fetcher, **fetcher_options)
+    translations = create_translation_service(args.translator)
+    set_translation_service(translations)
+
+    vision_executor = create_vision_executor(args.vision_workers)
+    set_image_store(ImageStore(max_bytes=args.image_cache_mb * 1024 * 1024, pool_size=vision_executor._max_workers))
+    set_image_prefilter(ImagePrefilter(mode=args.prefilter, threshold=args.prefilter_threshold))
+    parse_executor = create_parse_executor(args.parse_workers)
+    set_parse_executor(parse_executor)
+    # Shards scrape disjoint flyers, each keeps its own journal
+    journal_path = f"{args.journal}.shard{shard.index}" if shard.count > 1 else args.journal
+    journal = None if args.no_journal else RunJournal(journal_path, max_attempts=args.max_item_attempts)
+
+    suffix = f".shard{shard.index}" if shard.count > 1 else ""
+    metrics = Instrumentation(
+        event_log=args.metrics_log and args.metrics_log + suffix,
+        prometheus_file=args.metrics_file and args.metrics_file + suffix,
+        port=args.metrics_port and args.metrics_port + shard.index
+    )
+    set_instrumentation(metrics.start())
+    metrics.add_stats("driver_pool", lambda: pool.stats)
+    if fetcher:
+        metrics.add_stats("fetcher", lambda: fetcher.stats)
+    metrics.add_stats("translation_cache", lambda: translations.stats)
+    metrics.add_stats("vision_result_cache", lambda: get_vision_cache().summary())
+    metrics.add_stats("image_cache", lambda: get_image_store().summary())
+    if get_image_prefilter().active:
+        metrics.add_stats("vision_prefilter", get_image_prefilter().summary)
+    metrics.add_stats("vision_scheduler", vision_scheduler.metrics, label="region")
+    metrics.add_stats("product_writer", lambda: get_product_writer().summary())
+
+    # The http backend lists flyers and items through the API, Chrome only starts if it falls back to Selenium
+    main_driver = setup_chrome_driver() if args.fetcher == "selenium" else LazyDriver(setup_chrome_driver)
+    with main_driver as driver, pool, vision_executor:
+        if args.sequential:
+            get_all_items_infos(
+                driver, locations, pool,
+                max_workers=args.max_workers, fetcher=fetcher, vision_executor=vision_executor, journal=journal,
+                shard=shard
+            )
+        else:
+            run_pipeline(
+                driver, locations, pool,
+                max_workers=args.max_workers, fetcher=fetcher, vision_executor=vision_executor, journal=journal,
+                queue_size=args.queue_size, report_interval=args.report_interval, shard=shard
+            )
+    blob_janitor.flush()
+    if parse_executor:
+        set_parse_executor(None)
+        parse_executor.shutdown()
+    if fetcher:
+        fetcher.close()
+    metrics.print_report()
+    metrics.close()
+    get_image_store().close()
+    if get_product_writer().failed_rows:
+        print(f"{len(get_product_writer().failed_rows)} products could not be written")
+    translations.close()
+    if journal:
+        journal.close()
         
 
 if __name__ == "__main__":
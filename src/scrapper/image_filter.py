@@ -0,0 +1,277 @@
+"""
+Cheap local check that scores image only items as "not an item" (banners,
+store promos, blank crops) before they go to the rate-limited vision model.
+
+Needs Pillow and NumPy, which are only imported when the filter is on.
+Modes: "off", "shadow" (score every image, still ask the model and log
+whether the two agree) and "enforce" (skip the model for rejected images).
+It enforces by default when Pillow and NumPy are installed.
+
+The built-in weights are a hand-set heuristic: strips wider than about 3:1
+(store banners), images far larger than an item crop (whole flyer pages),
+near blank and tiny crops are rejected, while rows of price and text glyphs
+pull an image back towards the model. src/benchmarks/prefilter.py measures
+them on labelled images. Fitting the weights on a shadow log is an optional
+refinement (from the repository root):
+    python -m src.scrapper.image_filter fit --log .cache/prefilter_shadow.jsonl --out .cache/prefilter_model.json
+    python -m src.scrapper.image_filter evaluate --log .cache/prefilter_shadow.jsonl --model .cache/prefilter_model.json
+"""
+from collections import namedtuple
+import importlib.util
+import argparse
+import threading
+import json
+import math
+import os
+
+from .instrumentation import log
+
+PREFILTER_MODES = ["off", "shadow", "enforce"]
+PREFILTER_MODE = os.getenv("VISION_PREFILTER") or (
+    "enforce" if importlib.util.find_spec("PIL") and importlib.util.find_spec("numpy") else "off"
+)
+PREFILTER_THRESHOLD = float(os.getenv("VISION_PREFILTER_THRESHOLD", "0.9"))
+PREFILTER_MODEL_PATH = os.getenv("VISION_PREFILTER_MODEL", os.path.join(".cache", "prefilter_model.json"))
+PREFILTER_SHADOW_LOG = os.getenv("VISION_PREFILTER_SHADOW_LOG", os.path.join(".cache", "prefilter_shadow.jsonl"))
+
+# Images are scored on a thumbnail, JPEG decoding at reduced scale makes that cheap
+THUMBNAIL_SIZE = 256
+
+FEATURES = ["aspect_excess", "smallness", "largeness", "flatness", "colour_spread", "edge_density", "glyph_rows"]
+
+# Hand-set logistic model of "not an item". At the 0.9 default threshold, any one of these rejects:
+# - aspect_excess: a strip wider (or taller) than about 3:1, a banner
+# - largeness: over about 4x the pixels of a 700x700 item crop, a whole flyer page
+# - flatness: 95% of the image in one colour, a blank crop
+# - smallness: under about 60x60, a logo or a fragment
+# Rows of price and text glyphs lower the score, colour spread and edge density are left to a fit
+DEFAULT_MODEL = {
+    "bias": -3.0,
+    "weights": {"aspect_excess": 16.0, "smallness": 4.0, "largeness": 4.0, "flatness": 8.0, "colour_spread": 0.0,
+                "edge_density": 0.0, "glyph_rows": -2.0},
+}
+
+Verdict = namedtuple("Verdict", ["reject", "not_item_probability", "features"])
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + math.exp(-max(min(z, 50.0), -50.0)))
+
+
+def image_features(image_file):
+    """Features of an image file, each roughly in [0, 1] with 0 meaning "looks like a flyer item"."""
+    from PIL import Image
+    import numpy as np
+
+    with Image.open(image_file) as image:
+        width, height = image.size
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = image.convert("RGB")
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        pixels = np.asarray(image, dtype=np.int16)
+
+    # Item crops are near square, banners are wide strips or tall columns
+    aspect_excess = max(0.0, abs(math.log(width / height)) - math.log(2.0))
+    smallness = max(0.0, math.log((120 * 120) / (width * height)))
+    largeness = max(0.0, math.log((width * height) / (700 * 700)))
+
+    # Colour histogram over 64 bins (2 bits per channel)
+    bins = (pixels[..., 0] >> 6) * 16 + (pixels[..., 1] >> 6) * 4 + (pixels[..., 2] >> 6)
+    counts = np.sort(np.bincount(bins.ravel(), minlength=64))[::-1] / bins.size
+    flatness = max(0.0, float(counts[0]) - 0.8) * 5
+    colour_spread = int(np.searchsorted(np.cumsum(counts), 0.9)) / 64
+
+    gray = pixels @ np.array([299, 587, 114], dtype=np.int32) // 1000
+    horizontal = np.abs(np.diff(gray, axis=1)) > 48
+    edge_density = float(horizontal.mean())
+    # Rows crossed by dense sharp transitions: digits, "$" and short text lines
+    transitions_per_row = horizontal.sum(axis=1) / max(gray.shape[1], 1)
+    glyph_rows = float((transitions_per_row > 0.08).mean())
+
+    return {
+        "aspect_excess": aspect_excess,
+        "smallness": smallness,
+        "largeness": largeness,
+        "flatness": flatness,
+        "colour_spread": colour_spread,
+        "edge_density": edge_density,
+        "glyph_rows": glyph_rows,
+    }
+
+
+def load_model(path=PREFILTER_MODEL_PATH):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return DEFAULT_MODEL
+
+
+def not_item_probability(features, model):
+    return sigmoid(model["bias"] + sum(model["weights"].get(name, 0.0) * features.get(name, 0.0) for name in FEATURES))
+
+
+class ImagePrefilter:
+    """
+    Scores images with a small logistic model over image features and rejects
+    those that are not items with at least `threshold` confidence. In shadow
+    mode every verdict is logged with the model's answer for later fitting.
+    """
+
+    def __init__(self, mode=PREFILTER_MODE, threshold=PREFILTER_THRESHOLD, model_path=PREFILTER_MODEL_PATH,
+                 shadow_log=PREFILTER_SHADOW_LOG):
+        if mode not in PREFILTER_MODES:
+            raise ValueError(f"Unknown prefilter mode: {mode}")
+        self.mode = mode
+        self.threshold = threshold
+        self.shadow_log = shadow_log
+        self.model = load_model(model_path)
+        if self.active:
+            # Fail at startup rather than on the first image when Pillow or NumPy are missing
+            import PIL.Image  # noqa: F401
+            import numpy  # noqa: F401
+
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "rejected": 0, "errors": 0, "vision_calls_saved": 0,
+                      "agreed": 0, "false_rejects": 0, "missed": 0}
+
+    @property
+    def active(self):
+        return self.mode != "off"
+
+    @property
+    def enforcing(self):
+        return self.mode == "enforce"
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def check(self, image):
+        """Verdict for a store.CachedImage, None when the image can't be decoded (it then goes to the model)."""
+        try:
+            with image.open() as f:
+                features = image_features(f)
+        except Exception as e:
+            log("prefilter", f"Prefilter could not read {image.url}: {e}", error=True)
+            self._count("errors")
+            return None
+        probability = not_item_probability(features, self.model)
+        verdict = Verdict(probability >= self.threshold, probability, features)
+        self._count("checked")
+        if verdict.reject:
+            self._count("rejected")
+            if self.enforcing:
+                self._count("vision_calls_saved")
+        return verdict
+
+    def record(self, image, verdict, is_item):
+        """Compares a verdict with the vision model's answer and appends both to the shadow log."""
+        if verdict.reject and is_item:
+            self._count("false_rejects")
+        elif not verdict.reject and not is_item:
+            self._count("missed")
+        else:
+            self._count("agreed")
+        if not self.shadow_log:
+            return
+        line = json.dumps({"url": image.url, "sha256": image.sha256, "is_item": is_item,
+                           "not_item_probability": verdict.not_item_probability, "features": verdict.features})
+        with self._lock:
+            if os.path.dirname(self.shadow_log):
+                os.makedirs(os.path.dirname(self.shadow_log), exist_ok=True)
+            with open(self.shadow_log, "a") as f:
+                f.write(line + "\n")
+
+    def summary(self):
+        with self._lock:
+            compared = self.stats["agreed"] + self.stats["false_rejects"] + self.stats["missed"]
+            return {
+                "mode": self.mode,
+                "threshold": self.threshold,
+                **self.stats,
+                "agreement": self.stats["agreed"] / compared if compared else None,
+            }
+
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+
+def get_image_prefilter():
+    global _prefilter
+    with _prefilter_lock:
+        if _prefilter is None:
+            _prefilter = ImagePrefilter()
+        return _prefilter
+
+
+def set_image_prefilter(prefilter):
+    global _prefilter
+    with _prefilter_lock:
+        _prefilter = prefilter
+
+
+def read_shadow_log(path):
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [row["features"] for row in rows], [0.0 if row["is_item"] else 1.0 for row in rows]
+
+
+def fit(features, labels, epochs=2000, learning_rate=0.5, l2=0.01):
+    """Logistic regression of "not an item" by batch gradient descent."""
+    import numpy as np
+
+    # Logs written before a feature existed score it 0
+    x = np.array([[row.get(name, 0.0) for name in FEATURES] for row in features], dtype=float)
+    y = np.array(labels, dtype=float)
+    weights = np.zeros(len(FEATURES))
+    bias = 0.0
+    for _ in range(epochs):
+        predicted = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+        error = predicted - y
+        weights -= learning_rate * (x.T @ error / len(y) + l2 * weights)
+        bias -= learning_rate * error.mean()
+    return {"bias": float(bias), "weights": dict(zip(FEATURES, map(float, weights)))}
+
+
+def evaluate(features, labels, model, thresholds=(0.5, 0.7, 0.8, 0.9, 0.95)):
+    """Per threshold: share of vision calls saved and items wrongly rejected."""
+    probabilities = [not_item_probability(row, model) for row in features]
+    items = sum(1 for label in labels if label == 0.0) or 1
+    report = []
+    for threshold in thresholds:
+        rejected = [label for probability, label in zip(probabilities, labels) if probability >= threshold]
+        report.append({
+            "threshold": threshold,
+            "calls_saved": len(rejected) / max(len(labels), 1),
+            "items_lost": sum(1 for label in rejected if label == 0.0) / items,
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit and evaluate the vision prefilter on a shadow log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit_parser = commands.add_parser("fit")
+    fit_parser.add_argument("--log", default=PREFILTER_SHADOW_LOG)
+    fit_parser.add_argument("--out", default=PREFILTER_MODEL_PATH)
+    evaluate_parser = commands.add_parser("evaluate")
+    evaluate_parser.add_argument("--log", default=PREFILTER_SHADOW_LOG)
+    evaluate_parser.add_argument("--model", default=PREFILTER_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    features, labels = read_shadow_log(args.log)
+    if args.command == "fit":
+        model = fit(features, labels)
+        with open(args.out, "w") as f:
+            json.dump(model, f, indent=1)
+        print(f"Fit on {len(labels)} images: {model}")
+    else:
+        model = load_model(args.model)
+        for row in evaluate(features, labels, model):
+            print(f"threshold {row['threshold']:.2f}: {row['calls_saved']:.1%} vision calls saved, "
+                  f"{row['items_lost']:.1%} of items rejected")
+
+
+if __name__ == "__main__":
+    main()
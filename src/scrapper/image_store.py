@@ -0,0 +1,263 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import requests
+import threading
+import tempfile
+import hashlib
+import sqlite3
+import mmap
+import time
+import os
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class ImageFetchError(RuntimeError):
+    pass
+
+
+class CachedImage:
+    """
+    An image in the disk cache. `view` is a read-only memoryview over the
+    memory-mapped file, so consumers hash, send or inspect the bytes without
+    copying them; `open()` gives a file object for uploads.
+    """
+
+    def __init__(self, url, sha256, path, size):
+        self.url = url
+        self.sha256 = sha256
+        self.path = path
+        self.size = size
+        self._view = None
+
+    @property
+    def view(self):
+        if self._view is None:
+            if self.size == 0:
+                self._view = memoryview(b"")
+            else:
+                with open(self.path, "rb") as f:
+                    # The mapping outlives the file handle and the file itself if it gets evicted
+                    self._view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._view
+
+    def open(self):
+        return open(self.path, "rb")
+
+
+class ImageStore:
+    """
+    Downloads flyer images over a pooled keep-alive session (with timeouts
+    and retries) into a content-addressed disk cache bounded to `max_bytes`,
+    evicting the least recently used images first.
+
+    URLs map to content hashes in a small SQLite index, so an image is found
+    again by URL across runs, and identical crops under different URLs are
+    stored once. Concurrent requests for the same URL share one download.
+    """
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, pool_size=16,
+                 timeout=(5, 20), retries=3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._connection = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._downloads = {}
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS image_object (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS image_url (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS image_object_lru_idx ON image_object (last_access)")
+            self._connection.commit()
+            self.total_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM image_object").fetchone()[0]
+
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "shared_downloads": 0, "errors": 0,
+                      "bytes_downloaded": 0, "bytes_saved": 0, "evictions": 0, "bytes_evicted": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _object_path(self, sha256):
+        return os.path.join(self.cache_dir, "objects", sha256[:2], sha256)
+
+    def _lookup(self, url):
+        """The cached image for a URL, with its access time refreshed, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT o.sha256, o.size FROM image_url u JOIN image_object o ON o.sha256 = u.sha256 WHERE u.url = ?",
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE image_object SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+            self._connection.commit()
+        path = self._object_path(row[0])
+        if not os.path.exists(path):
+            return None
+        return CachedImage(url, row[0], path, row[1])
+
+    def _download(self, url):
+        """Streams the image to a temporary file, hashing it on the way, then moves it to its content address."""
+        part_path = None
+        try:
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 200:
+                        raise ImageFetchError(f"Status {response.status_code} downloading image {url}")
+                    digest = hashlib.sha256()
+                    size = 0
+                    with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".part", delete=False) as f:
+                        part_path = f.name
+                        for chunk in response.iter_content(chunk_size=64 * 1024):
+                            digest.update(chunk)
+                            f.write(chunk)
+                            size += len(chunk)
+            except requests.RequestException as e:
+                raise ImageFetchError(f"Error downloading image {url}: {e}") from e
+
+            sha256 = digest.hexdigest()
+            path = self._object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(part_path, path)
+            part_path = None
+        finally:
+            # Whatever failed (network, a full disk), no .part file is left in the cache
+            if part_path is not None:
+                try:
+                    os.remove(part_path)
+                except FileNotFoundError:
+                    pass
+
+        with self._lock:
+            known = self._connection.execute("SELECT 1 FROM image_object WHERE sha256 = ?", (sha256,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO image_object (sha256, size, last_access) VALUES (?, ?, ?)",
+                (sha256, size, time.time())
+            )
+            self._connection.execute("INSERT OR REPLACE INTO image_url (url, sha256) VALUES (?, ?)", (url, sha256))
+            self._connection.commit()
+            if not known:
+                self.total_bytes += size
+            self.stats["bytes_downloaded"] += size
+        self._evict(keep=sha256)
+        return CachedImage(url, sha256, path, size)
+
+    def _evict(self, keep=None):
+        """Drops least recently used images (other than `keep`) until the cache fits its byte budget."""
+        with self._lock:
+            if self.total_bytes <= self.max_bytes:
+                return
+            evicted = []
+            for sha256, size in self._connection.execute(
+                "SELECT sha256, size FROM image_object ORDER BY last_access"
+            ).fetchall():
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if sha256 == keep:
+                    continue
+                evicted.append((sha256,))
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                self.stats["bytes_evicted"] += size
+            self._connection.executemany("DELETE FROM image_object WHERE sha256 = ?", evicted)
+            self._connection.executemany("DELETE FROM image_url WHERE sha256 = ?", evicted)
+            self._connection.commit()
+        for (sha256,) in evicted:
+            try:
+                os.remove(self._object_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def get(self, url):
+        """
+        Returns the CachedImage for a URL, downloading it on a miss. Raises
+        ImageFetchError, or the error that failed the shared download.
+        """
+        self._count("requests")
+        image = self._lookup(url)
+        if image is not None:
+            self._count("hits")
+            self._count("bytes_saved", image.size)
+            return image
+
+        with self._lock:
+            download = self._downloads.get(url)
+            leader = download is None
+            if leader:
+                download = self._downloads[url] = {"done": threading.Event(), "image": None, "error": None}
+        if not leader:
+            self._count("shared_downloads")
+            download["done"].wait()
+            if download["error"] is not None:
+                raise download["error"]
+            return download["image"]
+
+        self._count("misses")
+        try:
+            download["image"] = self._download(url)
+            return download["image"]
+        except Exception as e:
+            # Followers re-raise the leader's error, whatever it was
+            self._count("errors")
+            download["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._downloads[url]
+            download["done"].set()
+
+    def summary(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "cached_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        self.session.close()
+        with self._lock:
+            self._connection.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore()
+        return _store
+
+
+def set_image_store(store):
+    """Swaps the shared image store, e.g. for one in a temporary directory or with another byte budget."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,360 @@
+"""
+Timers and counters around the scraper's hot paths (Chrome startup, page
+loads and waits, translation, vision queueing and model calls, database
+calls), plus the stats the scraper's components already keep.
+
+Instrumentation is off unless an output is configured:
+- a JSON-lines event log with one line per timed call and per logged message
+- a Prometheus text file, rewritten every `interval` seconds and at the end
+- a Prometheus endpoint on `port`
+
+When it is off, `timer()` hands back a shared no-op context manager and
+`count()`/`observe()` return on their first check, so the hot paths pay
+about a function call.
+
+The hot paths report their messages with `log()`: they go to the event log
+when there is one and are printed otherwise. Errors logged that way (caught
+and handled, so no timer sees them) count in `<name>_errors_total` with the
+errors of the timer of the same name and labels.
+"""
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import functools
+import threading
+import json
+import time
+import os
+import re
+
+METRICS_LOG = os.getenv("METRICS_LOG")
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+
+METRIC_PREFIX = "flipp"
+# Percentiles come from the most recent samples of each series, counts and totals from all of them
+MAX_SAMPLES = 10000
+
+
+def percentile(values, p):
+    return values[min(int(p * len(values)), len(values) - 1)] if values else 0.0
+
+
+def metric_name(*parts):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join([METRIC_PREFIX, *parts]))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def flatten_stats(name, value, labels, label):
+    """(metric name, labels, number) of a stats dict; dicts of dicts become one series per key under `label`."""
+    if isinstance(value, (bool, int, float)):
+        yield name, labels, float(value)
+    elif isinstance(value, dict):
+        per_key = bool(value) and all(isinstance(item, dict) for item in value.values())
+        for key, item in value.items():
+            if per_key:
+                yield from flatten_stats(name, item, {**labels, label: key}, label)
+            else:
+                yield from flatten_stats(f"{name}_{key}", item, labels, label)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, error=exc_type is not None, **self.labels)
+        return False
+
+
+class Instrumentation:
+    """
+    Collects timings (count, errors, total and recent samples per name and
+    labels) and counters, and exposes them with the registered stats sources.
+    Disabled when no output is given, unless `enabled` says otherwise.
+    """
+
+    def __init__(self, event_log=METRICS_LOG, prometheus_file=METRICS_FILE, port=METRICS_PORT, interval=15.0,
+                 enabled=None):
+        self.event_log = event_log
+        self.prometheus_file = prometheus_file
+        self.port = port
+        self.interval = interval
+        self.enabled = enabled if enabled is not None else bool(event_log or prometheus_file or port)
+
+        self._lock = threading.Lock()
+        self._timings = defaultdict(lambda: {"count": 0, "errors": 0, "total": 0.0,
+                                             "samples": deque(maxlen=MAX_SAMPLES)})
+        self._counters = defaultdict(float)
+        self._logged_errors = defaultdict(int)
+        self._sources = {}
+        self._log = None
+        self._server = None
+        self._writer = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.event_log:
+            if os.path.dirname(self.event_log):
+                os.makedirs(os.path.dirname(self.event_log), exist_ok=True)
+            self._log = open(self.event_log, "a", buffering=1)
+        if self.port:
+            self._server = ThreadingHTTPServer(("0.0.0.0", self.port), self._handler_class())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"Serving metrics on http://localhost:{self._server.server_address[1]}/metrics")
+        if self.prometheus_file:
+            self._writer = threading.Thread(target=self._write_periodically, name="metrics-writer", daemon=True)
+            self._writer.start()
+        return self
+
+    def _handler_class(self):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _write_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.write_prometheus()
+
+    def add_stats(self, name, source, label="key"):
+        """Registers a callable returning a stats dict, nested dicts of dicts are split into series by `label`."""
+        with self._lock:
+            self._sources[name] = (source, label)
+
+    def observe(self, name, seconds, error=False, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            timing = self._timings[key]
+            timing["count"] += 1
+            timing["errors"] += error
+            timing["total"] += seconds
+            timing["samples"].append(seconds)
+            if self._log is not None:
+                self._log.write(json.dumps({"ts": time.time(), "event": name, "seconds": round(seconds, 6),
+                                            "error": error, **labels}) + "\n")
+
+    def log(self, name, message, error=False, **labels):
+        """Writes a message to the event log, or prints it when there is none. Errors are counted under `name`."""
+        if self.enabled and error:
+            with self._lock:
+                self._logged_errors[(name, tuple(labels.items()))] += 1
+        log = self._log
+        if log is None:
+            print(message)
+            return
+        line = json.dumps({"ts": time.time(), "event": name, "level": "error" if error else "info",
+                           "message": message, **labels}, default=str)
+        with self._lock:
+            if self._log is not None:
+                self._log.write(line + "\n")
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, tuple(labels.items()))] += amount
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels) if self.enabled else NULL_TIMER
+
+    def collect_stats(self):
+        with self._lock:
+            sources = dict(self._sources)
+        stats = {}
+        for name, (source, _) in sources.items():
+            try:
+                stats[name] = source()
+            except Exception as e:
+                print(f"Could not collect {name} stats: {e}")
+        return stats
+
+    def _errors(self, timings):
+        """{(name, labels): errors} of the timed calls that raised plus the errors logged, call with the lock held."""
+        errors = defaultdict(int, self._logged_errors)
+        for key, (timing, _) in timings.items():
+            errors[key] += timing["errors"]
+        return errors
+
+    def summary(self):
+        """{"name{labels}": {"count", "errors", "total_seconds", "p50_seconds", "p95_seconds"}} of every timing."""
+        with self._lock:
+            timings = {key: (dict(timing), sorted(timing["samples"])) for key, timing in self._timings.items()}
+            errors = self._errors(timings)
+        return {
+            name + format_labels(dict(labels)): {
+                "count": timing["count"],
+                "errors": errors[(name, labels)],
+                "total_seconds": timing["total"],
+                "p50_seconds": percentile(samples, 0.5),
+                "p95_seconds": percentile(samples, 0.95),
+            }
+            for (name, labels), (timing, samples) in sorted(timings.items())
+        }
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            timings = {key: (dict(timing), sorted(timing["samples"])) for key, timing in self._timings.items()}
+            counters = dict(self._counters)
+            errors = self._errors(timings)
+            labels_of_sources = {name: label for name, (_, label) in self._sources.items()}
+
+        for name in sorted({name for name, _ in timings}):
+            metric = metric_name(name, "seconds")
+            lines.append(f"# TYPE {metric} summary")
+            for (series, labels), (timing, samples) in sorted(timings.items()):
+                if series != name:
+                    continue
+                labels = dict(labels)
+                for quantile in (0.5, 0.95):
+                    lines.append(f"{metric}{format_labels({**labels, 'quantile': quantile})} "
+                                 f"{percentile(samples, quantile)}")
+                lines.append(f"{metric}_sum{format_labels(labels)} {timing['total']}")
+                lines.append(f"{metric}_count{format_labels(labels)} {timing['count']}")
+
+        # Counter families of their own, a family's samples stay together under its TYPE line
+        for name in sorted({name for name, _ in errors}):
+            metric = metric_name(name, "errors_total")
+            lines.append(f"# TYPE {metric} counter")
+            for (series, labels), value in sorted(errors.items()):
+                if series == name:
+                    lines.append(f"{metric}{format_labels(dict(labels))} {value}")
+
+        for name in sorted({name for name, _ in counters}):
+            metric = metric_name(name, "total")
+            lines.append(f"# TYPE {metric} counter")
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{metric}{format_labels(dict(labels))} {value}")
+
+        for source, stats in self.collect_stats().items():
+            for name, labels, value in flatten_stats(metric_name(source), stats, {}, labels_of_sources[source]):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        path = path or self.prometheus_file
+        if not path:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside then renamed, a scraper reading the file never sees half of it
+        with open(path + ".tmp", "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(path + ".tmp", path)
+
+    def print_report(self):
+        for name, stats in self.collect_stats().items():
+            title = name.replace("_", " ").capitalize()
+            if isinstance(stats, dict) and stats and all(isinstance(item, dict) for item in stats.values()):
+                print(f"{title} stats:")
+                for key, item in stats.items():
+                    print(f"  {key}: {item}")
+            else:
+                print(f"{title} stats: {stats}")
+
+        if self.enabled:
+            print("Timings:")
+            for series, timing in self.summary().items():
+                print(f"  {series:<48} {timing['count']:7d} calls  p50 {timing['p50_seconds'] * 1000:9.1f} ms"
+                      f"  p95 {timing['p95_seconds'] * 1000:9.1f} ms  total {timing['total_seconds']:8.1f} s"
+                      + (f"  {timing['errors']} errors" if timing["errors"] else ""))
+
+    def close(self):
+        self._stopped.set()
+        self.write_prometheus()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+_instrumentation = Instrumentation(enabled=False)
+_instrumentation_lock = threading.Lock()
+
+
+def get_instrumentation():
+    with _instrumentation_lock:
+        return _instrumentation
+
+
+def set_instrumentation(instrumentation):
+    global _instrumentation
+    with _instrumentation_lock:
+        _instrumentation = instrumentation
+
+
+# The hot paths call these, they read the shared instance without taking the lock
+
+def timer(name, **labels):
+    return _instrumentation.timer(name, **labels)
+
+
+def observe(name, seconds, **labels):
+    _instrumentation.observe(name, seconds, **labels)
+
+
+def count(name, amount=1, **labels):
+    _instrumentation.count(name, amount, **labels)
+
+
+def log(name, message, error=False, **labels):
+    _instrumentation.log(name, message, error=error, **labels)
+
+
+def timed(name):
+    """Decorator timing every call of a function under `name`, labelled with the function's name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _instrumentation.enabled:
+                return function(*args, **kwargs)
+            with _instrumentation.timer(name, call=function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
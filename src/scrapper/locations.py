@@ -0,0 +1,128 @@
+from collections import namedtuple
+import threading
+import os
+import re
+import zlib
+
+LOCALE = re.compile(r"[a-z]{2}-[a-z]{2}")
+
+# Point FLIPP_SITE at a replay server (src/scrapper/replay.py) to scrape recorded pages.
+# The locale comes from each location, one left on the site url (the old form) is dropped
+FLIPP_SITE = re.sub(r"/[a-z]{2}-[a-z]{2}/?$", "", os.getenv("FLIPP_SITE", "https://flipp.com").rstrip("/"))
+DEFAULT_LOCALE = os.getenv("FLIPP_LOCALE", "en-ca")
+
+# A postal code, the flipp.com city slug its pages live under and the locale they are read in
+Location = namedtuple("Location", ["postal_code", "city_slug", "locale"], defaults=[DEFAULT_LOCALE])
+
+DEFAULT_LOCATION = Location(os.getenv("POSTAL_CODE", "H8Y3P2"), os.getenv("CITY_SLUG", "pierrefonds-qc"))
+
+FLYER_URL = re.compile(r"/([a-z]{2}-[a-z]{2})/([^/]+)/flyer/\d+\?postal_code=(\w+)")
+
+
+def parse_location(value):
+    """
+    Parses "H8Y3P2:pierrefonds-qc:fr-ca" into a Location. The locale and
+    the city slug can be left out, the defaults are used for them.
+    """
+    postal_code, _, rest = value.strip().partition(":")
+    city_slug, _, locale = rest.partition(":")
+    postal_code = postal_code.replace(" ", "").upper()
+    if not re.fullmatch(r"[A-Z]\d[A-Z]\d[A-Z]\d", postal_code):
+        raise ValueError(f"Invalid postal code: {value}")
+    locale = locale.strip().lower() or DEFAULT_LOCALE
+    if not LOCALE.fullmatch(locale):
+        raise ValueError(f"Invalid locale: {value}")
+    return Location(postal_code, city_slug.strip() or DEFAULT_LOCATION.city_slug, locale)
+
+
+def load_locations(values=(), path=None):
+    """Locations from the command line and an optional file (one per line, # comments), deduplicated in order."""
+    lines = list(values)
+    if path:
+        with open(path) as f:
+            lines.extend(line.split("#")[0] for line in f)
+
+    locations = {}
+    for line in lines:
+        if line.strip():
+            location = parse_location(line)
+            locations.setdefault(location.postal_code, location)
+    return list(locations.values()) or [DEFAULT_LOCATION]
+
+
+def site_path(location):
+    return f"/{location.locale}/{location.city_slug}"
+
+
+def homepage_url(location):
+    return f"{FLIPP_SITE}{site_path(location)}/flyers/groceries?postal_code={location.postal_code}"
+
+
+def flyer_url(location, flyer_id):
+    return f"{FLIPP_SITE}{site_path(location)}/flyer/{flyer_id}?postal_code={location.postal_code}"
+
+
+def item_url(location, product_id):
+    return f"{FLIPP_SITE}{site_path(location)}/item/{product_id}?postal_code={location.postal_code}"
+
+
+def location_from_flyer_url(url):
+    """The location a stored flyer url was built for, the default location when it doesn't parse."""
+    match = FLYER_URL.search(url or "")
+    return Location(match.group(3), match.group(2), match.group(1)) if match else DEFAULT_LOCATION
+
+
+def merge_flyer_listings(listings_by_location):
+    """
+    Merges the homepage flyer listings of several locations ({location: [listing]})
+    into one listing per distinct flyer_id, each with the "locations" it is
+    listed at. The first location listing a flyer is the one its pages are read from.
+    """
+    merged = {}
+    for location, listings in listings_by_location.items():
+        for listing in listings:
+            flyer = merged.setdefault(listing["flyer_id"], {**listing, "locations": []})
+            flyer["store_chain"] = flyer["store_chain"] or listing["store_chain"]
+            flyer["valid_until"] = flyer["valid_until"] or listing["valid_until"]
+            flyer["locations"].append(location)
+    return list(merged.values())
+
+
+class Shard:
+    """
+    One of `count` scraper processes. Discovery is split by location, then
+    every flyer is scraped by the one shard its id hashes to, so a flyer
+    listed at locations of several shards is still scraped once.
+
+    `barrier` (a multiprocessing.Barrier shared by the shards) holds the
+    scraping back until every shard has recorded the flyers it discovered.
+    """
+
+    def __init__(self, index=0, count=1, barrier=None, discovery_timeout=1800):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} out of range for {count} shards")
+        self.index = index
+        self.count = count
+        self.barrier = barrier
+        self.discovery_timeout = discovery_timeout
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count})"
+
+    def locations(self, locations):
+        return sorted(locations)[self.index::self.count]
+
+    def owns(self, flyer_id):
+        return zlib.crc32(str(flyer_id).encode()) % self.count == self.index
+
+    def wait_for_discovery(self):
+        if self.barrier is None:
+            return
+        try:
+            self.barrier.wait(self.discovery_timeout)
+        except threading.BrokenBarrierError:
+            # A shard died or stalled, scrape what has been discovered so far
+            print(f"{self} stopped waiting on the other shards' discovery")
+
+
+SINGLE_SHARD = Shard()
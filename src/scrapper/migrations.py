@@ -0,0 +1,52 @@
+from sqlalchemy import text
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "queries", "migrations")
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """Returns [(version, path)] for the NNN_name.sql files, in order."""
+    migrations = []
+    for file_name in sorted(os.listdir(directory)):
+        match = re.match(r"^(\d+)_.*\.sql$", file_name)
+        if match:
+            migrations.append((match.group(1), os.path.join(directory, file_name)))
+    return migrations
+
+
+def get_applied_versions(connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """))
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def apply_migrations(engine, directory=MIGRATIONS_DIR):
+    """Applies every migration not recorded in schema_migrations, each in its own transaction."""
+    with engine.begin() as connection:
+        applied = get_applied_versions(connection)
+
+    applied_now = []
+    for version, path in list_migrations(directory):
+        if version in applied:
+            continue
+        with open(path) as f:
+            sql = f.read()
+        with engine.begin() as connection:
+            connection.exec_driver_sql(sql)
+            connection.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+        print(f"Applied migration {os.path.basename(path)}")
+        applied_now.append(version)
+
+    if not applied_now:
+        print("Schema is up to date.")
+    return applied_now
+
+
+if __name__ == "__main__":
+    from .database import get_sql_engine_from_env
+    apply_migrations(get_sql_engine_from_env())
@@ -0,0 +1,34 @@
+import unicodedata
+import re
+
+STOP_WORDS = {"and", "or", "of", "the", "with", "a", "an", "de", "et", "la", "le", "les"}
+
+
+def strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def singular(token):
+    if len(token) > 3 and token.endswith("ies"):
+        return token[:-3] + "y"
+    # tomatoes, potatoes, mangoes
+    if len(token) > 5 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def product_tokens(name):
+    """Lowercased, accent free, singular word tokens of a product name."""
+    text = strip_accents(name or "").lower()
+    return [singular(token) for token in re.findall(r"[a-z0-9]+", text) if token not in STOP_WORDS]
+
+
+def normalize_product_name(name):
+    """
+    Key that is the same for word order, plural and punctuation variants,
+    e.g. "Boneless Chicken Breast" and "Chicken Breasts, Boneless".
+    """
+    return " ".join(sorted(set(product_tokens(name))))
+
@@ -0,0 +1,185 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from .instrumentation import log
+
+
+class StageMetrics:
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+        self.durations = []
+        self.reported_processed = 0
+
+    def summary(self, elapsed):
+        durations = sorted(self.durations)
+
+        def percentile(p):
+            return durations[min(int(p * len(durations)), len(durations) - 1)] if durations else 0.0
+
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "per_second": self.processed / max(elapsed, 1e-9),
+            "p50_seconds": percentile(0.5),
+            "p95_seconds": percentile(0.95),
+            "busy_seconds": self.busy_seconds,
+        }
+
+
+class Stage:
+    """
+    One step of a Pipeline. `handler(item)` (or `handler(items)` for batched
+    stages) returns the (stage name, item) routes of what it produced, and
+    runs in a thread of the stage's own executor unless it is a coroutine
+    function. `on_error(item, error)` returns routes for an item whose
+    handler raised, so a failure can still be accounted for downstream.
+    """
+
+    def __init__(self, name, handler, concurrency=1, queue_size=100, batch_size=None, batch_wait=0.2,
+                 executor=None, on_error=None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.executor = executor
+        self.on_error = on_error
+        self.metrics = StageMetrics()
+        self.queue = None
+
+
+class Pipeline:
+    """
+    Stages joined by bounded asyncio queues. Each stage has its own workers
+    and thread pool, so a slow stage only holds up the stages feeding it, and
+    only once its queue is full. Routes back to the same or an earlier stage
+    (retries) are put in the background so a full queue can't deadlock its
+    own workers.
+    """
+
+    def __init__(self, report_interval=5.0):
+        self.stages = {}
+        self.report_interval = report_interval
+        self._own_executors = []
+        self._pending_puts = set()
+        self._started_at = None
+
+    def add_stage(self, name, handler, **options):
+        self.stages[name] = Stage(name, handler, **options)
+        return self
+
+    async def put(self, stage_name, item):
+        await self.stages[stage_name].queue.put(item)
+
+    async def _call(self, stage, payload):
+        if asyncio.iscoroutinefunction(stage.handler):
+            return await stage.handler(payload)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(stage.executor, stage.handler, payload)
+
+    async def _take(self, stage):
+        """Next item, or up to batch_size items that arrive within batch_wait for batched stages."""
+        first = await stage.queue.get()
+        if not stage.batch_size:
+            return first, 1
+        batch = [first]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(batch) < stage.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(stage.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch, len(batch)
+
+    async def _worker(self, stage):
+        while True:
+            payload, count = await self._take(stage)
+            metrics = stage.metrics
+            metrics.in_flight += count
+            start = time.perf_counter()
+            try:
+                routes = await self._call(stage, payload)
+            except Exception as e:
+                metrics.failed += count
+                log("pipeline", f"Pipeline stage {stage.name} failed: {e}", error=True, stage=stage.name)
+                routes = []
+                if stage.on_error is not None:
+                    for item in (payload if stage.batch_size else [payload]):
+                        routes.extend(stage.on_error(item, e) or [])
+            elapsed = time.perf_counter() - start
+            metrics.busy_seconds += elapsed
+            metrics.durations.append(elapsed / count)
+
+            # Downstream puts happen before task_done, a full queue holds this worker back
+            for stage_name, item in routes or []:
+                if self._order[stage_name] > self._order[stage.name]:
+                    await self.put(stage_name, item)
+                else:
+                    put = asyncio.create_task(self.put(stage_name, item))
+                    self._pending_puts.add(put)
+                    put.add_done_callback(self._pending_puts.discard)
+            metrics.in_flight -= count
+            metrics.processed += count
+            for _ in range(count):
+                stage.queue.task_done()
+
+    def status_line(self):
+        now = time.perf_counter()
+        parts = []
+        for stage in self.stages.values():
+            metrics = stage.metrics
+            rate = (metrics.processed - metrics.reported_processed) / self.report_interval
+            metrics.reported_processed = metrics.processed
+            parts.append(
+                f"{stage.name} {metrics.processed} ({rate:.1f}/s) q{stage.queue.qsize()}/{stage.queue_size}"
+                f" busy {metrics.in_flight}"
+                + (f" failed {metrics.failed}" if metrics.failed else "")
+            )
+        return f"[{now - self._started_at:6.0f}s] " + " | ".join(parts)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.status_line())
+
+    async def run(self, seeds):
+        """Feeds the (stage name, item) seeds and returns once every stage has drained."""
+        self._started_at = time.perf_counter()
+        self._order = {name: i for i, name in enumerate(self.stages)}
+        workers = []
+        for stage in self.stages.values():
+            stage.queue = asyncio.Queue(maxsize=stage.queue_size)
+            if stage.executor is None and not asyncio.iscoroutinefunction(stage.handler):
+                stage.executor = ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=stage.name)
+                self._own_executors.append(stage.executor)
+            workers.extend(asyncio.create_task(self._worker(stage)) for _ in range(stage.concurrency))
+        reporter = asyncio.create_task(self._report()) if self.report_interval else None
+
+        try:
+            for stage_name, item in seeds:
+                await self.put(stage_name, item)
+            while True:
+                for stage in self.stages.values():
+                    await stage.queue.join()
+                if not self._pending_puts:
+                    break
+                await asyncio.gather(*self._pending_puts)
+        finally:
+            for task in workers + ([reporter] if reporter else []):
+                task.cancel()
+            await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+            for executor in self._own_executors:
+                executor.shutdown(wait=False)
+            self._own_executors = []
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._started_at
+        return {name: stage.metrics.summary(elapsed) for name, stage in self.stages.items()}
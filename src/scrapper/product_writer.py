@@ -0,0 +1,145 @@
+from collections import defaultdict, namedtuple
+import threading
+import time
+
+from .database import upsert_product_records, record_price_observations
+from .instrumentation import log
+from .normalize import normalize_product_name
+from .unit_prices import normalize_prices
+
+# committed: the flyer's transaction went through; failed: [(row, error)] of the rows left out of it
+FlushResult = namedtuple("FlushResult", ["committed", "rows_written", "failed"])
+
+
+class ProductWriter:
+    """
+    Buffers product rows per flyer and writes them with multi-row upserts in
+    one transaction per flyer.
+
+    A batch that fails is retried row by row inside savepoints, so only the
+    bad rows are left out; they are kept in `failed_rows` with their error
+    instead of being dropped silently.
+    """
+
+    def __init__(self, engine, table="product", batch_size=500, record_prices=True):
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+        self.record_prices = record_prices
+        self._buffers = defaultdict(list)
+        self._lock = threading.Lock()
+        self.failed_rows = []
+        self.stats = {"rows_written": 0, "rows_failed": 0, "flushes": 0, "batches": 0,
+                      "flush_rows": [], "flush_seconds": []}
+
+    def add(self, product_infos):
+        row = {
+            "product_id": product_infos["product_id"],
+            "product_name": product_infos["product_name"],
+            "price": product_infos["price"],
+            "url": product_infos["url"],
+            "unit": product_infos["unit"],
+            "flyer_id": product_infos["flyer_id"],
+            "image_url": product_infos["product_image_url"],
+        }
+        with self._lock:
+            self._buffers[row["flyer_id"]].append(row)
+
+    def pending(self, flyer_id=None):
+        with self._lock:
+            if flyer_id is not None:
+                return len(self._buffers.get(flyer_id, []))
+            return sum(len(rows) for rows in self._buffers.values())
+
+    def _write_batch(self, connection, batch):
+        """Returns the rows that could not be written."""
+        savepoint = connection.begin_nested()
+        try:
+            upsert_product_records(batch, table=self.table, connection=connection)
+            savepoint.commit()
+            return []
+        except Exception as e:
+            savepoint.rollback()
+            if len(batch) == 1:
+                return [(batch[0], str(e))]
+
+        failed = []
+        for row in batch:
+            failed.extend(self._write_batch(connection, [row]))
+        return failed
+
+    def _record_prices(self, connection, rows):
+        """Feeds the price history from the same transaction; a failure there never costs the products."""
+        savepoint = connection.begin_nested()
+        try:
+            for i in range(0, len(rows), self.batch_size):
+                record_price_observations(
+                    [{**row, "product_key": normalize_product_name(row["product_name"])}
+                     for row in rows[i:i + self.batch_size]],
+                    observation_table="price_observation",
+                    current_table="price_current",
+                    flyer_table="flyer",
+                    connection=connection
+                )
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            log("product_write", f"Error recording price history: {e}", error=True, step="price_history")
+
+    def flush(self, flyer_id):
+        """
+        Writes every buffered row of a flyer in one transaction. Returns a
+        FlushResult, a committed transaction can still have rejected rows.
+        """
+        with self._lock:
+            rows = self._buffers.pop(flyer_id, [])
+        if not rows:
+            return FlushResult(True, 0, [])
+
+        # The last row for a product wins, an upsert can't touch the same row twice
+        rows = normalize_prices(list({row["product_id"]: row for row in rows}.values()))
+        start = time.perf_counter()
+        failed = []
+        committed = True
+        try:
+            with self.engine.begin() as connection:
+                for i in range(0, len(rows), self.batch_size):
+                    failed.extend(self._write_batch(connection, rows[i:i + self.batch_size]))
+                    self.stats["batches"] += 1
+                if self.record_prices:
+                    failed_ids = {row["product_id"] for row, _ in failed}
+                    self._record_prices(connection, [row for row in rows if row["product_id"] not in failed_ids])
+        except Exception as e:
+            log("product_write", f"Error writing products of flyer {flyer_id}: {e}", error=True, step="flush")
+            failed = [(row, str(e)) for row in rows]
+            committed = False
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.failed_rows.extend(failed)
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(rows) - len(failed)
+            self.stats["rows_failed"] += len(failed)
+            self.stats["flush_rows"].append(len(rows))
+            self.stats["flush_seconds"].append(elapsed)
+
+        log("product_write", f"Wrote {len(rows) - len(failed)}/{len(rows)} products of flyer {flyer_id} "
+                             f"in {elapsed:.2f}s")
+        for row, error in failed:
+            log("product_write", f"Failed product {row['product_id']} ({row['product_name']}): {error}", error=True,
+                step="row")
+        return FlushResult(committed, len(rows) - len(failed), failed)
+
+    def summary(self):
+        with self._lock:
+            flush_rows = self.stats["flush_rows"]
+            flush_seconds = self.stats["flush_seconds"]
+            return {
+                "rows_written": self.stats["rows_written"],
+                "rows_failed": self.stats["rows_failed"],
+                "flushes": self.stats["flushes"],
+                "batches": self.stats["batches"],
+                "avg_flush_rows": sum(flush_rows) / len(flush_rows) if flush_rows else 0,
+                "avg_flush_seconds": sum(flush_seconds) / len(flush_seconds) if flush_seconds else 0,
+                "max_flush_seconds": max(flush_seconds, default=0),
+            }
@@ -0,0 +1,138 @@
+from collections import deque
+import asyncio
+import threading
+import time
+
+from .instrumentation import log
+
+# Wait percentiles come from the most recent waits, the count, total and max from all of them
+MAX_WAIT_SAMPLES = 10000
+
+
+class RegionBucket:
+    """Token bucket for one region, tokens may go negative to hold reservations."""
+
+    def __init__(self, region, capacity, refill_per_second):
+        self.region = region
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def available_at(self, now):
+        """Earliest time this region can take one more call."""
+        token_at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.refill_per_second
+        return max(token_at, self.blocked_until)
+
+
+class RegionScheduler:
+    """
+    Hands out Vertex AI regions under a per-region calls/minute budget.
+
+    Each call reserves a slot in the region with the earliest available slot
+    and sleeps only until that slot, so callers from any thread or asyncio
+    task share the budget. Throttled or failing regions are blocked with an
+    exponential backoff that resets on the next success.
+    """
+
+    def __init__(self, regions, calls_per_minute=5, min_backoff=5.0, max_backoff=300.0):
+        self.buckets = {
+            region: RegionBucket(region, calls_per_minute, calls_per_minute / 60.0)
+            for region in regions
+        }
+        self.calls_per_minute = calls_per_minute
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._waits = deque(maxlen=MAX_WAIT_SAMPLES)
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+            bucket = min(self.buckets.values(), key=lambda b: b.available_at(now))
+            start_at = bucket.available_at(now)
+            bucket.tokens -= 1
+            bucket.calls += 1
+            wait = max(0.0, start_at - now)
+            self._waits.append(wait)
+            self._wait_count += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            return bucket.region, wait
+
+    def acquire(self):
+        """Blocks until a region has a free slot and returns that region."""
+        region, wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return region
+
+    async def acquire_async(self):
+        region, wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return region
+
+    def _back_off(self, region, counter):
+        with self._lock:
+            bucket = self.buckets[region]
+            bucket.backoff = min(max(bucket.backoff * 2, self.min_backoff), self.max_backoff)
+            bucket.blocked_until = time.monotonic() + bucket.backoff
+            setattr(bucket, counter, getattr(bucket, counter) + 1)
+            return bucket.backoff
+
+    def report_success(self, region):
+        with self._lock:
+            self.buckets[region].backoff = 0.0
+
+    def report_throttled(self, region):
+        backoff = self._back_off(region, "throttled")
+        log("vision_scheduler", f"Region {region} throttled, backing off {backoff:.0f}s", region=region)
+
+    def report_failure(self, region):
+        backoff = self._back_off(region, "failures")
+        log("vision_scheduler", f"Region {region} failed, backing off {backoff:.0f}s", region=region)
+
+    def metrics(self):
+        """Queue wait percentiles and per region utilization of the calls/minute budget."""
+        with self._lock:
+            elapsed_minutes = max((time.monotonic() - self._started_at) / 60.0, 1e-9)
+            waits = sorted(self._waits)
+            wait_count, wait_total, wait_max = self._wait_count, self._wait_total, self._wait_max
+            budget = self.calls_per_minute * elapsed_minutes
+            regions = {
+                bucket.region: {
+                    "calls": bucket.calls,
+                    "throttled": bucket.throttled,
+                    "failures": bucket.failures,
+                    "utilization": min(bucket.calls / budget, 1.0),
+                }
+                for bucket in self.buckets.values()
+            }
+
+        def percentile(p):
+            return waits[min(int(p * len(waits)), len(waits) - 1)] if waits else 0.0
+
+        return {
+            "requests": wait_count,
+            "queue_wait_total": wait_total,
+            "queue_wait_p50": percentile(0.5),
+            "queue_wait_p95": percentile(0.95),
+            "queue_wait_max": wait_max,
+            "regions": regions,
+        }
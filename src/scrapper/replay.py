@@ -0,0 +1,358 @@
+"""
+Records flipp.com API responses, rendered pages and item images into a
+fixture corpus, and serves the corpus from a local HTTP server so the
+scraper can run offline and reproducibly.
+
+Record (from the repository root, needs network; --pages also needs Chrome):
+    python -m src.scrapper.replay record --corpus fixtures/flipp --locations H8Y3P2 --max-flyers 3 --max-items 40
+
+Serve, then point the scraper at it:
+    python -m src.scrapper.replay serve --corpus fixtures/flipp --port 8765
+    FLIPP_SITE=http://127.0.0.1:8765 FLIPP_API_BASE=http://127.0.0.1:8765/api \\
+        python -m src.scrapper.flyer_scrapper --fetcher http --translator offline
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit, parse_qsl
+import argparse
+import hashlib
+import threading
+import json
+import time
+import os
+import re
+
+API_PREFIX = "/api"
+IMAGE_PREFIX = "/images/"
+# Stands in for the server address in recorded bodies, filled in when a body is served
+REPLAY_BASE = "__REPLAY_BASE__"
+
+SCRIPT_TAG = re.compile(r"<script\b.*?</script>", re.IGNORECASE | re.DOTALL)
+
+
+def request_key(path, query=None):
+    """Canonical "path?query" key, query parameters sorted so param order never misses the corpus."""
+    params = sorted(parse_qsl(query) if isinstance(query, str) else (query or {}).items())
+    return f"{path}?{urlencode(params)}" if params else path
+
+
+class Corpus:
+    """
+    A directory of recorded responses: manifest.json maps request keys to
+    bodies stored once by content hash under bodies/. The manifest also keeps
+    the recorded locations and optional vision answers keyed by image path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.entries = {}
+        self.meta = {"locations": [], "vision": {}}
+        self._lock = threading.Lock()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self.entries = manifest["entries"]
+            self.meta = {**self.meta, **manifest.get("meta", {})}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, key, body, content_type, status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        file_name = os.path.join("bodies", digest)
+        full_path = os.path.join(self.path, file_name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if not os.path.exists(full_path):
+            with open(full_path, "wb") as f:
+                f.write(body)
+        with self._lock:
+            self.entries[key] = {"file": file_name, "content_type": content_type, "status": status}
+
+    def lookup(self, path, query=None):
+        """The entry for a request; falls back to the path alone, so another postal code still gets the page."""
+        entry = self.entries.get(request_key(path, query))
+        if entry is None:
+            entry = next((e for key, e in self.entries.items() if key.split("?")[0] == path), None)
+        return entry
+
+    def read(self, entry):
+        with open(os.path.join(self.path, entry["file"]), "rb") as f:
+            return f.read()
+
+    def rewrite(self, replacements):
+        """Replaces recorded strings (e.g. live image URLs) in every text body with their replay stand-ins."""
+        for key, entry in list(self.entries.items()):
+            if not entry["content_type"].startswith(("text/", "application/json")):
+                continue
+            body = self.read(entry).decode("utf-8")
+            rewritten = body
+            for old, new in replacements.items():
+                rewritten = rewritten.replace(old, new)
+            if rewritten != body:
+                self.put(key, rewritten, entry["content_type"], entry["status"])
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            manifest = {"meta": self.meta, "entries": dict(sorted(self.entries.items()))}
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+
+class RecordingSession:
+    """Wraps the HttpFetcher's requests session and copies every successful API response into the corpus."""
+
+    def __init__(self, session, corpus, api_base):
+        self.session = session
+        self.corpus = corpus
+        self.api_base = api_base.rstrip("/")
+
+    def get(self, url, params=None, **kwargs):
+        response = self.session.get(url, params=params, **kwargs)
+        if response.status_code == 200 and url.startswith(self.api_base):
+            path = API_PREFIX + url[len(self.api_base):]
+            self.corpus.put(
+                request_key(path, params), response.content,
+                response.headers.get("Content-Type", "application/json").split(";")[0]
+            )
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class Recorder:
+    """Fills a corpus from the live site: API responses, rendered pages (optional) and item images."""
+
+    def __init__(self, corpus, fetcher, driver=None, settle_seconds=2.0):
+        self.corpus = corpus
+        self.fetcher = fetcher
+        self.driver = driver
+        self.settle_seconds = settle_seconds
+        self.image_urls = set()
+        fetcher.session = RecordingSession(fetcher.session, corpus, fetcher.api_base)
+
+    def record_page(self, url):
+        """Stores the rendered DOM without its scripts, so the replayed page stays as it was recorded."""
+        if self.driver is None:
+            return None
+        self.driver.get(url)
+        time.sleep(self.settle_seconds)
+        parts = urlsplit(url)
+        key = request_key(parts.path, parts.query)
+        self.corpus.put(key, SCRIPT_TAG.sub("", self.driver.page_source), "text/html")
+        return key
+
+    def _trim_json(self, key, field, keep_ids):
+        """Drops the listed records that weren't recorded, so a replay never asks for them."""
+        entry = self.corpus.entries.get(key)
+        if entry is None:
+            return
+        data = json.loads(self.corpus.read(entry))
+        records = data.get(field) if isinstance(data, dict) else data
+        records[:] = [record for record in records if str(record.get("id")) in keep_ids]
+        self.corpus.put(key, json.dumps(data), entry["content_type"])
+
+    def _trim_page(self, key, tag, attribute, keep_ids):
+        from bs4 import BeautifulSoup
+
+        entry = self.corpus.entries.get(key) if key else None
+        if entry is None:
+            return
+        soup = BeautifulSoup(self.corpus.read(entry), "html.parser")
+        for element in soup.find_all(tag):
+            if element.has_attr(attribute) and element[attribute] not in keep_ids:
+                element.decompose()
+        self.corpus.put(key, str(soup), entry["content_type"])
+
+    def record_location(self, location, max_flyers, max_items):
+        from .locations import homepage_url, flyer_url, item_url
+        from .fetchers import FLYERS_PATH, FLYER_PATH
+
+        homepage_key = self.record_page(homepage_url(location))
+        listings = (self.fetcher.get_flyer_listings(postal_code=location.postal_code, locale=location.locale)
+                    or [])[:max_flyers]
+        for listing in listings:
+            flyer_id = listing["flyer_id"]
+            flyer_key = self.record_page(flyer_url(location, flyer_id))
+            items = self.fetcher.get_flyer_items(flyer_id) or []
+            print(f"Recording flyer {flyer_id}: {min(len(items), max_items)} of {len(items)} items")
+            for item in items[:max_items]:
+                details = self.fetcher.get_item(item["itemid"])
+                if details and details["product_image_url"]:
+                    self.image_urls.add(details["product_image_url"])
+                self.record_page(item_url(location, item["itemid"]))
+
+            item_ids = {item["itemid"] for item in items[:max_items]}
+            flyer_params = {"locale": self.fetcher.locale, "postal_code": self.fetcher.postal_code}
+            self._trim_json(request_key(API_PREFIX + FLYER_PATH.format(flyer_id=flyer_id), flyer_params), "items", item_ids)
+            self._trim_page(flyer_key, "a", "itemid", item_ids)
+
+        flyer_ids = {str(listing["flyer_id"]) for listing in listings}
+        listing_params = {"locale": location.locale, "postal_code": location.postal_code}
+        self._trim_json(request_key(API_PREFIX + FLYERS_PATH, listing_params), "flyers", flyer_ids)
+        self._trim_page(homepage_key, "flipp-flyer-listing-item", "flyer-id", flyer_ids)
+        self.corpus.meta["locations"].append(f"{location.postal_code}:{location.city_slug}:{location.locale}")
+
+    def record_images(self):
+        """Downloads every item image once and points the recorded bodies at the replayed copy."""
+        replacements = {}
+        for url in sorted(self.image_urls):
+            response = self.fetcher.session.session.get(url, timeout=self.fetcher.timeout)
+            if response.status_code != 200:
+                print(f"Could not record image {url}: status {response.status_code}")
+                continue
+            extension = os.path.splitext(urlsplit(url).path)[1] or ".jpg"
+            path = f"{IMAGE_PREFIX}{hashlib.sha256(url.encode()).hexdigest()[:16]}{extension}"
+            self.corpus.put(path, response.content, response.headers.get("Content-Type", "image/jpeg"))
+            replacements[url] = REPLAY_BASE + path
+        self.corpus.rewrite(replacements)
+        return len(replacements)
+
+
+class ReplayServer:
+    """
+    Serves a corpus over HTTP on a background thread: the site under its
+    locale paths (/en-ca, ...), the API under /api and images under /images. `latency` delays
+    every response to mimic the network. Unrecorded requests get a 404 and
+    are counted in `stats["misses"]`.
+    """
+
+    def __init__(self, corpus, host="127.0.0.1", port=0, latency=0.0):
+        self.corpus = corpus
+        self.latency = latency
+        self.stats = {"hits": 0, "misses": 0, "bytes": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def site_url(self):
+        return self.base_url
+
+    @property
+    def api_base(self):
+        return f"{self.base_url}{API_PREFIX}"
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                entry = server.corpus.lookup(parts.path, parts.query)
+                if entry is None:
+                    server._count("misses")
+                    self.send_error(404, "Not recorded")
+                    return
+
+                body = server.corpus.read(entry)
+                if not entry["content_type"].startswith("image/"):
+                    body = body.replace(REPLAY_BASE.encode(), server.base_url.encode())
+                server._count("hits")
+                server._count("bytes", len(body))
+                self.send_response(entry["status"])
+                self.send_header("Content-Type", entry["content_type"])
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def vision_responses(corpus, base_url):
+    """The corpus' recorded vision answers keyed by served image URL, for fakes.MockVisionModel."""
+    return {base_url + path: answer for path, answer in corpus.meta["vision"].items()}
+
+
+def record(args):
+    from .fetchers import HttpFetcher
+    from .locations import load_locations
+
+    corpus = Corpus(args.corpus)
+    driver = None
+    if args.pages:
+        from .flyer_scrapper import setup_chrome_driver
+        driver = setup_chrome_driver()
+    recorder = Recorder(corpus, HttpFetcher(), driver)
+    try:
+        for location in load_locations(args.locations):
+            recorder.record_location(location, args.max_flyers, args.max_items)
+        images = recorder.record_images()
+    finally:
+        if driver is not None:
+            driver.quit()
+    corpus.save()
+    print(f"Recorded {len(corpus)} responses ({images} images) into {args.corpus}")
+
+
+def serve(args):
+    with ReplayServer(Corpus(args.corpus), args.host, args.port, args.latency) as server:
+        print(f"Replaying {args.corpus} on {server.base_url} (site {server.site_url}, api {server.api_base})")
+        try:
+            while True:
+                time.sleep(60)
+                print(f"Replay stats: {server.stats}")
+        except KeyboardInterrupt:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay flipp.com fixtures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("--corpus", required=True)
+    record_parser.add_argument("--locations", nargs="+", default=[])
+    record_parser.add_argument("--max-flyers", type=int, default=3)
+    record_parser.add_argument("--max-items", type=int, default=40)
+    record_parser.add_argument("--pages", action="store_true",
+                               help="Also record the rendered pages with Chrome, for the selenium backend")
+
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--corpus", required=True)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import random
+import time
+
+from .instrumentation import log
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff and a little jitter.
+
+    `policy.call(fn, *args)` runs fn up to `attempts` times, sleeping
+    base_delay, base_delay * backoff, ... (capped at max_delay) between tries,
+    and re-raises the last error once the attempts are used up.
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, backoff=2.0, max_delay=15.0, jitter=0.1):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        delay = min(self.base_delay * self.backoff ** attempt, self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def call(self, fn, *args, description=None, **kwargs):
+        for attempt in range(self.attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.attempts - 1:
+                    raise
+                delay = self.delay(attempt)
+                log("retry", f"Error {description or fn.__name__}: {e}. Retrying in {delay:.1f}s "
+                             f"({attempt + 1}/{self.attempts})...", call=fn.__name__)
+                time.sleep(delay)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -0,0 +1,162 @@
+from collections import Counter
+import threading
+import sqlite3
+import json
+import time
+import os
+
+RUN_JOURNAL_PATH = os.getenv("RUN_JOURNAL_PATH", os.path.join(".cache", "run_journal.sqlite3"))
+
+PENDING = "pending"
+# Resolved product row kept in the journal until the flyer's products are committed
+RESOLVED = "resolved"
+# Item page details kept in the journal while the image goes through vision
+IMAGE_QUEUED = "image_queued"
+DONE = "done"
+# Not a product (no price, rejected by vision): final, never retried
+SKIPPED = "skipped"
+FAILED = "failed"
+ITEM_STATES = [PENDING, RESOLVED, IMAGE_QUEUED, DONE, SKIPPED, FAILED]
+
+
+class RunJournal:
+    """
+    Local record of every flyer item's state so a restarted run picks up
+    where the last one stopped: done and skipped items are not scraped again,
+    resolved rows are written without scraping, queued images go straight
+    back to vision and failed items are retried until `max_attempts`.
+    """
+
+    def __init__(self, path=RUN_JOURNAL_PATH, max_attempts=3):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._run_started_at = time.time()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS item_state (
+                    flyer_id INTEGER NOT NULL,
+                    item_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    -- Failed attempts
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    payload TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (flyer_id, item_id)
+                )
+            """)
+            self._connection.commit()
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            self._connection.execute(query, params)
+            self._connection.commit()
+
+    def _set_state(self, flyer_id, item_id, state, payload=None, error=None, failed=False):
+        self._execute(
+            "UPDATE item_state SET state = ?, payload = ?, last_error = ?, attempts = attempts + ?, updated_at = ? "
+            "WHERE flyer_id = ? AND item_id = ?",
+            (state, json.dumps(payload) if payload is not None else None, error, int(failed),
+             time.time(), flyer_id, str(item_id))
+        )
+
+    def start_flyer(self, flyer_id, item_ids, stored_ids=()):
+        """Registers the flyer's items as pending and marks those already in the product table done."""
+        now = time.time()
+        stored_ids = {str(item_id) for item_id in stored_ids}
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO item_state (flyer_id, item_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(flyer_id, str(item_id), PENDING, now) for item_id in item_ids]
+            )
+            self._connection.executemany(
+                "UPDATE item_state SET state = ?, payload = NULL, updated_at = ? WHERE flyer_id = ? AND item_id = ?",
+                [(DONE, now, flyer_id, item_id) for item_id in stored_ids]
+            )
+            self._connection.commit()
+
+    def items_in_state(self, flyer_id, *states):
+        """Returns {item_id: payload} for the flyer's items in any of the states."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT item_id, payload FROM item_state WHERE flyer_id = ? "
+                f"AND state IN ({','.join('?' * len(states))})",
+                [flyer_id, *states]
+            ).fetchall()
+        return {item_id: json.loads(payload) if payload else None for item_id, payload in rows}
+
+    def items_to_process(self, flyer_id):
+        """Item ids that are pending or failed fewer than max_attempts times."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_id FROM item_state WHERE flyer_id = ? "
+                "AND (state = ? OR (state = ? AND attempts < ?))",
+                (flyer_id, PENDING, FAILED, self.max_attempts)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_resolved(self, flyer_id, item_id, row):
+        self._set_state(flyer_id, item_id, RESOLVED, payload=row)
+
+    def mark_image_queued(self, flyer_id, item_id, details):
+        self._set_state(flyer_id, item_id, IMAGE_QUEUED, payload=details)
+
+    def mark_skipped(self, flyer_id, item_id, reason):
+        self._set_state(flyer_id, item_id, SKIPPED, error=reason)
+
+    def mark_failed(self, flyer_id, item_id, error):
+        self._set_state(flyer_id, item_id, FAILED, error=error, failed=True)
+
+    def mark_flyer_committed(self, flyer_id, failed_ids=()):
+        """After the flyer's products committed: resolved rows are done, rows the database rejected failed."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "UPDATE item_state SET state = ?, payload = NULL, updated_at = ? WHERE flyer_id = ? AND state = ?",
+                (DONE, now, flyer_id, RESOLVED)
+            )
+            self._connection.executemany(
+                "UPDATE item_state SET state = ?, last_error = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE flyer_id = ? AND item_id = ?",
+                [(FAILED, error, now, flyer_id, str(item_id)) for item_id, error in failed_ids]
+            )
+            self._connection.commit()
+
+    def remaining(self, flyer_id):
+        """Number of items a later run would still work on."""
+        return len(self.items_to_process(flyer_id)) + len(self.items_in_state(flyer_id, RESOLVED, IMAGE_QUEUED))
+
+    def flyer_summary(self, flyer_id):
+        """Item counts per state, plus the retries and most common errors of this run."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, attempts, updated_at, last_error FROM item_state WHERE flyer_id = ?",
+                (flyer_id,)
+            ).fetchall()
+        states = Counter(state for state, _, _, _ in rows)
+        this_run = [row for row in rows if row[2] >= self._run_started_at]
+        summary = {state: states[state] for state in ITEM_STATES}
+        # Every failed attempt was retried, except the last one of an item still failed
+        summary["retries"] = sum(attempts - (state == FAILED) for state, attempts, _, _ in this_run)
+        summary["errors"] = Counter(error for state, _, _, error in this_run if state == FAILED).most_common(3)
+        return summary
+
+    def forget_flyers(self, keep_flyer_ids):
+        """Drops the items of flyers that are no longer worked on (retrieved or expired)."""
+        keep = [int(flyer_id) for flyer_id in keep_flyer_ids]
+        with self._lock:
+            self._connection.execute(
+                f"DELETE FROM item_state WHERE flyer_id NOT IN ({','.join('?' * len(keep))})" if keep
+                else "DELETE FROM item_state",
+                keep
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
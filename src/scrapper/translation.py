@@ -0,0 +1,231 @@
+from collections import OrderedDict
+import threading
+import sqlite3
+import time
+import os
+import re
+
+from .instrumentation import log
+
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", os.path.join(".cache", "translations.sqlite3"))
+TRANSLATOR_BACKENDS = ["google", "offline"]
+
+
+def normalize_source(text):
+    """Cache key for a source text: flyers vary case and spacing for the same product."""
+    return re.sub(r"\s+", " ", text.strip()).casefold()
+
+
+def format_english_name(text):
+    return " ".join(word.capitalize() for word in re.split(r"\s+", text.strip()))
+
+
+class GoogleTranslator:
+    """googletrans backend, one client for the whole run with list (batched) requests."""
+    name = "google"
+
+    def __init__(self, max_retries=3):
+        from googletrans import Translator
+        self.translator = Translator()
+        self.max_retries = max_retries
+
+    def translate_batch(self, texts, src, dest):
+        for attempt in range(self.max_retries):
+            try:
+                results = self.translator.translate(list(texts), src=src, dest=dest)
+                return [result.text for result in results]
+            except AttributeError:
+                log("translate", f"Translation of {len(texts)} names failed. "
+                                 f"Retrying ({attempt + 1}/{self.max_retries})...")
+            except Exception as e:
+                log("translate", f"Unexpected error during translation: {e}")
+        log("translate", f"Translation failed after {self.max_retries} attempts.", error=True)
+        return None
+
+
+class OfflineTranslator:
+    """
+    Network free stand-in that looks names up in a glossary and otherwise
+    returns them unchanged, for offline runs and tests.
+    """
+    name = "offline"
+
+    def __init__(self, glossary=None):
+        self.glossary = {normalize_source(k): v for k, v in (glossary or {}).items()}
+
+    def translate_batch(self, texts, src, dest):
+        return [self.glossary.get(normalize_source(text), text) for text in texts]
+
+
+class TranslationMemory:
+    """
+    On-disk translation memory keyed by normalized source text and the
+    backend that translated it, so the offline stand-in's answers are never
+    served to a run with a real translator.
+    """
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH, backend="google"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.backend = backend
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            # Replaces the "translation" table, whose rows don't say which backend made them
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS translation_memory (
+                    backend TEXT NOT NULL,
+                    source_key TEXT NOT NULL,
+                    src TEXT NOT NULL,
+                    dest TEXT NOT NULL,
+                    translated TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (backend, source_key, src, dest)
+                )
+            """)
+            self._connection.commit()
+
+    def get_many(self, keys, src, dest):
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            # Stay under SQLite's bound parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT source_key, translated FROM translation_memory "
+                    f"WHERE backend = ? AND src = ? AND dest = ? AND source_key IN ({placeholders})",
+                    [self.backend, src, dest, *chunk]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, translations, src, dest):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO translation_memory (backend, source_key, src, dest, translated, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.backend, key, src, dest, translated, now) for key, translated in translations.items()]
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class TranslationService:
+    """
+    In-process LRU in front of the translation memory, with cache misses sent
+    to the backend in batches.
+    """
+
+    def __init__(self, backend, memory=None, lru_size=10000, batch_size=50, src="fr", dest="en"):
+        self.backend = backend
+        self.memory = memory
+        self.lru_size = lru_size
+        self.batch_size = batch_size
+        self.src = src
+        self.dest = dest
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "disk_hits": 0, "misses": 0, "backend_batches": 0, "failures": 0}
+
+    def _remember(self, key, translated):
+        self._lru[key] = translated
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def translate_many(self, texts):
+        """Returns {text: english name} for every text, falling back to the source text on failure."""
+        texts = [text for text in dict.fromkeys(texts) if text]
+        keys = {text: normalize_source(text) for text in texts}
+        results = {}
+        pending = {}
+
+        with self._lock:
+            for text, key in keys.items():
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    results[text] = self._lru[key]
+                    self.stats["lru_hits"] += 1
+                else:
+                    pending.setdefault(key, text)
+
+        if pending and self.memory is not None:
+            stored = self.memory.get_many(pending, self.src, self.dest)
+            with self._lock:
+                for key, translated in stored.items():
+                    self._remember(key, translated)
+                    self.stats["disk_hits"] += 1
+                    del pending[key]
+
+        pending_keys = list(pending)
+        for i in range(0, len(pending_keys), self.batch_size):
+            batch = pending_keys[i:i + self.batch_size]
+            translated = self.backend.translate_batch([pending[key] for key in batch], self.src, self.dest)
+            with self._lock:
+                self.stats["backend_batches"] += 1
+                self.stats["misses"] += len(batch)
+                if translated is None:
+                    self.stats["failures"] += len(batch)
+                    continue
+                new_entries = {key: format_english_name(text) for key, text in zip(batch, translated)}
+                for key, text in new_entries.items():
+                    self._remember(key, text)
+            # A name handed back unchanged may be a silent failure, only real translations are kept across runs
+            translations = {key: text for key, text in new_entries.items() if normalize_source(text) != key}
+            if self.memory is not None and translations:
+                self.memory.put_many(translations, self.src, self.dest)
+
+        with self._lock:
+            for text, key in keys.items():
+                if text not in results:
+                    results[text] = self._lru.get(key, text)
+        return results
+
+    def translate(self, text):
+        return self.translate_many([text]).get(text, text)
+
+    def prefetch(self, texts):
+        """Warms the caches for a whole flyer so item workers only hit the LRU."""
+        self.translate_many(texts)
+
+    def close(self):
+        if self.memory is not None:
+            self.memory.close()
+
+
+def create_translation_service(backend=None, cache_path=TRANSLATION_CACHE_PATH):
+    backend = backend or os.getenv("TRANSLATOR", "google")
+    if backend == "google":
+        translator = GoogleTranslator()
+    elif backend == "offline":
+        translator = OfflineTranslator()
+    else:
+        raise ValueError(f"Unknown translator backend: {backend}")
+
+    memory = TranslationMemory(cache_path, backend=translator.name) if cache_path else None
+    return TranslationService(translator, memory=memory)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_translation_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = create_translation_service()
+        return _service
+
+
+def set_translation_service(service):
+    global _service
+    with _service_lock:
+        _service = service
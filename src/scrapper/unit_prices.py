@@ -0,0 +1,119 @@
+"""
+Turns the (price, unit) pairs stored for products into comparable prices
+per kg, per litre or per item.
+
+Backfill products scraped before unit prices were stored (from the repository root):
+    python -m src.scrapper.unit_prices
+"""
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+from .normalize import strip_accents, singular
+
+# Size of one unit in the base unit it is compared in
+UNIT_SIZES = {
+    "kg": ("kg", 1.0), "kilo": ("kg", 1.0), "kilogram": ("kg", 1.0),
+    "g": ("kg", 0.001), "gram": ("kg", 0.001), "gr": ("kg", 0.001),
+    "lb": ("kg", 0.45359237), "lbs": ("kg", 0.45359237), "pound": ("kg", 0.45359237),
+    "oz": ("kg", 0.028349523),
+    "l": ("l", 1.0), "litre": ("l", 1.0), "liter": ("l", 1.0),
+    "ml": ("l", 0.001),
+    "each": ("each", 1.0), "ea": ("each", 1.0), "unit": ("each", 1.0), "pk": ("each", 1.0), "pack": ("each", 1.0),
+}
+
+# "2/$5", "2 for $5.00", "3 / 10": a multi-buy price, count then total
+MULTI_BUY = re.compile(r"^\s*(\d+)\s*(?:/|for)\s*\$?\s*(\d+(?:[.,]\d+)?)\s*$", re.IGNORECASE)
+# "2/", "2 for", "2/$": the count left in the unit text when the total is the price
+MULTI_BUY_PREFIX = re.compile(r"^\s*(\d+)\s*(?:/|for)\s*\$?\s*(.*)$", re.IGNORECASE)
+AMOUNT = re.compile(r"^\s*\$?\s*(\d+(?:[.,]\d+)?)\s*\$?\s*$")
+UNIT = re.compile(r"^\s*(?:\$\s*)?(?:/|per\s)?\s*(\d+(?:\.\d+)?)?\s*([a-z]+)\.?\s*$")
+
+NormalizedPrice = namedtuple("NormalizedPrice", ["unit_price", "base_unit"])
+UNKNOWN = NormalizedPrice(None, None)
+
+
+def parse_price(price):
+    """
+    Returns (total price, item count) for a stored price: a number, "4.99",
+    "$4.99" or a multi-buy like "2/$5" or "2 for $5". (None, None) otherwise.
+    """
+    if price is None:
+        return None, None
+    if isinstance(price, (int, float)) or hasattr(price, "as_integer_ratio"):
+        return float(price), 1
+
+    text = str(price)
+    match = MULTI_BUY.match(text)
+    if match:
+        return float(match.group(2).replace(",", ".")), int(match.group(1))
+    match = AMOUNT.match(text)
+    if match:
+        return float(match.group(1).replace(",", ".")), 1
+    return None, None
+
+
+@lru_cache(maxsize=4096)
+def parse_unit(unit):
+    """
+    Parses a stored unit ("/lb", "per lb", "each", "ea.", "2 units", "1.5 kg",
+    "/100 g", "2/", "2 for") into (base unit, quantity in it), e.g. "2 lbs" -> ("kg", 0.907).
+    Unknown units give (None, None).
+    """
+    text = strip_accents(unit or "each").lower().replace(",", ".")
+    count = 1
+    match = MULTI_BUY_PREFIX.match(text)
+    if match:
+        count = int(match.group(1))
+        text = match.group(2) or "each"
+
+    match = UNIT.match(text)
+    if not match:
+        return None, None
+    quantity, name = match.groups()
+    base = UNIT_SIZES.get(name) or UNIT_SIZES.get(singular(name))
+    if base is None:
+        return None, None
+    base_unit, size = base
+    return base_unit, count * float(quantity or 1) * size
+
+
+def normalize_price(price, unit):
+    """Price per kg, litre or item as a NormalizedPrice, UNKNOWN when the pair can't be compared."""
+    total, count = parse_price(price)
+    base_unit, quantity = parse_unit(unit)
+    if total is None or not quantity:
+        return UNKNOWN
+    return NormalizedPrice(round(total / (count * quantity), 4), base_unit)
+
+
+def normalize_prices(rows):
+    """
+    Adds "unit_price" and "base_unit" to every row of a flyer in one pass.
+    A flyer repeats a handful of unit strings, each is parsed once.
+    """
+    for row in rows:
+        row["unit_price"], row["base_unit"] = normalize_price(row["price"], row["unit"])
+    return rows
+
+
+def backfill(engine, table="product", batch_size=1000):
+    from .database import get_products_without_unit_price, update_unit_prices
+
+    last_id = None
+    updated = 0
+    while True:
+        rows = get_products_without_unit_price(table, engine, after_id=last_id, limit=batch_size)
+        if not rows:
+            break
+        rows = normalize_prices([dict(row._mapping) for row in rows])
+        last_id = rows[-1]["product_id"]
+        parsed = [row for row in rows if row["base_unit"] is not None]
+        update_unit_prices(parsed, table, engine)
+        updated += len(parsed)
+    print(f"Normalized unit prices of {updated} products")
+
+
+if __name__ == "__main__":
+    from .database import get_sql_engine_from_env
+    backfill(get_sql_engine_from_env())
@@ -1,67 +1,88 @@
-from google.cloud import storage
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
-import requests
 import io
-from collections import deque
-from datetime import timedelta, datetime
-import time
+import json
+import re
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from .image_store import get_image_store
+from .image_filter import get_image_prefilter
+from .instrumentation import count, log, observe, timer
+from .rate_limiter import RegionScheduler
+from .fakes import FakePart, MockVisionModel
 
 load_dotenv()
 
 PROJECT_ID = os.getenv("PROJECT_ID")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 
-storage_client = storage.Client(project=PROJECT_ID)
+# "inline" sends image bytes with the request, "gcs" uploads each image to its own blob
+IMAGE_TRANSPORT = os.getenv("VISION_IMAGE_TRANSPORT", "inline")
 
 regions = ["us-central1", "us-east4", "us-west1", "us-west4", "northamerica-northeast1", "europe-west1", "europe-west2", "europe-west3",
            "europe-west4", "europe-west9", "asia-northeast1", "asia-northeast3", "asia-southeast1"]
 region_call_limit = 5  # 5 calls per minute per region
 
-# Tracking calls per region with timestamps
-call_counters = {region: deque(maxlen=region_call_limit) for region in regions}
-current_region_index = 0
+MODEL_NAME = "gemini-1.5-flash-001"
+# Bump whenever the prompts change so cached vision results from the old prompts are ignored
+PROMPT_VERSION = "structured-json-v1"
+
+ITEM_PROMPT = "Look at this flyer image. is_item is true only if it shows a product with a dollar price, "\
+              "a percentage only doesn't count. If it is an item, give its name in less than 5 words, "\
+              "its price as a number without the dollar sign, and its quantity by weight (# lbs, # kg), "\
+              "count (2 units, 3 units, ...) or each, with a space between number and unit. "\
+              "Otherwise set name, price and unit to null."
 
-def switch_region():
-    global current_region_index
-    current_region_index = (current_region_index + 1) % len(regions)
-    print(f"Switching region from {regions[(current_region_index - 1) % len(regions)]} to {regions[current_region_index]}")
-    return regions[current_region_index]
+ITEM_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_item": {"type": "boolean"},
+        "name": {"type": "string", "nullable": True},
+        "price": {"type": "number", "nullable": True},
+        "unit": {"type": "string", "nullable": True},
+    },
+    "required": ["is_item", "name", "price", "unit"],
+}
 
+# Shared by every thread and asyncio task making vision calls
+scheduler = RegionScheduler(regions, calls_per_minute=region_call_limit)
 
-def can_make_call(region):
-    """Check if we can make an API call in the specified region."""
-    one_minute_ago = datetime.now() - timedelta(minutes=1)
-    # Remove outdated timestamps (older than 1 minute)
-    while call_counters[region] and call_counters[region][0] < one_minute_ago:
-        call_counters[region].popleft()
+
+def is_throttling_error(error):
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)
     
-    return len(call_counters[region]) < region_call_limit
+
+def download_image(image_url):
+    """The image's bytes as a zero-copy view from the shared image store. Raises ImageFetchError."""
+    return get_image_store().get(image_url).view
 
 
-def record_call(region):
-    """Record an API call timestamp for the specified region."""
-    call_counters[region].append(datetime.now())
+storage_client = None
+_storage_lock = threading.Lock()
 
 
-def reset_call_counters():
-    global call_counters
-    call_counters = {region: 0 for region in regions}
-    
+def get_storage_client():
+    global storage_client
+    with _storage_lock:
+        if storage_client is None:
+            from google.cloud import storage
 
-def download_image(image_url):
-    """Downloads an image from a URL."""
-    response = requests.get(image_url, stream=True)
-    if response.status_code == 200:
-        image_stream = io.BytesIO(response.content)
-        return image_stream
+            storage_client = storage.Client(project=PROJECT_ID)
+        return storage_client
+
+
+def use_storage_client(client):
+    """Swaps the storage client, e.g. for a fakes.FakeStorageClient."""
+    global storage_client
+    with _storage_lock:
+        storage_client = client
 
 
 def create_blob(bucket_name, blob_name):
     """Creates a blob in the specified bucket."""
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_storage_client().bucket(bucket_name)
     blob = bucket.blob(blob_name)
     return blob
 
@@ -77,76 +98,249 @@ def delete_from_gcs(blob):
     blob.delete()
 
 
-def generate_response(image_url, prompt):
+class BlobJanitor:
+    """Collects uploaded vision blobs and deletes them in batches instead of one call per image."""
+
+    def __init__(self, batch_size=50):
+        self.batch_size = batch_size
+        self._blobs = []
+        self._lock = threading.Lock()
+
+    def add(self, blob):
+        with self._lock:
+            self._blobs.append(blob)
+            if len(self._blobs) < self.batch_size:
+                return
+            blobs, self._blobs = self._blobs, []
+        self._delete(blobs)
+
+    def flush(self):
+        with self._lock:
+            blobs, self._blobs = self._blobs, []
+        self._delete(blobs)
+
+    def _delete(self, blobs):
+        if not blobs:
+            return
+        try:
+            blobs[0].bucket.delete_blobs(blobs, on_error=lambda blob: None)
+        except Exception as e:
+            log("vision", f"Error deleting {len(blobs)} vision blobs: {e}", error=True, step="cleanup")
+
+
+blob_janitor = BlobJanitor()
+mock_model = MockVisionModel() if os.getenv("VISION_BACKEND") == "mock" else None
+
+
+def use_mock_model(model):
+    """Routes every vision call to a mock model (None goes back to Vertex AI)."""
+    global mock_model
+    mock_model = model
+
+
+models = {}
+_model_lock = threading.Lock()
+
+
+def get_model(region):
     """
-    Uploads an image to Google Cloud Storage, processes it using Vertex AI,
-    and deletes the image from GCS after processing.
+    One GenerativeModel per region; vertexai.init sets a process-wide location,
+    so build them under a lock. The SDK takes over a second to import, runs
+    that never send an image to the model don't pay for it.
     """
-    global current_region_index
-    
-    while not can_make_call(regions[current_region_index]):
-        print(f"Region {regions[current_region_index]} reached API call limit. Switching region...")
-        switch_region()
-        
-    region = regions[current_region_index]
-        
-    try:        
-        image_stream = download_image(image_url)
-        blob_name = "temp_image.jpg"
-        blob = create_blob(BUCKET_NAME, blob_name)
-        
-        gcs_uri = upload_to_gcs(blob, image_stream)
-        
-        vertexai.init(project=PROJECT_ID, location=region)
-        model = GenerativeModel("gemini-1.5-flash-001")
+    with _model_lock:
+        if region not in models:
+            import vertexai
+            from vertexai.generative_models import GenerativeModel
+
+            vertexai.init(project=PROJECT_ID, location=region)
+            models[region] = GenerativeModel(MODEL_NAME)
+        return models[region]
+
+
+def make_image_part(image_url, image_bytes):
+    """
+    Returns (part, blob). Inline transport sends the bytes with the request;
+    gcs transport uploads to a blob name unique to this request, which the
+    caller hands to the janitor once the model has answered.
+    """
+    if IMAGE_TRANSPORT == "gcs":
+        blob = create_blob(BUCKET_NAME, f"vision/{uuid.uuid4().hex}.jpg")
+        gcs_uri = upload_to_gcs(blob, io.BytesIO(image_bytes or b""))
+        if mock_model is not None:
+            return FakePart(image_url, data=image_bytes, uri=gcs_uri), blob
+        from vertexai.generative_models import Part
+
+        return Part.from_uri(gcs_uri, mime_type="image/jpeg"), blob
+
+    if mock_model is not None:
+        return FakePart(image_url, data=image_bytes), None
+    from vertexai.generative_models import Part
+
+    # The SDK wants bytes, the one copy of a cached image's view is made here
+    return Part.from_data(data=bytes(image_bytes), mime_type="image/jpeg"), None
+
+
+def generate_response(image_url, prompt, image_bytes=None, generation_config=None):
+    """
+    Sends an image and a prompt to Gemini in the region with the earliest free
+    slot. Pass image_bytes to reuse an image that was already downloaded.
+    Safe to call from many threads at once: no GCS object is shared.
+    """
+    start = time.perf_counter()
+    region = scheduler.acquire()
+    observe("vision_queue_wait", time.perf_counter() - start, region=region)
+    blob = None
         
-        response = model.generate_content(
-            [
-                Part.from_uri(gcs_uri, mime_type="image/jpeg"),
-                prompt,
-            ]
-        )
+    try:
+        # The mock model answers by URL, so offline runs skip the download
+        if image_bytes is None and mock_model is None:
+            image_bytes = download_image(image_url)
+
+        image_part, blob = make_image_part(image_url, image_bytes)
+        model = mock_model if mock_model is not None else get_model(region)
         
-        record_call(region)
-        print(f"API call count for {region} in the last minute: {len(call_counters[region])}")
+        with timer("vision_model", region=region):
+            response = model.generate_content(
+                [
+                    image_part,
+                    prompt,
+                ],
+                generation_config=generation_config
+            )
         
+        scheduler.report_success(region)
         return response.text
 
     except Exception as e:
-        print(f"An error occurred when processing image: {e}")
+        log("vision", f"An error occurred when processing image in {region}: {e}", error=True, region=region)
+        if is_throttling_error(e):
+            count("vision_throttled", region=region)
+            scheduler.report_throttled(region)
+        else:
+            scheduler.report_failure(region)
         return None
 
     finally:
-        delete_from_gcs(blob)
-        
-        if all(not can_make_call(region) for region in regions):
-            print("All regions reached limit. Waiting to reset counters...")
-            time.sleep(60)  # Wait for 60 seconds before retrying
-        
+        if blob is not None:
+            blob_janitor.add(blob)
 
 
-def is_valid_item(image_url):
-    is_valid_prompt = "Is this a flyer item with a price. Seeing a percentage only doesn't count, you need to see a dollar amount. Answer yes or no in lowercase without punctuation"
-    is_valid_item = generate_response(image_url, is_valid_prompt)
-    print(f"Is valid item: {is_valid_item}")
-    
-    if is_valid_item.strip() == "yes":
-        return True
-    else:
-        print("This is not a valid item")
-        return False
-
-
-def get_flyer_image_infos(image_url):
-    if is_valid_item(image_url):
-        prompt ="Tell me the name of the item in less than 5 words. What is the price of the item (no dollar sign, just a float)? "\
-                "Directly tell me the answer, without saying the item is or the price is. "\
-                "Tell me the quantity of the item by weight (#lbs, #kg), quantity (2 units, 3 units, ...), each, etc). Please put a space between number and symbols"\
-                "Separate the answers with a comma."
-        response = generate_response(image_url, prompt)
-        item_name, price, unit = response.split(',')
-        return item_name.strip(), price.strip(), unit.strip()
-    else:
+def parse_item_response(text):
+    """
+    Validates the model's JSON answer against ITEM_RESPONSE_SCHEMA and returns
+    {"is_item", "name", "price", "unit"}. Raises ValueError on anything else.
+    """
+    # Some models still wrap JSON in a markdown fence
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {text!r}")
+
+    missing = [key for key in ITEM_RESPONSE_SCHEMA["required"] if key not in data]
+    if missing:
+        raise ValueError(f"Missing keys {missing} in {text!r}")
+    if not isinstance(data["is_item"], bool):
+        raise ValueError(f"is_item is not a boolean in {text!r}")
+    if not data["is_item"]:
+        return {"is_item": False, "name": None, "price": None, "unit": None}
+
+    name, price, unit = data["name"], data["price"], data["unit"]
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError(f"Item without a name in {text!r}")
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        raise ValueError(f"Item price is not a number in {text!r}")
+    if price <= 0:
+        raise ValueError(f"Item price is not positive in {text!r}")
+
+    return {
+        "is_item": True,
+        "name": name.strip(),
+        "price": str(price),
+        "unit": unit.strip() if isinstance(unit, str) and unit.strip() else "each",
+    }
+
+
+_generation_config = None
+
+
+def get_item_generation_config():
+    """The JSON schema config of item prompts, built once. None for the mock model, which needs no SDK."""
+    global _generation_config
+    if mock_model is not None:
+        return None
+    if _generation_config is None:
+        from vertexai.generative_models import GenerationConfig
+
+        _generation_config = GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=ITEM_RESPONSE_SCHEMA
+        )
+    return _generation_config
+
+
+def extract_image_infos(image_url, image_bytes=None):
+    """Asks the model about an image in one call, returns {"is_item", "name", "price", "unit"}."""
+    response = generate_response(image_url, ITEM_PROMPT, image_bytes, get_item_generation_config())
+    if response is None:
+        raise RuntimeError(f"No answer from the model for {image_url}")
+
+    result = parse_item_response(response)
+    log("vision", f"Vision result for {image_url}: {result}")
+    return result
+
+
+def classify_image(image_url, cache=None):
+    """
+    {"is_item", "name", "price", "unit"} for an image that isn't cached by URL.
+    The prefilter sees the image before the model does: enforced rejections
+    never reach the model (nor the cache), shadow verdicts are compared with
+    the model's answer.
+    """
+    prefilter = get_image_prefilter()
+    if cache is None and not prefilter.active:
+        return extract_image_infos(image_url)
+
+    # The store already hashed the image on its way to disk
+    image = get_image_store().get(image_url)
+    result = cache.get_by_hash(image.sha256, PROMPT_VERSION, MODEL_NAME) if cache is not None else None
+    if result is None:
+        verdict = prefilter.check(image) if prefilter.active else None
+        if verdict is not None and verdict.reject and prefilter.enforcing:
+            log("prefilter", f"Prefilter rejected {image_url} ({verdict.not_item_probability:.2f} not an item)")
+            return {"is_item": False, "name": None, "price": None, "unit": None}
+        result = extract_image_infos(image_url, image.view)
+        if verdict is not None:
+            prefilter.record(image, verdict, result["is_item"])
+    if cache is not None:
+        # Stored on hash hits too, so the next run finds this URL without downloading
+        cache.put(image.sha256, image_url, PROMPT_VERSION, MODEL_NAME, result)
+    return result
+
+
+def get_flyer_image_infos(image_url, cache=None):
+    """
+    Returns (name, price, unit) for an image only item, or (None, None, None)
+    when the image is not a flyer item. With a VisionResultCache, known images
+    skip the download, the upload and the model call.
+    """
+    result = cache.get_by_url(image_url, PROMPT_VERSION, MODEL_NAME) if cache is not None else None
+    if result is None:
+        result = classify_image(image_url, cache)
+
+    if not result["is_item"]:
         return None, None, None
+    return result["name"], result["price"], result["unit"]
 
-    
+
+def create_vision_executor(max_workers=None):
+    """
+    Bounded pool for image only items. The default size is one worker per
+    call slot across all regions, enough to keep every region's budget busy.
+    """
+    return ThreadPoolExecutor(
+        max_workers=max_workers or len(regions) * region_call_limit,
+        thread_name_prefix="vision"
+    )
@@ -0,0 +1,63 @@
+import threading
+import hashlib
+import os
+
+from .database import (
+    get_vision_result,
+    insert_vision_result,
+    delete_expired_vision_results,
+    get_vision_cache_stats,
+)
+
+VISION_CACHE_TTL_DAYS = int(os.getenv("VISION_CACHE_TTL_DAYS", "90"))
+
+
+def hash_image(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class VisionResultCache:
+    """
+    Database backed cache of vision results keyed by (image hash, prompt version, model).
+
+    A known image URL is looked up before downloading anything; a new URL is
+    downloaded once and looked up by content hash before any upload or model call.
+    """
+
+    def __init__(self, engine, table="vision_result_cache", ttl_days=VISION_CACHE_TTL_DAYS):
+        self.engine = engine
+        self.table = table
+        self.ttl_days = ttl_days
+        self._lock = threading.Lock()
+        self.stats = {"url_hits": 0, "hash_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_by_url(self, image_url, prompt_version, model):
+        result = get_vision_result(
+            prompt_version, model, self.ttl_days, table=self.table, engine=self.engine, image_url=image_url
+        )
+        if result is not None:
+            self._count("url_hits")
+        return result
+
+    def get_by_hash(self, image_hash, prompt_version, model):
+        result = get_vision_result(
+            prompt_version, model, self.ttl_days, table=self.table, engine=self.engine, image_hash=image_hash
+        )
+        self._count("hash_hits" if result is not None else "misses")
+        return result
+
+    def put(self, image_hash, image_url, prompt_version, model, result):
+        insert_vision_result(
+            image_hash, image_url, prompt_version, model, result, table=self.table, engine=self.engine
+        )
+        self._count("stores")
+
+    def purge_expired(self):
+        delete_expired_vision_results(self.ttl_days, table=self.table, engine=self.engine)
+
+    def summary(self):
+        return {**self.stats, "entries": get_vision_cache_stats(table=self.table, engine=self.engine)}